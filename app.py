@@ -3,10 +3,18 @@ import configparser
 import os
 
 import aws_cdk as cdk
-import boto3
 import cdk_nag
 
+from cdk_pipelines_multi_branch.cicd.aspects.aspect_dispatcher import AspectDispatcher
+from cdk_pipelines_multi_branch.cicd.aspects.incremental_nag import IncrementalNagAspect
+from cdk_pipelines_multi_branch.cicd.branch_selection import select_branches
 from cdk_pipelines_multi_branch.cicd.cdk_pipelines_multi_branch_stack import CdkPipelinesMultiBranchStack
+from cdk_pipelines_multi_branch.cicd.code.build_cache import BuildCacheSettings
+from cdk_pipelines_multi_branch.cicd.code.compute_sizing import SizingPolicy
+from cdk_pipelines_multi_branch.cicd.default_branch_resolver import DefaultBranchResolver
+from cdk_pipelines_multi_branch.cicd.lambda_code import LambdaSettings
+from cdk_pipelines_multi_branch.cicd.waves import load_waves
+from cdk_pipelines_multi_branch.src.application_stage import MainStage
 
 app = cdk.App()
 
@@ -16,35 +24,89 @@ global_config.read('config.ini')
 region = global_config.get('general', 'region')
 codebuild_prefix = global_config.get('general', 'codebuild_project_name_prefix')
 repository_name = global_config.get('general', 'repository_name')
-current_branch = os.environ['BRANCH']
 
-# retrieve the default branch by the CodeCommit repository
-codecommit_client = boto3.client('codecommit', region_name=region)
-repository = codecommit_client.get_repository(
-    repositoryName=repository_name
-)
-default_branch = repository['repositoryMetadata']['defaultBranch']
+# cdk-nag: full (every synth), incremental (unchanged stacks reuse cached findings) or off
+NAG_MODES = ('full', 'incremental', 'off')
+nag_mode = os.environ.get('NAG_MODE') or global_config.get('nag', 'mode', fallback='full')
+if nag_mode not in NAG_MODES:
+    raise ValueError(f'Unknown cdk-nag mode {nag_mode}, expected one of {", ".join(NAG_MODES)}')
 
-config = {
+# executions of the shared feature pipeline synthesize only the DEV stage of their branch, no pipeline stack
+feature_deploy = os.environ.get('FEATURE_DEPLOY', 'false').lower() == 'true'
+
+# one pipeline stack per selected branch, by default only the BRANCH environment variable
+branches = [] if feature_deploy else select_branches(app, repository_name, region)
+
+# retrieve the default branch (override, local cache or the CodeCommit repository)
+default_branch = DefaultBranchResolver.from_config(global_config).resolve()
+
+base_config = {
     'dev_account_id': os.environ['DEV_ACCOUNT_ID'],
-    'branch': current_branch,
     'default_branch': default_branch,
     'region': region,
     'codebuild_prefix': codebuild_prefix,
-    'repository_name': repository_name
+    'repository_name': repository_name,
+    'build_cache': BuildCacheSettings.from_config(global_config),
+    'compute_sizing': SizingPolicy.from_config(global_config),
+    'lambda': LambdaSettings.from_config(global_config),
+    'shared_projects': global_config.getboolean('branch_builds', 'shared_projects', fallback=False),
+    'artifact_format': global_config.get('branch_builds', 'artifact_format', fallback='bundle'),
+    'pipeline_triggers': {
+        'mode': global_config.get('pipeline_triggers', 'mode', fallback='poll'),
+        **{key: global_config.get('pipeline_triggers', key, fallback='') for key in (
+            'default_branch_include', 'default_branch_exclude', 'feature_branch_include', 'feature_branch_exclude')}
+    },
+    'fast_path': global_config.getboolean('fast_path', 'enabled', fallback=False),
+    'feature_pipeline': global_config.get('feature_pipeline', 'mode', fallback='per_branch'),
+    's3_trigger_batch_size': global_config.getint('application', 's3_trigger_batch_size', fallback=0),
+    'reaper': {
+        'enabled': global_config.getboolean('reaper', 'enabled', fallback=False),
+        'interval_hours': global_config.getint('reaper', 'interval_hours', fallback=24),
+        'idle_days': global_config.getint('reaper', 'idle_days', fallback=0),
+        'max_concurrency': global_config.getint('reaper', 'max_concurrency', fallback=5),
+        'dry_run': global_config.getboolean('reaper', 'dry_run', fallback=True)
+    },
+    'metrics': {
+        'dashboard': global_config.getboolean('metrics', 'dashboard', fallback=True),
+        'provisioning_latency_minutes': global_config.getint('metrics', 'provisioning_latency_minutes', fallback=30),
+        'teardown_latency_minutes': global_config.getint('metrics', 'teardown_latency_minutes', fallback=30),
+        'failure_rate_percent': global_config.getfloat('metrics', 'failure_rate_percent', fallback=10)
+    },
+    'branch_events': {
+        'batch_size': global_config.getint('branch_events', 'batch_size', fallback=10),
+        'max_concurrency': global_config.getint('branch_events', 'max_concurrency', fallback=4)
+    }
 }
 
-# Only the default branch resources will be deployed to the production environment.
-if current_branch == default_branch:
-    config['prod_account_id'] = os.environ['PROD_ACCOUNT_ID']
+for current_branch in branches:
+    config = dict(base_config, branch=current_branch)
 
-CdkPipelinesMultiBranchStack(
-    app,
-    f"cdk-pipelines-multi-branch-{current_branch}",
-    config,
-    env=cdk.Environment(account=config['dev_account_id'], region=region)
-)
+    # Only the default branch resources will be deployed to the production environment.
+    if current_branch == default_branch:
+        config['prod_account_id'] = os.environ['PROD_ACCOUNT_ID']
+        config['waves'] = load_waves(global_config)
 
-cdk.Aspects.of(app).add(cdk_nag.AwsSolutionsChecks())
+    CdkPipelinesMultiBranchStack(
+        app,
+        f"cdk-pipelines-multi-branch-{current_branch}",
+        config,
+        env=cdk.Environment(account=config['dev_account_id'], region=region)
+    )
+
+if feature_deploy:
+    MainStage(app, 'DEV', os.environ['BRANCH'], base_config['s3_trigger_batch_size'],
+              env=cdk.Environment(account=base_config['dev_account_id'], region=region))
+
+incremental_nag = None
+if nag_mode == 'full':
+    # the pack is implemented in JavaScript, the CDK visits it without calling into Python
+    cdk.Aspects.of(app).add(cdk_nag.AwsSolutionsChecks())
+elif nag_mode == 'incremental':
+    # Python aspects share the single visit of the dispatcher per construct
+    incremental_nag = IncrementalNagAspect(cdk_nag.AwsSolutionsChecks())
+    AspectDispatcher.of(app).add(incremental_nag)
 
 app.synth()
+
+if incremental_nag:
+    incremental_nag.save()
@@ -0,0 +1,106 @@
+"""
+Measures the aspect traversal cost of an app against its construct count, with the policies added as
+separate Python aspects compared to handlers of one AspectDispatcher.
+
+Every app has --stacks stacks of buckets, queues and KMS keys, one policy per resource type and a
+catch-all policy. The time of a synth without policies is subtracted, so the columns are the cost of
+the aspects alone. Runs in-process, without AWS calls.
+
+    python benchmarks/aspect_traversal.py --constructs 500 2000 8000 --runs 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import aws_cdk as cdk
+import aws_cdk.aws_kms as kms
+import aws_cdk.aws_s3 as s3
+import aws_cdk.aws_sqs as sqs
+import jsii
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdk_pipelines_multi_branch.cicd.aspects.aspect_dispatcher import AspectDispatcher  # noqa: E402
+
+RESOURCE_TYPES = (s3.CfnBucket, sqs.CfnQueue, kms.CfnKey)
+
+
+@jsii.implements(cdk.IAspect)
+class TypePolicy:
+
+    def __init__(self, node_type) -> None:
+        self.node_type = node_type
+        self.matched = 0
+
+    def visit(self, node) -> None:
+        if isinstance(node, self.node_type):
+            self.matched += 1
+
+
+@jsii.implements(cdk.IAspect)
+class CatchAllPolicy:
+
+    def __init__(self) -> None:
+        self.visited = 0
+
+    def visit(self, node) -> None:
+        self.visited += 1
+
+
+def build_app(out_dir: str, constructs: int, stacks: int):
+    app = cdk.App(outdir=out_dir)
+    per_stack = max(1, constructs // stacks)
+    for s in range(stacks):
+        stack = cdk.Stack(app, f'Stack{s}')
+        for i in range(per_stack):
+            resource_type = RESOURCE_TYPES[i % len(RESOURCE_TYPES)]
+            resource_type(stack, f'Resource{i}')
+    return app
+
+
+def synth(mode: str, constructs: int, stacks: int) -> tuple:
+    """Synthesizes an app with the policies added in mode, returns (seconds, visits of the dispatcher)"""
+    with tempfile.TemporaryDirectory() as out_dir:
+        app = build_app(out_dir, constructs, stacks)
+        policies = [TypePolicy(t) for t in RESOURCE_TYPES] + [CatchAllPolicy()]
+        dispatcher = None
+        if mode == 'aspects':
+            for policy in policies:
+                cdk.Aspects.of(app).add(policy)
+        elif mode == 'dispatcher':
+            dispatcher = AspectDispatcher.of(app)
+            for policy in policies:
+                dispatcher.add(policy, *([policy.node_type] if isinstance(policy, TypePolicy) else []))
+        start = time.perf_counter()
+        app.synth()
+        return time.perf_counter() - start, dispatcher.visits if dispatcher else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--constructs', type=int, nargs='+', default=[500, 2000, 8000],
+                        help='L1 resources of the app, each adds about one construct')
+    parser.add_argument('--stacks', type=int, default=10)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"resources":>9} {"visits":>8} {"synth s":>8} {"aspects s":>10} {"dispatcher s":>13} {"speedup":>8}')
+    for constructs in args.constructs:
+        times = {}
+        visits = 0
+        for mode in ('none', 'aspects', 'dispatcher'):
+            results = [synth(mode, constructs, args.stacks) for _ in range(args.runs)]
+            times[mode] = statistics.median(r[0] for r in results)
+            visits = max(visits, results[0][1])
+        aspects = times['aspects'] - times['none']
+        dispatcher = times['dispatcher'] - times['none']
+        speedup = aspects / dispatcher if dispatcher > 0 else float('inf')
+        print(f'{constructs:>9} {visits:>8} {times["none"]:>8.2f} {aspects:>10.2f} {dispatcher:>13.2f} '
+              f'{speedup:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
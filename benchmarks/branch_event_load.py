@@ -0,0 +1,183 @@
+"""
+Replays N synthetic CodeCommit reference events through the branch Lambda handlers against a
+stubbed, rate limited CodeBuild client and reports throughput, throttling, failed messages and the
+API latency percentiles of the handlers' metric records. The handlers use an in-memory branch registry,
+--duplicates delivers a fraction of the events twice to exercise its duplicate detection.
+
+    python benchmarks/branch_event_load.py --events 200 --rate 10 --burst 20 --duplicates 0.1
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_DIR = os.path.join(ROOT, 'cdk_pipelines_multi_branch', 'cicd', 'code')
+
+LAMBDA_ENV = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'ACCOUNT_ID': '111111111111',
+    'CODE_BUILD_ROLE_ARN': 'arn:aws:iam::111111111111:role/CodeBuildExecutionRole',
+    'ARTIFACT_BUCKET': 'branch-artifacts',
+    'CODEBUILD_NAME_PREFIX': 'CodeBuild',
+    'DEFAULT_BRANCH': 'main',
+    'DEV_STAGE_NAME': 'DEV-InfraStack'
+}
+
+
+class StubClientError(Exception):
+    """Mimics botocore's ClientError as far as the handlers look at it"""
+
+    def __init__(self, code: str) -> None:
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class StubS3:
+    """S3 stand-in without branch bundles, so the teardown uses the legacy artifacts"""
+
+    def head_object(self, **kwargs):
+        raise StubClientError('404')
+
+
+class StubCodeBuild:
+    """CodeBuild stand-in with a token bucket rate limit shared by all API calls"""
+
+    def __init__(self, rate: float, burst: int, latency: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+        self.projects = set()
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.calls += 1
+            if self.tokens < 1:
+                self.throttled += 1
+                raise StubClientError('ThrottlingException')
+            self.tokens -= 1
+        time.sleep(self.latency)
+
+    def create_project(self, name, **kwargs):
+        self._request()
+        with self._lock:
+            if name in self.projects:
+                raise StubClientError('ResourceAlreadyExistsException')
+            self.projects.add(name)
+
+    def start_build(self, projectName, **kwargs):
+        self._request()
+        if projectName not in self.projects:
+            raise StubClientError('ResourceNotFoundException')
+        return {'build': {'id': f'{projectName}:1'}}
+
+    def delete_project(self, name):
+        self._request()
+        with self._lock:
+            self.projects.discard(name)
+
+
+def reference_event(kind: str, index: int) -> dict:
+    return {
+        'detail-type': 'CodeCommit Repository State Change',
+        'time': '2022-05-25T00:00:00Z',
+        'detail': {
+            'event': 'referenceCreated' if kind == 'create' else 'referenceDeleted',
+            'referenceType': 'branch',
+            'referenceName': f'load-{index}',
+            'repositoryName': 'cdk-pipelines-multi-branch'
+        }
+    }
+
+
+def load_handler(kind: str, client: StubCodeBuild, records: list):
+    os.environ.update(LAMBDA_ENV)
+    sys.path.insert(0, CODE_DIR)
+    module = __import__('create_branch' if kind == 'create' else 'destroy_branch')
+    module.client = client
+    if kind == 'destroy':
+        module.s3 = StubS3()
+    registry = sys.modules['branch_registry']
+    module.registry = registry.BranchRegistry(registry.InMemoryBackend())
+    # keep the metric records instead of printing them
+    sys.modules['metrics'].MetricsRecorder.emit = lambda recorder: records.append(recorder.values)
+    return module.handler
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--kind', choices=['create', 'destroy'], default='create')
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--invocations', type=int, default=2, help='concurrent Lambda invocations')
+    parser.add_argument('--max-receive-count', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=10.0, help='CodeBuild API calls per second')
+    parser.add_argument('--burst', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per CodeBuild API call')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='fraction of the events delivered twice')
+    args = parser.parse_args()
+
+    client = StubCodeBuild(args.rate, args.burst, args.latency)
+    if args.kind == 'destroy':
+        client.projects = {f'CodeBuild-load-{i}-create' for i in range(args.events)}
+    metric_records = []
+    handler = load_handler(args.kind, client, metric_records)
+
+    messages = {f'msg-{i}': json.dumps(reference_event(args.kind, i)) for i in range(args.events)}
+    duplicates = int(args.events * args.duplicates)
+    messages.update({f'dup-{i}': json.dumps(reference_event(args.kind, i)) for i in range(duplicates)})
+    receives = dict.fromkeys(messages, 0)
+    pending = list(messages)
+    dead_lettered = []
+
+    start = time.perf_counter()
+    while pending:
+        batches = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+        pending = []
+
+        def invoke(batch):
+            for message_id in batch:
+                receives[message_id] += 1
+            records = [{'messageId': m, 'body': messages[m]} for m in batch]
+            return handler({'Records': records}, None)['batchItemFailures']
+
+        with ThreadPoolExecutor(max_workers=args.invocations) as pool:
+            for failures in pool.map(invoke, batches):
+                for failure in failures:
+                    message_id = failure['itemIdentifier']
+                    if receives[message_id] >= args.max_receive_count:
+                        dead_lettered.append(message_id)
+                    else:
+                        pending.append(message_id)
+    elapsed = time.perf_counter() - start
+
+    print(f'events: {args.events} ({args.kind}) in {elapsed:.2f}s, {args.events / elapsed:.1f} events/s')
+    print(f'codebuild calls: {client.calls}, throttled: {client.throttled}')
+    print(f'redelivered messages: {sum(receives.values()) - len(messages)}, dead-lettered: {len(dead_lettered)}')
+    skipped = sum(r.get('SkippedEvents', 0) for r in metric_records)
+    print(f'duplicate deliveries: {duplicates}, skipped by the registry: {skipped}')
+    for name in ('CreateProjectLatency', 'StartBuildLatency'):
+        values = [r[name] for r in metric_records if name in r]
+        if values:
+            print(f'{name}: p50 {percentile(values, 0.5):.0f}ms, p90 {percentile(values, 0.9):.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
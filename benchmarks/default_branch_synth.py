@@ -0,0 +1,51 @@
+"""
+Measures the wall time of synthesizing app.py with a cold and a warm default branch cache.
+
+The cold run removes cdk.default-branch.json so the CodeCommit repository is queried (AWS
+credentials for the development account are required), the warm runs reuse the cache.
+
+    BRANCH=main DEV_ACCOUNT_ID=111111111111 PROD_ACCOUNT_ID=222222222222 \\
+        python benchmarks/default_branch_synth.py --runs 3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_FILE = os.path.join(ROOT, 'cdk.default-branch.json')
+
+
+def synth_once() -> float:
+    env = dict(os.environ)
+    env.pop('DEFAULT_BRANCH', None)
+    with tempfile.TemporaryDirectory() as out_dir:
+        env['CDK_OUTDIR'] = out_dir
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'app.py'], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='number of cold and of warm runs')
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.runs):
+        if os.path.exists(CACHE_FILE):
+            os.remove(CACHE_FILE)
+        cold.append(synth_once())
+        warm.append(synth_once())
+
+    for name, samples in (('cold', cold), ('warm', warm)):
+        print(f'{name}: median {statistics.median(samples):.2f}s '
+              f'min {min(samples):.2f}s max {max(samples):.2f}s ({len(samples)} runs)')
+    print(f'saved per synth: {statistics.median(cold) - statistics.median(warm):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Measures the cold start of the branch create and destroy functions: the import of the handler module and
+the first invocation, in a fresh Python process per run.
+
+The clients are created lazily on the first API call (the default), or during the import, as SnapStart
+and the former module-level clients do (--modes eager). The AWS calls of the first invocation go to a
+local endpoint answering CodeBuild, DynamoDB and S3 requests, so no AWS account is needed, but the service
+models are loaded and the requests are signed and sent as in Lambda.
+
+    python benchmarks/lambda_cold_start.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from branch_event_load import CODE_DIR, LAMBDA_ENV, reference_event
+
+HANDLERS = ('create_branch', 'destroy_branch')
+
+
+class LocalEndpoint(BaseHTTPRequestHandler):
+    """Answers the JSON protocol calls of CodeBuild and DynamoDB, S3 objects are never found"""
+
+    items = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        operation = self.headers.get('X-Amz-Target', '').split('.')[-1]
+        response = {}
+        if operation == 'StartBuild':
+            response = {'build': {'id': f'{body["projectName"]}:1'}}
+        elif operation == 'PutItem':
+            self.items[json.dumps(body['Item']['branch'])] = body['Item']
+        elif operation == 'GetItem':
+            item = self.items.get(json.dumps(body['Key']['branch']))
+            response = {'Item': item} if item else {}
+        self._send(200, json.dumps(response).encode(), 'application/x-amz-json-1.1')
+
+    def do_HEAD(self):
+        self._send(404, b'', 'application/xml')
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def child(handler_module: str) -> dict:
+    """Imports the handler and invokes it once, runs in a fresh process"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LocalEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint_url = f'http://127.0.0.1:{server.server_address[1]}'
+    sys.path.insert(0, CODE_DIR)
+
+    # every client of the handler talks to the local endpoint
+    import aws_clients
+
+    def create(client):
+        import boto3
+        return boto3.client(client.service_name, config=aws_clients.client_config(), endpoint_url=endpoint_url)
+
+    aws_clients.LazyClient._create = create
+
+    start = time.perf_counter()
+    module = __import__(handler_module)
+    imported = time.perf_counter()
+    kind = 'create' if handler_module == 'create_branch' else 'destroy'
+    sys.stdout = open(os.devnull, 'w')
+    result = module.handler({'Records': [{'messageId': 'msg-0', 'body': json.dumps(reference_event(kind, 0))}]},
+                            None)
+    invoked = time.perf_counter()
+    sys.stdout = sys.__stdout__
+    if result['batchItemFailures']:
+        raise RuntimeError(f'{handler_module} failed to process the event')
+    return {'import': imported - start, 'invoke': invoked - imported}
+
+
+def run(handler_module: str, mode: str) -> dict:
+    env = dict(os.environ, **LAMBDA_ENV, REGISTRY_TABLE='BranchRegistry', AWS_ACCESS_KEY_ID='testing',
+               AWS_SECRET_ACCESS_KEY='testing', AWS_SESSION_TOKEN='testing')
+    env.pop('AWS_PROFILE', None)
+    if mode == 'eager':
+        env['AWS_LAMBDA_INITIALIZATION_TYPE'] = 'snap-start'
+    else:
+        env.pop('AWS_LAMBDA_INITIALIZATION_TYPE', None)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', handler_module], env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--handlers', nargs='+', choices=HANDLERS, default=list(HANDLERS))
+    parser.add_argument('--modes', nargs='+', choices=['lazy', 'eager'], default=['lazy', 'eager'])
+    parser.add_argument('--child', choices=HANDLERS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child)))
+        return
+
+    print(f'{"handler":16} {"clients":8} {"import ms":>10} {"1st call ms":>12} {"total ms":>9}')
+    for handler_module in args.handlers:
+        for mode in args.modes:
+            results = [run(handler_module, mode) for _ in range(args.runs)]
+            imported = statistics.median(r['import'] for r in results) * 1000
+            invoked = statistics.median(r['invoke'] for r in results) * 1000
+            total = statistics.median(r['import'] + r['invoke'] for r in results) * 1000
+            print(f'{handler_module:16} {mode:8} {imported:>10.0f} {invoked:>12.0f} {total:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
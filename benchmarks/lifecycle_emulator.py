@@ -0,0 +1,390 @@
+"""
+Local end-to-end emulator of the branch lifecycle: CodeCommit branch created event -> create_branch.handler ->
+deploy build -> branch deleted event -> destroy_branch.handler -> teardown build.
+
+The real handler modules run against in-process stand-ins: SQS-like event queues with batches, redelivery and
+a dead-letter queue, a CodeBuild with projects, a project quota, a concurrent build quota, an API rate limit
+and simulated build durations, an S3 bucket, CloudFormation stacks and an in-memory branch registry. The
+emulated builds apply the effects of their buildspec (stacks, branch bundle, registry transition, purge).
+Build durations are simulated minutes scaled by --time-scale, everything else runs in real time.
+
+    python benchmarks/lifecycle_emulator.py --branches 500 --concurrent-builds 60 --rate 20
+
+The report lists the handled events per second, the end-to-end latency percentiles from the branch event to
+the end of its build and the resources left behind once every branch is deleted.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from branch_event_load import CODE_DIR, LAMBDA_ENV, StubClientError, percentile
+
+EMULATOR_ENV = dict(
+    LAMBDA_ENV,
+    ARTIFACT_FORMAT='bundle',
+    REGISTRY_TABLE='branch-registry',
+    COMPUTE_SIZING_MODE='adaptive',
+    BUILD_CACHE_MODE='local')
+SHARED_PROJECTS = {
+    'DEPLOY_PROJECT_NAME': 'CodeBuild-shared-deploy',
+    'DESTROY_PROJECT_NAME': 'CodeBuild-shared-teardown'
+}
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class EmulatedS3:
+
+    def __init__(self) -> None:
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise StubClientError('404')
+            return {'ContentLength': self.objects[(Bucket, Key)]}
+
+    def put(self, bucket: str, key: str, size: int) -> None:
+        with self._lock:
+            self.objects[(bucket, key)] = size
+
+    def delete_prefix(self, bucket: str, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self.objects if k[0] == bucket and k[1].startswith(prefix)]:
+                del self.objects[key]
+
+
+class EmulatedCodeBuild:
+    """
+    CodeBuild with a token bucket API rate limit, a project quota and a concurrent build quota. Builds beyond
+    the quota wait in a queue like in CodeBuild. A finished build calls on_finish(buildspec, succeeded, ...).
+    """
+
+    def __init__(self, args, on_finish) -> None:
+        self.args = args
+        self.on_finish = on_finish
+        self.bucket = TokenBucket(args.rate, args.burst)
+        self.build_slots = threading.Semaphore(args.concurrent_builds)
+        self.projects = {}
+        self.running = set()
+        self.calls = 0
+        self.throttled = 0
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.calls += 1
+        if not self.bucket.take():
+            with self._lock:
+                self.throttled += 1
+            raise StubClientError('ThrottlingException')
+        time.sleep(self.args.api_latency)
+
+    def create_project(self, name, source, environment, **kwargs):
+        self._request()
+        with self._lock:
+            if name in self.projects:
+                raise StubClientError('ResourceAlreadyExistsException')
+            if len(self.projects) >= self.args.max_projects:
+                raise StubClientError('AccountLimitExceededException')
+            self.projects[name] = {'buildspec': source['buildspec'], 'computeType': environment['computeType']}
+
+    def delete_project(self, name):
+        self._request()
+        with self._lock:
+            self.projects.pop(name, None)
+
+    def start_build(self, projectName, buildspecOverride=None, computeTypeOverride=None, **kwargs):
+        self._request()
+        with self._lock:
+            project = self.projects.get(projectName)
+            if project is None:
+                raise StubClientError('ResourceNotFoundException')
+            build_id = f'{projectName}:{uuid.uuid4()}'
+            self.running.add(build_id)
+            self.builds += 1
+        buildspec = buildspecOverride or project['buildspec']
+        compute_type = computeTypeOverride or project['computeType']
+        threading.Thread(target=self._run, args=(build_id, buildspec, compute_type), daemon=True).start()
+        return {'build': {'id': build_id}}
+
+    def _run(self, build_id: str, buildspec: str, compute_type: str) -> None:
+        from compute_sizing import COMPUTE_TYPES, estimated_duration
+
+        with self.build_slots:
+            # a build needs --memory-gib on average, more than the compute type has fails the build
+            memory_ratio = random.uniform(0.5, 1.5) * self.args.memory_gib / COMPUTE_TYPES[compute_type][1]
+            duration = estimated_duration(random.uniform(0.5, 1.5) * self.args.build_minutes * 60,
+                                          'BUILD_GENERAL1_SMALL', compute_type)
+            time.sleep(duration * self.args.time_scale)
+            succeeded = memory_ratio < 1 and random.random() >= self.args.failure_rate
+            self.on_finish(buildspec, succeeded, compute_type, duration, min(memory_ratio, 1.0))
+        with self._lock:
+            self.running.discard(build_id)
+
+
+class EventQueue:
+    """SQS queue with an event source mapping: batches of messages, redelivery of failures, dead-letter queue"""
+
+    def __init__(self, handler, args) -> None:
+        self.handler = handler
+        self.args = args
+        self.messages = queue.Queue()
+        self.receives = {}
+        self.dead_letters = []
+        self.handled = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.workers = [threading.Thread(target=self._poll, daemon=True) for _ in range(args.invocations)]
+        for worker in self.workers:
+            worker.start()
+
+    def send(self, event: dict) -> None:
+        self.messages.put((str(uuid.uuid4()), json.dumps(event)))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _poll(self) -> None:
+        while not self._stop.is_set():
+            try:
+                batch = [self.messages.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.args.batching_window
+            while len(batch) < self.args.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.messages.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            bodies = dict(batch)
+            response = self.handler({'Records': [{'messageId': m, 'body': b} for m, b in batch]}, None)
+            failed = {f['itemIdentifier'] for f in response['batchItemFailures']}
+            with self._lock:
+                self.handled += len(batch) - len(failed)
+                for message_id in failed:
+                    self.receives[message_id] = self.receives.get(message_id, 1) + 1
+                    if self.receives[message_id] > self.args.max_receive_count:
+                        self.dead_letters.append(json.loads(bodies[message_id]))
+                        continue
+                    self.messages.put((message_id, bodies[message_id]))
+
+
+class LifecycleEmulator:
+
+    def __init__(self, args) -> None:
+        self.args = args
+        os.environ.update(EMULATOR_ENV)
+        if args.shared_projects:
+            os.environ.update(SHARED_PROJECTS)
+        sys.path.insert(0, CODE_DIR)
+        import branch_registry
+        import create_branch
+        import destroy_branch
+
+        self.s3 = EmulatedS3()
+        self.codebuild = EmulatedCodeBuild(args, self.finish_build)
+        self.stacks = set()
+        self.registry = branch_registry.BranchRegistry(branch_registry.InMemoryBackend())
+        for module in (create_branch, destroy_branch):
+            module.client = self.codebuild
+            module.registry = self.registry
+        destroy_branch.s3 = self.s3
+        # the handlers' logs and metric records are not needed, failures show in the report
+        logging.getLogger().addHandler(logging.NullHandler())
+        sys.modules['metrics'].MetricsRecorder.emit = lambda recorder: None
+        if args.shared_projects:
+            for name in SHARED_PROJECTS.values():
+                self.codebuild.projects[name] = {'buildspec': '', 'computeType': 'BUILD_GENERAL1_SMALL'}
+        self.shared_project_names = set(SHARED_PROJECTS.values()) if args.shared_projects else set()
+
+        self.create_queue = EventQueue(create_branch.handler, args)
+        self.destroy_queue = EventQueue(destroy_branch.handler, args)
+        self.emitted = {}
+        self.latencies = {'create': [], 'destroy': []}
+        self.failed_builds = {'create': 0, 'destroy': 0}
+        self.deleted = set()
+        self.done = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def reference_event(kind: str, branch: str) -> dict:
+        return {
+            'detail-type': 'CodeCommit Repository State Change',
+            'time': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'detail': {
+                'event': 'referenceCreated' if kind == 'create' else 'referenceDeleted',
+                'referenceType': 'branch',
+                'referenceName': branch,
+                'repositoryName': 'cdk-pipelines-multi-branch',
+                'commitId': uuid.uuid4().hex
+            }
+        }
+
+    def emit(self, kind: str, branch: str) -> None:
+        event = self.reference_event(kind, branch)
+        with self._lock:
+            self.emitted[(kind, branch)] = time.monotonic()
+        event_queue = self.create_queue if kind == 'create' else self.destroy_queue
+        event_queue.send(event)
+        if random.random() < self.args.duplicates:
+            # EventBridge delivers at least once
+            event_queue.send(event)
+
+    def schedule_delete(self, branch: str) -> None:
+        with self._lock:
+            if branch in self.deleted:
+                return
+            self.deleted.add(branch)
+        timer = threading.Timer(self.args.lifetime_minutes * 60 * self.args.time_scale, self.emit,
+                                args=('destroy', branch))
+        timer.daemon = True
+        timer.start()
+
+    def finish_build(self, buildspec: str, succeeded: bool, compute_type: str, duration: float,
+                     memory_ratio: float) -> None:
+        """Applies the effects of the emulated build, from its buildspec"""
+        from compute_sizing import BuildSample
+
+        branch = re.search(r'^\s+BRANCH: (\S+)$', buildspec, re.MULTILINE).group(1)
+        kind = 'create' if 'cdk deploy' in buildspec else 'destroy'
+        if succeeded and kind == 'create':
+            self.stacks.update({f'cdk-pipelines-multi-branch-{branch}', f'DEV-InfraStack-{branch}'})
+            bundle = re.search(r'--bucket (\S+) --prefix (\S+);', buildspec)
+            if bundle:
+                self.s3.put(bundle.group(1), f'{bundle.group(2)}branch-bundle.zip', 512 * 1024)
+                self.s3.put(bundle.group(1), f'{bundle.group(2)}manifest.json', 4096)
+        elif succeeded:
+            self.stacks.difference_update({f'cdk-pipelines-multi-branch-{branch}', f'DEV-InfraStack-{branch}'})
+            self.s3.delete_prefix(EMULATOR_ENV['ARTIFACT_BUCKET'], f'{branch}/')
+
+        finish = re.search(r'finish --branch (\S+) --event-time (\d+)', buildspec)
+        if finish:
+            self.registry.finish(branch, int(finish.group(2)), succeeded,
+                                 BuildSample(compute_type, duration, memory_ratio, succeeded))
+
+        with self._lock:
+            self.latencies[kind].append(time.monotonic() - self.emitted[(kind, branch)])
+            if not succeeded:
+                self.failed_builds[kind] += 1
+            if kind == 'destroy':
+                self.done.add(branch)
+        if kind == 'create':
+            self.schedule_delete(branch)
+
+    def run(self) -> dict:
+        branches = [f'emulated-{i}' for i in range(self.args.branches)]
+        start = time.monotonic()
+        for branch in branches:
+            self.emit('create', branch)
+            if self.args.arrival_rate:
+                time.sleep(1 / self.args.arrival_rate)
+
+        deadline = start + self.args.timeout
+        while time.monotonic() < deadline:
+            # a branch whose create event was dead-lettered is still deleted by its developer
+            for event in self.create_queue.dead_letters:
+                self.schedule_delete(event['detail']['referenceName'])
+            with self._lock:
+                settled = len(self.done) + len(self.destroy_queue.dead_letters) >= len(branches)
+            if settled and not self.codebuild.running:
+                break
+            time.sleep(0.05)
+        elapsed = time.monotonic() - start
+        self.create_queue.stop()
+        self.destroy_queue.stop()
+
+        from branch_registry import DESTROYED
+        return {
+            'elapsed': elapsed,
+            'handled': self.create_queue.handled + self.destroy_queue.handled,
+            'timed_out': elapsed >= self.args.timeout,
+            'leaks': {
+                'projects': sorted(set(self.codebuild.projects) - self.shared_project_names),
+                'stacks': sorted(self.stacks),
+                'objects': sorted(key for _, key in self.s3.objects),
+                'registry records': sorted(r['branch'] for r in self.registry.list() if r['state'] != DESTROYED),
+                'running builds': sorted(self.codebuild.running),
+                'dead-lettered events': [f"{e['detail']['event']} {e['detail']['referenceName']}"
+                                         for e in self.create_queue.dead_letters + self.destroy_queue.dead_letters]
+            }
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--branches', type=int, default=100)
+    parser.add_argument('--arrival-rate', type=float, default=0, help='created branches per second, 0: all at once')
+    parser.add_argument('--duplicates', type=float, default=0.05, help='fraction of events delivered twice')
+    parser.add_argument('--shared-projects', action='store_true')
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--batching-window', type=float, default=0.05, help='seconds')
+    parser.add_argument('--invocations', type=int, default=4, help='concurrent Lambda invocations per queue')
+    parser.add_argument('--max-receive-count', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=20.0, help='CodeBuild API calls per second')
+    parser.add_argument('--burst', type=int, default=40)
+    parser.add_argument('--api-latency', type=float, default=0.01, help='seconds per CodeBuild API call')
+    parser.add_argument('--max-projects', type=int, default=5000, help='CodeBuild project quota')
+    parser.add_argument('--concurrent-builds', type=int, default=60, help='CodeBuild concurrent build quota')
+    parser.add_argument('--build-minutes', type=float, default=8, help='mean build duration on SMALL')
+    parser.add_argument('--memory-gib', type=float, default=2, help='mean peak memory of a build')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of builds failing')
+    parser.add_argument('--lifetime-minutes', type=float, default=30, help='time from deploy to branch deletion')
+    parser.add_argument('--time-scale', type=float, default=0.001, help='real seconds per simulated second')
+    parser.add_argument('--timeout', type=float, default=300, help='real seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    emulator = LifecycleEmulator(args)
+    report = emulator.run()
+
+    print(f"branches: {args.branches}, handled events: {report['handled']} in {report['elapsed']:.2f}s, "
+          f"{report['handled'] / report['elapsed']:.1f} events/s{' (timed out)' if report['timed_out'] else ''}")
+    print(f'codebuild calls: {emulator.codebuild.calls}, throttled: {emulator.codebuild.throttled}, '
+          f'builds: {emulator.codebuild.builds}, failed builds: {emulator.failed_builds}')
+    for kind, latencies in emulator.latencies.items():
+        if latencies:
+            print(f'{kind} end-to-end latency: p50 {percentile(latencies, 0.5):.2f}s, '
+                  f'p90 {percentile(latencies, 0.9):.2f}s, p99 {percentile(latencies, 0.99):.2f}s')
+    leaked = False
+    for resource, names in report['leaks'].items():
+        if names:
+            leaked = True
+            print(f'leaked {resource}: {len(names)} ({", ".join(names[:5])}{", ..." if len(names) > 5 else ""})')
+    if not leaked:
+        print('no leaked resources')
+    return 1 if leaked or report['timed_out'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
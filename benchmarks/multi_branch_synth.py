@@ -0,0 +1,55 @@
+"""
+Measures synthesizing N branch pipelines in one app process, compared to one process per branch.
+
+Runs app.py with the default branch and N-1 feature branches for every N of --sizes and reports the
+wall time, the time per branch and the peak RSS of the app process. No AWS calls are made: the
+default branch is passed through DEFAULT_BRANCH.
+
+    python benchmarks/multi_branch_synth.py --sizes 1 10 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BRANCH = 'main'
+
+
+def run_app(branches: list) -> tuple:
+    """Synthesizes the branches in one app process, returns (wall time, peak RSS in MiB)"""
+    env = dict(os.environ,
+               DEFAULT_BRANCH=DEFAULT_BRANCH,
+               DEV_ACCOUNT_ID=os.environ.get('DEV_ACCOUNT_ID', '111111111111'),
+               PROD_ACCOUNT_ID=os.environ.get('PROD_ACCOUNT_ID', '222222222222'),
+               CDK_CONTEXT_JSON=json.dumps({'branches': ','.join(branches)}))
+    with tempfile.TemporaryDirectory() as out_dir:
+        env['CDK_OUTDIR'] = out_dir
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError(f'app.py failed for {len(branches)} branches')
+    # ru_maxrss is reported in KiB on Linux
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    single_time, _ = run_app([DEFAULT_BRANCH])
+    print(f'{"branches":>8} {"wall s":>8} {"s/branch":>9} {"1 proc/branch s":>16} {"peak RSS MiB":>13}')
+    for size in args.sizes:
+        branches = [DEFAULT_BRANCH] + [f'feature-{i}' for i in range(1, size)]
+        elapsed, rss = run_app(branches)
+        print(f'{size:>8} {elapsed:>8.1f} {elapsed / size:>9.2f} {single_time * size:>16.1f} {rss:>13.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Measures the synth time of app.py with cdk-nag off, in full mode and in incremental mode with a cold
+and a warm cache. No AWS calls are made: the default branch is passed through DEFAULT_BRANCH.
+
+    python benchmarks/nag_synth.py --branches 10 --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_FILE = os.path.join(ROOT, '.cdk-nag-cache.json')
+
+
+def synth(nag_mode: str, branches: list) -> float:
+    env = dict(os.environ,
+               NAG_MODE=nag_mode,
+               DEFAULT_BRANCH=branches[0],
+               DEV_ACCOUNT_ID=os.environ.get('DEV_ACCOUNT_ID', '111111111111'),
+               PROD_ACCOUNT_ID=os.environ.get('PROD_ACCOUNT_ID', '222222222222'),
+               CDK_CONTEXT_JSON=json.dumps({'branches': ','.join(branches)}))
+    with tempfile.TemporaryDirectory() as out_dir:
+        env['CDK_OUTDIR'] = out_dir
+        start = time.perf_counter()
+        subprocess.run([sys.executable, 'app.py'], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--branches', type=int, default=1, help='number of branch pipelines in the app')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    branches = ['main'] + [f'feature-{i}' for i in range(1, args.branches)]
+    samples = {'off': [], 'full': [], 'incremental (cold)': [], 'incremental (warm)': []}
+    for _ in range(args.runs):
+        samples['off'].append(synth('off', branches))
+        samples['full'].append(synth('full', branches))
+        if os.path.exists(CACHE_FILE):
+            os.remove(CACHE_FILE)
+        samples['incremental (cold)'].append(synth('incremental', branches))
+        samples['incremental (warm)'].append(synth('incremental', branches))
+
+    baseline = statistics.median(samples['off'])
+    for mode, times in samples.items():
+        median = statistics.median(times)
+        print(f'{mode:20} median {median:6.2f}s  nag overhead {median - baseline:6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
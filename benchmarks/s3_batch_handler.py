@@ -0,0 +1,81 @@
+"""
+Local throughput benchmark of the batched S3 trigger handler (lambda-handler.batch_main).
+
+Feeds SQS batches of S3 notifications to the handler with a stubbed S3 client which streams objects
+of --object-size bytes with a simulated first-byte latency, and reports objects/s and MiB/s per batch size.
+
+    python benchmarks/s3_batch_handler.py --messages 500 --batch-sizes 1 10 100
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLER = os.path.join(ROOT, 'cdk_pipelines_multi_branch', 'src', 'lambda', 'lambda-handler.py')
+
+
+class StubBody:
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+
+    def iter_chunks(self, chunk_size):
+        remaining = self.size
+        while remaining > 0:
+            n = min(chunk_size, remaining)
+            remaining -= n
+            yield b'x' * n
+
+
+class StubS3:
+
+    def __init__(self, object_size: int, latency: float) -> None:
+        self.object_size = object_size
+        self.latency = latency
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        return {'Body': StubBody(self.object_size)}
+
+
+def load_handler(stub):
+    spec = importlib.util.spec_from_file_location('lambda_handler', HANDLER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module._s3 = stub
+    return module
+
+
+def sqs_record(index: int) -> dict:
+    notification = {'Records': [{'s3': {'bucket': {'name': 'bucket'}, 'object': {'key': f'upload/object-{index}'}}}]}
+    return {'messageId': f'msg-{index}', 'body': json.dumps(notification)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--object-size', type=int, default=256 * 1024)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds until the first byte of an object')
+    args = parser.parse_args()
+
+    module = load_handler(StubS3(args.object_size, args.latency))
+    records = [sqs_record(i) for i in range(args.messages)]
+    # the handler prints one line per object, keep the benchmark output readable
+    module.print = lambda *a, **k: None
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        failures = 0
+        for i in range(0, len(records), batch_size):
+            failures += len(module.batch_main({'Records': records[i:i + batch_size]}, None)['batchItemFailures'])
+        elapsed = time.perf_counter() - start
+        mib = args.messages * args.object_size / 1024 / 1024
+        print(f'batch size {batch_size:4}: {args.messages / elapsed:8.1f} objects/s {mib / elapsed:8.1f} MiB/s '
+              f'({-(-args.messages // batch_size)} invocations, {failures} failures)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Synth benchmark suite for CdkPipelinesMultiBranchStack with a regression gate.
+
+Every scenario synthesizes app.py for the default branch and N feature branches in a fresh worker
+process. The CodeCommit metadata is prestaged (a branches file and a valid default branch cache
+entry), so no AWS call is made. Per scenario the suite records the synth wall time, the peak RSS of
+the worker, the construct count, the template bytes and the asset count.
+
+    python benchmarks/synth_suite.py --feature-branches 0 10 --update-baseline
+    python benchmarks/synth_suite.py --feature-branches 0 10 --check --base origin/main
+
+With --check, the results are compared to the baseline file, benchmarks/synth_baseline.json by default.
+The baseline depends on the machine, so it is not committed: record it on the base revision first.
+Without a baseline file --check fails before synthesizing anything. Regressions fail the run and list the
+changed files of application_stage.py, iam_stack.py and the aspects since --base, the usual suspects
+for a slower synth.
+"""
+import argparse
+import json
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BRANCH = 'main'
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'synth_baseline.json')
+WATCHED_PATHS = [
+    'cdk_pipelines_multi_branch/src/application_stage.py',
+    'cdk_pipelines_multi_branch/cicd/iam_stack.py',
+    'cdk_pipelines_multi_branch/cicd/aspects'
+]
+# deterministic metrics only vary with the code, timings also with the machine
+STRUCTURAL_METRICS = ('constructs', 'template_bytes', 'assets')
+TIMING_METRICS = ('synth_seconds', 'peak_rss_mib')
+
+
+def prestage(work_dir: str, feature_branches: int) -> dict:
+    """Writes the config, branches file and default branch cache a worker synthesizes from"""
+    import configparser
+
+    from cdk_pipelines_multi_branch.cicd.default_branch_resolver import DEFAULT_CACHE_FILE, cache_key
+
+    shutil.copy(os.path.join(ROOT, 'config.ini'), work_dir)
+    global_config = configparser.ConfigParser()
+    global_config.read(os.path.join(work_dir, 'config.ini'))
+    key = cache_key(global_config.get('general', 'repository_name'), global_config.get('general', 'region'))
+    with open(os.path.join(work_dir, DEFAULT_CACHE_FILE), 'w') as f:
+        json.dump({key: {'value': DEFAULT_BRANCH, 'expires': int(time.time()) + 86400}}, f)
+
+    branches_file = os.path.join(work_dir, 'branches.txt')
+    with open(branches_file, 'w') as f:
+        f.write('\n'.join([DEFAULT_BRANCH] + [f'feature-{i}' for i in range(1, feature_branches + 1)]))
+    return {'branches_file': branches_file}
+
+
+def count_outputs(out_dir: str) -> dict:
+    template_bytes = 0
+    assets = 0
+    for directory, dirs, files in os.walk(out_dir):
+        template_bytes += sum(os.path.getsize(os.path.join(directory, f))
+                              for f in files if f.endswith('.template.json'))
+        assets += sum(1 for name in dirs + files if name.startswith('asset.'))
+    return {'template_bytes': template_bytes, 'assets': assets}
+
+
+def worker(feature_branches: int) -> None:
+    """Synthesizes app.py in this process and prints the metrics as JSON"""
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import aws_cdk  # noqa: F401
+    import cdk_nag  # noqa: F401
+    import_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        context = prestage(work_dir, feature_branches)
+        os.environ.pop('DEFAULT_BRANCH', None)
+        os.environ.setdefault('DEV_ACCOUNT_ID', '111111111111')
+        os.environ.setdefault('PROD_ACCOUNT_ID', '222222222222')
+        os.environ['CDK_CONTEXT_JSON'] = json.dumps(context)
+        os.environ['CDK_OUTDIR'] = os.path.join(work_dir, 'cdk.out')
+        os.chdir(work_dir)
+
+        start = time.perf_counter()
+        app = runpy.run_path(os.path.join(ROOT, 'app.py'))['app']
+        synth_seconds = time.perf_counter() - start
+
+        print(json.dumps({
+            'import_seconds': round(import_seconds, 3),
+            'synth_seconds': round(synth_seconds, 3),
+            'constructs': len(app.node.find_all()),
+            **count_outputs(os.environ['CDK_OUTDIR'])
+        }))
+
+
+def run_scenario(feature_branches: int) -> dict:
+    with tempfile.TemporaryFile(mode='w+') as stderr:
+        process = subprocess.Popen([sys.executable, __file__, '--worker', str(feature_branches)],
+                                   cwd=ROOT, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        output = process.stdout.read()
+        _, status, usage = os.wait4(process.pid, 0)
+        if status != 0:
+            stderr.seek(0)
+            raise RuntimeError(f'synth failed with {feature_branches} feature branches:\n{stderr.read()[-2000:]}')
+    # ru_maxrss is reported in KiB on Linux
+    return dict(json.loads(output.splitlines()[-1]), peak_rss_mib=round(usage.ru_maxrss / 1024, 1))
+
+
+def measure(feature_branches: int, repeat: int) -> dict:
+    """Median of the timings over repeat runs, the structural metrics do not vary"""
+    runs = [run_scenario(feature_branches) for _ in range(repeat)]
+    result = dict(runs[0])
+    for metric in ('import_seconds',) + TIMING_METRICS:
+        result[metric] = round(statistics.median(run[metric] for run in runs), 3)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float, structural_tolerance: float) -> list:
+    regressions = []
+    for scenario, result in results.items():
+        expected = baseline.get(scenario)
+        if expected is None:
+            continue
+        for metric in TIMING_METRICS + STRUCTURAL_METRICS:
+            limit = expected[metric] * (1 + (structural_tolerance if metric in STRUCTURAL_METRICS else tolerance))
+            if result[metric] > limit:
+                regressions.append(f'{scenario}: {metric} {result[metric]} > {expected[metric]} (limit {limit:.1f})')
+    return regressions
+
+
+def changed_watched_files(base: str) -> list:
+    result = subprocess.run(['git', 'diff', '--name-only', base, '--', *WATCHED_PATHS],
+                            cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.split() if result.returncode == 0 else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feature-branches', type=int, nargs='+', default=[0, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='fail on regressions against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative synth time and RSS growth')
+    parser.add_argument('--structural-tolerance', type=float, default=0.05,
+                        help='allowed relative construct, template bytes and asset growth')
+    parser.add_argument('--base', default='HEAD', help='git ref the watched files are compared to')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        worker(args.worker)
+        return 0
+    if args.check and not args.update_baseline and not os.path.exists(args.baseline):
+        print(f'--check needs the baseline file {args.baseline}, which does not exist. Record it on the base '
+              f'revision with --update-baseline first.')
+        return 2
+
+    results = {}
+    print(f'{"scenario":>12} {"synth s":>8} {"import s":>9} {"RSS MiB":>8} {"constructs":>11} '
+          f'{"template KiB":>13} {"assets":>7}')
+    for feature_branches in args.feature_branches:
+        scenario = f'default+{feature_branches}'
+        result = results[scenario] = measure(feature_branches, args.repeat)
+        print(f'{scenario:>12} {result["synth_seconds"]:>8.2f} {result["import_seconds"]:>9.2f} '
+              f'{result["peak_rss_mib"]:>8.0f} {result["constructs"]:>11} '
+              f'{result["template_bytes"] / 1024:>13.0f} {result["assets"]:>7}')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+
+    if args.check:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.structural_tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            for changed in changed_watched_files(args.base):
+                print(f'  changed since {args.base}: {changed}')
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
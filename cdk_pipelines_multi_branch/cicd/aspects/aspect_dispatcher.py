@@ -0,0 +1,44 @@
+import aws_cdk as cdk
+import jsii
+
+from .handler_index import HandlerIndex
+
+
+@jsii.implements(cdk.IAspect)
+class AspectDispatcher(HandlerIndex):
+    """
+    Routes every construct to the handlers registered for its construct type.
+
+    Each aspect implemented in Python costs a call from the CDK through JSII for every construct of its
+    scope, whether it acts on the construct or not. The dispatcher is the only Python aspect of the app:
+    it is visited once per construct and looks the handlers up by the Python type of the construct,
+    memoized per type, so a policy for one resource type adds no calls for the other constructs. See
+    HandlerIndex for the registration of the handlers.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.visits = 0
+        self.dispatched = 0
+
+    @classmethod
+    def of(cls, scope):
+        """Dispatcher of the app of scope, added to the aspects of the app on first use"""
+        root = scope.node.root
+        for aspect in cdk.Aspects.of(root).all:
+            if isinstance(aspect, cls):
+                return aspect
+        dispatcher = cls()
+        cdk.Aspects.of(root).add(dispatcher)
+        return dispatcher
+
+    def add(self, handler, *node_types) -> 'AspectDispatcher':
+        """Registers handler for the constructs of node_types and their subclasses, for all constructs without"""
+        super().add(handler, *node_types)
+        return self
+
+    def visit(self, node) -> None:
+        self.visits += 1
+        for handler in self.handlers(type(node)):
+            self.dispatched += 1
+            handler(node)
@@ -0,0 +1,39 @@
+class HandlerIndex:
+    """
+    Handlers of constructs by construct type, the routing of the AspectDispatcher without the CDK.
+
+    Handlers are aspects (objects with a visit method) or callables taking the construct. A handler registered
+    for types is called for the constructs of these types and their subclasses, handlers registered without a
+    type for every construct, in registration order after the typed ones. The handlers of a Python type are
+    memoized until the next handler is added. Adding the same handler object again for the same types is a
+    no-op, differently configured instances of an aspect class are separate handlers.
+    """
+
+    def __init__(self) -> None:
+        self._handlers = []
+        self._catch_all = []
+        self._keys = set()
+        self._index = {}
+
+    def add(self, handler, *node_types) -> bool:
+        """Registers handler for the constructs of node_types, for all constructs without. False if it was already"""
+        key = (id(handler), node_types)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        # keeps the handler referenced, so its id is not reused while it is registered
+        visit = handler.visit if hasattr(handler, 'visit') else handler
+        if node_types:
+            self._handlers.append((node_types, visit))
+        else:
+            self._catch_all.append(visit)
+        self._index.clear()
+        return True
+
+    def handlers(self, node_type) -> tuple:
+        """Handlers of the constructs of node_type, in call order"""
+        handlers = self._index.get(node_type)
+        if handlers is None:
+            handlers = self._index[node_type] = tuple(
+                [visit for node_types, visit in self._handlers if issubclass(node_type, node_types)] + self._catch_all)
+        return handlers
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from importlib import metadata
+
+import aws_cdk as cdk
+import jsii
+
+FINDING_TYPES = ('aws:cdk:error', 'aws:cdk:warning', 'aws:cdk:info')
+
+
+def _children(scope):
+    """Constructs of the stack of scope, without descending into nested stages and stacks"""
+    for child in scope.node.children:
+        if cdk.Stack.is_stack(child) or cdk.Stage.is_stage(child):
+            continue
+        yield child
+        yield from _children(child)
+
+
+def _stack_of(node):
+    for scope in reversed(node.node.scopes):
+        if cdk.Stack.is_stack(scope):
+            return scope
+    return None
+
+
+def _package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _relative_path(stack, node) -> str:
+    return node.node.path[len(stack.node.path) + 1:] if node is not stack else ''
+
+
+@jsii.implements(cdk.IAspect)
+class IncrementalNagAspect:
+    """
+    Runs a cdk-nag pack only on stacks whose construct subtree changed since the previous synth.
+
+    Each stack is fingerprinted from the paths, types and resolved properties of its constructs. For an
+    unchanged fingerprint, the findings of the previous run are re-added as annotations instead of evaluating
+    the rules again. Call save() after app.synth() to store the findings of the evaluated stacks.
+    """
+
+    def __init__(self, pack, cache_file: str = '.cdk-nag-cache.json') -> None:
+        self.pack = pack
+        self.pack_name = pack.read_pack_name
+        self.cache_file = cache_file
+        self._salt = f'{self.pack_name}:{_package_version("cdk-nag")}:{_package_version("aws-cdk-lib")}'
+        self._stacks = {}
+        try:
+            with open(cache_file) as f:
+                self._cache = json.load(f)
+        except (OSError, ValueError):
+            self._cache = {}
+
+    def visit(self, node) -> None:
+        stack = _stack_of(node)
+        if stack is None:
+            self.pack.visit(node)
+            return
+
+        state = self._stacks.get(stack.node.path)
+        if state is None:
+            state = self._stacks[stack.node.path] = self._start_stack(stack)
+        if not state['cached']:
+            self.pack.visit(node)
+
+    def save(self) -> None:
+        cache = {}
+        for path, state in self._stacks.items():
+            if state['fingerprint'] is None:
+                continue
+            findings = state['findings'] if state['cached'] else self._collect_findings(state['stack'])
+            cache[path] = {'fingerprint': state['fingerprint'], 'findings': findings}
+        with open(f'{self.cache_file}.tmp', 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(f'{self.cache_file}.tmp', self.cache_file)
+
+    @property
+    def stats(self) -> dict:
+        cached = sum(1 for state in self._stacks.values() if state['cached'])
+        return {'stacks': len(self._stacks), 'cached': cached, 'evaluated': len(self._stacks) - cached}
+
+    def _start_stack(self, stack) -> dict:
+        fingerprint = self._fingerprint(stack)
+        entry = self._cache.get(stack.node.path)
+        cached = fingerprint is not None and entry is not None and entry['fingerprint'] == fingerprint
+        state = {'stack': stack, 'fingerprint': fingerprint, 'cached': cached, 'findings': []}
+        if cached:
+            state['findings'] = entry['findings']
+            self._replay(stack, entry['findings'])
+        return state
+
+    def _fingerprint(self, stack):
+        digest = hashlib.sha256(self._salt.encode())
+        try:
+            digest.update(self._dumps(stack.resolve(stack.template_options.metadata)))
+            for construct in _children(stack):
+                digest.update(f'{construct.node.path}:{type(construct).__qualname__}'.encode())
+                if cdk.CfnResource.is_cfn_resource(construct):
+                    digest.update(construct.cfn_resource_type.encode())
+                    digest.update(self._dumps(stack.resolve(construct.cfn_properties)))
+                    digest.update(self._dumps(stack.resolve(construct.cfn_options.metadata)))
+        except Exception:
+            # a subtree which cannot be fingerprinted reliably is always evaluated
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def _dumps(value) -> bytes:
+        return json.dumps(value, sort_keys=True, default=str).encode()
+
+    def _collect_findings(self, stack) -> list:
+        findings = []
+        for construct in [stack, *_children(stack)]:
+            for entry in construct.node.metadata:
+                if entry.type in FINDING_TYPES and self.pack_name in str(entry.data):
+                    findings.append({'path': _relative_path(stack, construct), 'type': entry.type, 'data': entry.data})
+        return findings
+
+    @staticmethod
+    def _replay(stack, findings: list) -> None:
+        constructs = {_relative_path(stack, c): c for c in [stack, *_children(stack)]}
+        for finding in findings:
+            annotations = cdk.Annotations.of(constructs.get(finding['path'], stack))
+            if finding['type'] == 'aws:cdk:error':
+                annotations.add_error(finding['data'])
+            elif finding['type'] == 'aws:cdk:warning':
+                annotations.add_warning(finding['data'])
+            else:
+                annotations.add_info(finding['data'])
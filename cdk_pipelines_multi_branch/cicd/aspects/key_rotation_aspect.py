@@ -5,6 +5,8 @@ import jsii
 
 @jsii.implements(cdk.IAspect)
 class KeyRotationAspect:
+  # registered with the AspectDispatcher for these construct types only
+  NODE_TYPES = (kms.CfnKey,)
 
   def visit(self, node):
     if isinstance(node, kms.CfnKey):
@@ -0,0 +1,45 @@
+"""
+Selects the branches app.py synthesizes pipeline stacks for.
+
+By default only the BRANCH environment variable is used. Several branches can be synthesized in one
+app process through the `branches` context (comma separated, or `all` for every branch of the
+CodeCommit repository), the `branches_file` context (one branch per line) or the BRANCHES
+environment variable, e.g. `cdk synth -c branches=main,feature-1`.
+"""
+import os
+
+
+def parse_branches(value: str) -> list:
+    """Splits a comma or newline separated branch list, keeping the order and dropping duplicates"""
+    branches = []
+    for branch in value.replace(',', '\n').splitlines():
+        branch = branch.strip()
+        if branch and not branch.startswith('#') and branch not in branches:
+            branches.append(branch)
+    return branches
+
+
+def list_repository_branches(repository_name: str, region: str, client=None) -> list:
+    if client is None:
+        import boto3
+        client = boto3.client('codecommit', region_name=region)
+    branches = []
+    for page in client.get_paginator('list_branches').paginate(repositoryName=repository_name):
+        branches += page['branches']
+    return sorted(branches)
+
+
+def select_branches(app, repository_name: str, region: str) -> list:
+    branches = app.node.try_get_context('branches') or os.environ.get('BRANCHES')
+    branches_file = app.node.try_get_context('branches_file')
+
+    if branches == 'all':
+        return list_repository_branches(repository_name, region)
+    if isinstance(branches, list):
+        return parse_branches(','.join(branches))
+    if branches:
+        return parse_branches(branches)
+    if branches_file:
+        with open(branches_file) as f:
+            return parse_branches(f.read())
+    return [os.environ['BRANCH']]
@@ -1,22 +1,38 @@
 from os import path
 
 from aws_cdk import (
-    Stack, aws_codepipeline_actions, Aspects, RemovalPolicy
+    CfnOutput, Stack, aws_codepipeline_actions, Duration, RemovalPolicy
 )
+from aws_cdk.aws_codebuild import BuildEnvironment, BuildSpec, CfnProject, LinuxBuildImage
 from aws_cdk.aws_codecommit import Repository
-from aws_cdk.aws_events_targets import LambdaFunction
-from aws_cdk.aws_iam import PolicyStatement
+from aws_cdk.aws_dynamodb import Attribute, AttributeType, BillingMode, Table
+from aws_cdk.aws_events import EventPattern, Rule, Schedule
+from aws_cdk.aws_events_targets import LambdaFunction, SqsQueue
+from aws_cdk.aws_iam import PolicyStatement, ServicePrincipal
 from aws_cdk.aws_lambda import Function, Runtime, Code
+from aws_cdk.aws_lambda_event_sources import SqsEventSource
 from aws_cdk.aws_s3 import BucketEncryption
-from aws_cdk.pipelines import CodePipeline, CodeBuildStep, CodePipelineSource, ManualApprovalStep
+from aws_cdk.pipelines import CodePipeline, CodeBuildStep, CodePipelineSource, ManualApprovalStep, ShellStep
 from cdk_nag import NagSuppressions, NagPackSuppression
 from constructs import Construct
 
+from cdk_pipelines_multi_branch.cicd.aspects.aspect_dispatcher import AspectDispatcher
 from cdk_pipelines_multi_branch.cicd.aspects.key_rotation_aspect import KeyRotationAspect
+from .code.build_cache import BuildCacheSettings, cache_paths, install_commands
+from .code.compute_sizing import SizingPolicy
+from .constructs.branch_metrics_dashboard import BranchMetricsDashboard
+from .constructs.branch_projects import BranchProjectsConstruct
+from .constructs.feature_pipeline import FeaturePipelineConstruct
 from .constructs.standard_bucket import S3Construct
+from .constructs.standard_queue import SQSConstruct
 from .iam_stack import IAMPipelineStack
+from .lambda_code import LambdaSettings
+from .lambda_package import package_excludes
 from ..src.application_stage import MainStage as Application
 
+# the aspect has no configuration, one instance serves every stack of the app
+KEY_ROTATION = KeyRotationAspect()
+
 
 class CdkPipelinesMultiBranchStack(Stack):
 
@@ -32,60 +48,142 @@ class CdkPipelinesMultiBranchStack(Stack):
         default_branch = config['default_branch']
         dev_account_id = config['dev_account_id']
         prod_account_id = config['prod_account_id'] if branch == default_branch else dev_account_id
+        build_cache = config.get('build_cache', BuildCacheSettings())
+        compute_sizing = config.get('compute_sizing', SizingPolicy())
+        lambda_settings = config.get('lambda', LambdaSettings())
+        branch_events = config.get('branch_events', {})
+        event_batch_size = branch_events.get('batch_size', 10)
+        event_concurrency = branch_events.get('max_concurrency', 4)
+        shared_projects = config.get('shared_projects', False)
+        artifact_format = config.get('artifact_format', 'bundle')
+        pipeline_triggers = config.get('pipeline_triggers', {'mode': 'poll'})
+        event_triggers = pipeline_triggers['mode'] == 'event'
+        pipeline_name_prefix = 'CICDPipeline'
+        # one pipeline deploying every feature branch instead of a pipeline per branch
+        feature_pipeline_name = 'CICDFeaturePipeline' if config.get('feature_pipeline') == 'shared' else None
+        reaper = config.get('reaper', {'enabled': False})
+        metrics = config.get('metrics', {'dashboard': False})
+        fast_path = config.get('fast_path', False) and branch != default_branch
 
         repo = Repository.from_repository_name(self, 'ImportedRepo', repo_name)
+        source = CodePipelineSource.code_commit(
+            repository=repo,
+            # with event triggers the pipelines are started by the LambdaTriggerPipeline function
+            trigger=aws_codepipeline_actions.CodeCommitTrigger.NONE if event_triggers
+            else aws_codepipeline_actions.CodeCommitTrigger.POLL,
+            branch=branch
+        )
+
+        build_environment = BuildEnvironment(
+            build_image=LinuxBuildImage.from_docker_registry(build_cache.prebuilt_image)
+        ) if build_cache.prebuilt_image else None
+
+        synth_step = CodeBuildStep(
+            'Synth',
+            input=source,
+            env={
+                'BRANCH': branch,
+                'DEFAULT_BRANCH': default_branch,
+                'DEV_ACCOUNT_ID': dev_account_id,
+                'PROD_ACCOUNT_ID': prod_account_id
+            },
+            install_commands=install_commands(build_cache, cfn_nag=True),
+            build_environment=build_environment,
+            partial_build_spec=BuildSpec.from_object({
+                'cache': {'paths': cache_paths()}
+            }) if build_cache.enabled else None,
+            commands=[
+                'cdk synth',
+                # scans every template of cdk.out, only failures of the application stacks fail the build
+                "python -m cdk_pipelines_multi_branch.cicd.template_scan --cdk-out cdk.out --enforce '*InfraStack*'"
+            ],
+            role_policy_statements=[
+                PolicyStatement(
+                    actions=[
+                        'codecommit:GetRepository'
+                    ],
+                    resources=[
+                        f'arn:aws:codecommit:{region}:{dev_account_id}:{repo_name}'
+                    ])
+            ]
+        )
 
         pipeline = CodePipeline(
             self,
             f"Pipeline-{branch}",
-            pipeline_name=f"CICDPipeline-{branch}",
+            pipeline_name=f"{pipeline_name_prefix}-{branch}",
             cross_account_keys=True,
-            synth=CodeBuildStep(
-                'Synth',
-                input=CodePipelineSource.code_commit(
-                    repository=repo,
-                    trigger=aws_codepipeline_actions.CodeCommitTrigger.POLL,
-                    branch=branch
-                ),
-                env={
-                    'BRANCH': branch,
-                    'DEV_ACCOUNT_ID': dev_account_id,
-                    'PROD_ACCOUNT_ID': prod_account_id
-                },
-                install_commands=[
-                    'gem install cfn-nag',
-                    'npm install -g aws-cdk',
-                    'pip install -r requirements.txt',
-                    'export LC_ALL="en_US.UTF-8"',
-                    'locale-gen en_US en_US.UTF-8',
-                    'dpkg-reconfigure locales'
-                ],
+            synth=synth_step)
+
+        # the dispatcher of the app routes only the KMS keys to the aspect, registered once for all branch stacks
+        AspectDispatcher.of(self).add(KEY_ROTATION, *KeyRotationAspect.NODE_TYPES)
+
+        dev_stage_name = 'DEV'
+        s3_trigger_batch_size = config.get('s3_trigger_batch_size')
+        dev_stage = Application(self, dev_stage_name, branch, s3_trigger_batch_size,
+                                env={'account': dev_account_id, 'region': region})
+        if fast_path:
+            # Feature branch fast path: the CDK CLI deploys the DEV stack, with hotswap if only Lambda code changed
+            dev_stack_name = f'{dev_stage_name}-{dev_stage.main_stack_name}-{branch}'
+            dev_stack_arn = f'arn:aws:cloudformation:{region}:{dev_account_id}:stack/{dev_stack_name}/*'
+            pipeline.add_wave(dev_stage_name, post=[CodeBuildStep(
+                'FastDeploy',
+                input=source,
+                additional_inputs={'cdk.out': synth_step.primary_output},
+                install_commands=install_commands(build_cache, requirements=False),
+                build_environment=build_environment,
                 commands=[
-                    f'cdk synth',
-                    f'npx cdk synth cdk-pipelines-multi-branch-{branch}/DEV/InfraStack-{branch} > infra_stack.yaml',
-                    'cfn_nag_scan --input-path infra_stack.yaml'
+                    f'python -m cdk_pipelines_multi_branch.cicd.fast_deploy --cdk-out cdk.out '
+                    f'--stack-name {dev_stack_name}'
                 ],
                 role_policy_statements=[
                     PolicyStatement(
-                        actions=[
-                            'codecommit:GetRepository'
-                        ],
-                        resources=[
-                            f'arn:aws:codecommit:{region}:{dev_account_id}:{repo_name}'
-                        ])
+                        actions=['cloudformation:GetTemplate', 'cloudformation:DescribeStacks',
+                                 'cloudformation:ListStackResources'],
+                        resources=[dev_stack_arn]),
+                    # generated function names are truncated to 64 characters and may not start with the full
+                    # stack name of a long branch name, the stack tag of CloudFormation identifies the functions
+                    PolicyStatement(
+                        actions=['lambda:GetFunction', 'lambda:UpdateFunctionCode'],
+                        resources=[f'arn:aws:lambda:{region}:{dev_account_id}:function:*'],
+                        conditions={
+                            'StringEquals': {'aws:ResourceTag/aws:cloudformation:stack-name': dev_stack_name}
+                        }),
+                    PolicyStatement(
+                        actions=['sts:AssumeRole'],
+                        resources=[f'arn:*:iam::{dev_account_id}:role/*'],
+                        conditions={
+                            'ForAnyValue:StringEquals': {
+                                'iam:ResourceTag/aws-cdk:bootstrap-role': ['file-publishing', 'deploy']
+                            }
+                        })
                 ]
-            ))
-
-        Aspects.of(self).add(KeyRotationAspect())
-
-        dev_stage_name = 'DEV'
-        dev_stage = Application(self, dev_stage_name, branch, env={'account': dev_account_id, 'region': region})
-        pipeline.add_stage(dev_stage)
+            )])
+        else:
+            pipeline.add_stage(dev_stage)
 
         if branch == default_branch:
-            # Prod stage
-            pipeline.add_stage(Application(self, 'PROD', branch, env={'account': prod_account_id, 'region': region}),
-                               pre=[ManualApprovalStep('ManualApproval', comment='Pre-prod manual approval')])
+            waves = config.get('waves') or []
+            if not waves:
+                # Prod stage
+                pipeline.add_stage(Application(self, 'PROD', branch, s3_trigger_batch_size,
+                                               env={'account': prod_account_id, 'region': region}),
+                                   pre=[ManualApprovalStep('ManualApproval', comment='Pre-prod manual approval')])
+
+            # Deployment waves: the stages of a wave deploy concurrently, the waves one after the other
+            for wave in waves:
+                pipeline_wave = pipeline.add_wave(
+                    wave.name,
+                    pre=[ManualApprovalStep(f'{wave.name}-Approval', comment=f'Approve the {wave.name} wave')]
+                    if wave.approval else None,
+                    # a failed validation stops the pipeline before the next wave
+                    post=[ShellStep(f'{wave.name}-Validate', input=source, commands=[wave.validate],
+                                    env={'WAVE': wave.name, 'TARGETS': ','.join(map(str, wave.targets))})]
+                    if wave.validate else None)
+                for target in wave.targets:
+                    pipeline_wave.add_stage(Application(self, target.stage_id(wave.name), branch,
+                                                        s3_trigger_batch_size,
+                                                        env={'account': target.account, 'region': target.region}))
 
             # Artifact bucket for feature AWS CodeBuild projects
             args = dict(
@@ -95,6 +193,28 @@ class CdkPipelinesMultiBranchStack(Stack):
             )
             artifact_bucket = S3Construct(self, 'BranchArtifacts', args).bucket
 
+            # Names of the deploy and teardown projects shared by all branches, if enabled
+            project_names = {}
+            if shared_projects:
+                project_names = {
+                    'deploy_project_name': f'{codebuild_prefix}-shared-deploy',
+                    'destroy_project_name': f'{codebuild_prefix}-shared-teardown'
+                }
+
+            # Registry of the branch environments, written with conditional state transitions by the Lambda
+            # functions and the branch builds. Destroyed branches are kept as tombstones until expires_at.
+            registry_table = Table(
+                self,
+                'BranchRegistry',
+                partition_key=Attribute(name='branch', type=AttributeType.STRING),
+                billing_mode=BillingMode.PAY_PER_REQUEST,
+                point_in_time_recovery=True,
+                time_to_live_attribute='expires_at',
+                removal_policy=RemovalPolicy.DESTROY)
+            # the table name for the --table option of code/branch_registry.py
+            CfnOutput(self, 'BranchRegistryTable', value=registry_table.table_name,
+                      description='DynamoDB table of the branch environment registry')
+
             # AWS Lambda and AWS CodeBuild projects' IAM Roles.
             iam_stack = IAMPipelineStack(
                 self,
@@ -103,53 +223,213 @@ class CdkPipelinesMultiBranchStack(Stack):
                 region=region,
                 repo_name=repo_name,
                 artifact_bucket_arn=artifact_bucket.bucket_arn,
-                codebuild_prefix=codebuild_prefix)
+                codebuild_prefix=codebuild_prefix,
+                registry_table_arn=registry_table.table_arn,
+                pipeline_name_prefix=pipeline_name_prefix if event_triggers or feature_pipeline_name else None,
+                feature_pipeline_name=feature_pipeline_name,
+                reaper=reaper['enabled'],
+                **project_names)
+
+            if shared_projects:
+                BranchProjectsConstruct(
+                    self,
+                    'BranchProjects',
+                    repo=repo,
+                    artifact_bucket=artifact_bucket,
+                    role=iam_stack.code_build_role,
+                    build_cache=build_cache,
+                    **project_names)
+
+            if feature_pipeline_name:
+                FeaturePipelineConstruct(
+                    self,
+                    'FeaturePipeline',
+                    repo=repo,
+                    pipeline_name=feature_pipeline_name,
+                    default_branch=default_branch,
+                    account=dev_account_id,
+                    region=region,
+                    dev_stage_name=dev_stage_name,
+                    dev_stack_prefix=f'{dev_stage_name}-{dev_stage.main_stack_name}',
+                    artifact_bucket=artifact_bucket,
+                    registry_table=registry_table,
+                    build_cache=build_cache)
+
+            # Queues buffering the branch events, so bursts are processed in throttle-aware batches
+            handler_timeout = Duration.minutes(2)
+            queue_args = dict(visibility_timeout=Duration.minutes(12))
+            create_branch_events = SQSConstruct(self, 'BranchCreateEvents', dict(queue_args))
+            destroy_branch_events = SQSConstruct(self, 'BranchDestroyEvents', dict(queue_args))
+            for branch_event_queue in (create_branch_events, destroy_branch_events):
+                branch_event_queue.key.grant_encrypt_decrypt(ServicePrincipal('events.amazonaws.com'))
 
             # AWS Lambda function triggered upon branch creation
+            code_dir = path.join(this_dir, 'code')
             create_branch_func = Function(
                 self,
                 'LambdaTriggerCreateBranch',
-                runtime=Runtime.PYTHON_3_9,
                 function_name='LambdaTriggerCreateBranch',
                 handler='create_branch.handler',
-                code=Code.from_asset(path.join(this_dir, 'code')),
+                code=Code.from_asset(code_dir, exclude=package_excludes(code_dir, 'create_branch')),
+                timeout=handler_timeout,
+                **lambda_settings.function_args(),
                 environment={
                     "ACCOUNT_ID": dev_account_id,
                     "CODE_BUILD_ROLE_ARN": iam_stack.code_build_role.role_arn,
                     "ARTIFACT_BUCKET": artifact_bucket.bucket_name,
-                    "CODEBUILD_NAME_PREFIX": codebuild_prefix
+                    "CODEBUILD_NAME_PREFIX": codebuild_prefix,
+                    "DEFAULT_BRANCH": default_branch,
+                    "MAX_CONCURRENCY": str(event_concurrency),
+                    "ARTIFACT_FORMAT": artifact_format,
+                    "REGISTRY_TABLE": registry_table.table_name,
+                    **build_cache.to_env(),
+                    **compute_sizing.to_env(),
+                    **({"DEPLOY_PROJECT_NAME": project_names['deploy_project_name']} if shared_projects else {}),
+                    **({"FEATURE_PIPELINE_NAME": feature_pipeline_name} if feature_pipeline_name else {})
                 },
                 role=iam_stack.create_branch_role)
+            lambda_settings.invocation_target(create_branch_func).add_event_source(SqsEventSource(
+                create_branch_events.queue,
+                batch_size=event_batch_size,
+                max_batching_window=Duration.seconds(5),
+                report_batch_item_failures=True))
 
-            # Configure AWS CodeCommit to trigger the Lambda function when new branch is created
+            # Configure AWS CodeCommit to queue an event for the Lambda function when new branch is created
             repo.on_reference_created(
                 'BranchCreateTrigger',
                 description="AWS CodeCommit reference created event.",
-                target=LambdaFunction(create_branch_func))
+                target=SqsQueue(create_branch_events.queue))
 
             # AWS Lambda function triggered upon branch deletion
+            destroy_branch_env = {
+                "ACCOUNT_ID": dev_account_id,
+                "CODE_BUILD_ROLE_ARN": iam_stack.code_build_role.role_arn,
+                "ARTIFACT_BUCKET": artifact_bucket.bucket_name,
+                "CODEBUILD_NAME_PREFIX": codebuild_prefix,
+                "DEFAULT_BRANCH": default_branch,
+                "DEV_STAGE_NAME": f'{dev_stage_name}-{dev_stage.main_stack_name}',
+                "REGISTRY_TABLE": registry_table.table_name,
+                **build_cache.to_env(),
+                **compute_sizing.to_env(),
+                **({"DESTROY_PROJECT_NAME": project_names['destroy_project_name']} if shared_projects else {}),
+                **({"FEATURE_PIPELINE_NAME": feature_pipeline_name} if feature_pipeline_name else {})
+            }
             destroy_branch_func = Function(
                 self,
                 'LambdaTriggerDestroyBranch',
-                runtime=Runtime.PYTHON_3_9,
                 function_name='LambdaTriggerDestroyBranch',
                 handler='destroy_branch.handler',
                 role=iam_stack.delete_branch_role,
+                timeout=handler_timeout,
                 environment={
-                    "ACCOUNT_ID": dev_account_id,
-                    "CODE_BUILD_ROLE_ARN": iam_stack.code_build_role.role_arn,
-                    "ARTIFACT_BUCKET": artifact_bucket.bucket_name,
-                    "CODEBUILD_NAME_PREFIX": codebuild_prefix,
-                    "DEV_STAGE_NAME": f'{dev_stage_name}-{dev_stage.main_stack_name}'
+                    **destroy_branch_env,
+                    "MAX_CONCURRENCY": str(event_concurrency)
                 },
-                code=Code.from_asset(path.join(this_dir,
-                                               'code')))
+                code=Code.from_asset(code_dir, exclude=package_excludes(code_dir, 'destroy_branch')),
+                **lambda_settings.function_args())
+            lambda_settings.invocation_target(destroy_branch_func).add_event_source(SqsEventSource(
+                destroy_branch_events.queue,
+                batch_size=event_batch_size,
+                max_batching_window=Duration.seconds(5),
+                report_batch_item_failures=True))
 
-            # Configure AWS CodeCommit to trigger the Lambda function when a branch is deleted
+            # Configure AWS CodeCommit to queue an event for the Lambda function when a branch is deleted
             repo.on_reference_deleted(
                 'BranchDeleteTrigger',
                 description="AWS CodeCommit reference deleted event.",
-                target=LambdaFunction(destroy_branch_func))
+                target=SqsQueue(destroy_branch_events.queue))
+
+            if metrics['dashboard']:
+                # Branch lifecycle latency and failure rate reported by the Lambda functions and CodeBuild builds
+                BranchMetricsDashboard(
+                    self,
+                    'BranchMetrics',
+                    dashboard_name=f'{repo_name}-branch-lifecycle',
+                    provisioning_latency_threshold=Duration.minutes(metrics['provisioning_latency_minutes']),
+                    teardown_latency_threshold=Duration.minutes(metrics['teardown_latency_minutes']),
+                    failure_rate_threshold=metrics['failure_rate_percent'],
+                    dead_letter_queues={
+                        'BranchCreateEvents': create_branch_events.dead_letter_queue,
+                        'BranchDestroyEvents': destroy_branch_events.dead_letter_queue
+                    })
+
+            if reaper['enabled']:
+                # Scheduled AWS Lambda function tearing down orphaned and idle branch environments
+                reaper_func = Function(
+                    self,
+                    'LambdaReapBranches',
+                    runtime=Runtime.PYTHON_3_9,
+                    function_name='LambdaReapBranches',
+                    handler='reap_branches.handler',
+                    role=iam_stack.reaper_role,
+                    timeout=Duration.minutes(15),
+                    environment={
+                        **destroy_branch_env,
+                        "REPOSITORY_NAME": repo_name,
+                        "PIPELINE_STACK_PREFIX": 'cdk-pipelines-multi-branch',
+                        "IDLE_DAYS": str(reaper['idle_days']),
+                        "MAX_CONCURRENCY": str(reaper['max_concurrency']),
+                        "DRY_RUN": str(reaper['dry_run']).lower()
+                    },
+                    code=Code.from_asset(code_dir, exclude=package_excludes(code_dir, 'reap_branches')))
+
+                Rule(
+                    self,
+                    'BranchReaperSchedule',
+                    description="Tears down orphaned and idle branch environments.",
+                    schedule=Schedule.rate(Duration.hours(reaper['interval_hours'])),
+                    targets=[LambdaFunction(reaper_func)])
+
+            if event_triggers or feature_pipeline_name:
+                # AWS Lambda function starting the branch pipelines on commits which touch deployable code.
+                # The shared feature pipeline has no branch to poll, so its commits are always event triggered.
+                pipeline_trigger_func = Function(
+                    self,
+                    'LambdaTriggerPipeline',
+                    runtime=Runtime.PYTHON_3_9,
+                    function_name='LambdaTriggerPipeline',
+                    handler='pipeline_trigger.handler',
+                    role=iam_stack.pipeline_trigger_role,
+                    timeout=Duration.minutes(1),
+                    environment={
+                        "DEFAULT_BRANCH": default_branch,
+                        "PIPELINE_NAME_PREFIX": pipeline_name_prefix,
+                        "TRIGGER_DEFAULT_BRANCH": str(event_triggers).lower(),
+                        **({"FEATURE_PIPELINE_NAME": feature_pipeline_name,
+                            "REGISTRY_TABLE": registry_table.table_name} if feature_pipeline_name else {}),
+                        "DEFAULT_BRANCH_INCLUDE": pipeline_triggers.get('default_branch_include', ''),
+                        "DEFAULT_BRANCH_EXCLUDE": pipeline_triggers.get('default_branch_exclude', ''),
+                        "FEATURE_BRANCH_INCLUDE": pipeline_triggers.get('feature_branch_include', ''),
+                        "FEATURE_BRANCH_EXCLUDE": pipeline_triggers.get('feature_branch_exclude', '')
+                    },
+                    code=Code.from_asset(code_dir, exclude=package_excludes(code_dir, 'pipeline_trigger')))
+
+                # Configure AWS CodeCommit to trigger the Lambda function when a branch is updated
+                repo.on_event(
+                    'BranchUpdateTrigger',
+                    description="AWS CodeCommit reference updated event.",
+                    event_pattern=EventPattern(detail={
+                        'event': ['referenceUpdated'],
+                        'referenceType': ['branch']
+                    }),
+                    target=LambdaFunction(pipeline_trigger_func))
+
+        # build the pipeline now rather than lazily during synthesis, so aspects see the complete construct tree
+        pipeline.build_pipeline()
+
+        if build_cache.enabled:
+            synth_project = pipeline.synth_project
+            if build_cache.mode == 's3':
+                cache_bucket = S3Construct(self, 'BuildCache', dict(
+                    encryption=BucketEncryption.KMS_MANAGED,
+                    removal_policy=RemovalPolicy.DESTROY,
+                    auto_delete_objects=True
+                )).bucket
+                cache_bucket.grant_read_write(synth_project)
+                synth_cache = CfnProject.ProjectCacheProperty(type='S3', location=f'{cache_bucket.bucket_name}/synth')
+            else:
+                synth_cache = CfnProject.ProjectCacheProperty(type='LOCAL', modes=['LOCAL_CUSTOM_CACHE'])
+            synth_project.node.default_child.cache = synth_cache
 
         # CDK Nag supressions
         NagSuppressions.add_stack_suppressions(self, [
@@ -0,0 +1,54 @@
+"""
+AWS SDK clients of the branch Lambda functions, created on first use.
+
+The branch functions run rarely, so nearly every invocation is a cold start. Importing boto3 and loading
+the service models takes a large share of it, and a module-level client pays it even when an event is
+skipped before any call of that service. A lazy client defers both to the first API call and is shared by
+the worker threads of the batch. The clients use short timeouts and a connection pool sized for the worker
+threads; throttled calls are retried by the AdaptiveBackoff of branch_events, so the SDK retries only once.
+
+Under SnapStart the clients are created during the initialization instead, so they are part of the snapshot.
+"""
+import os
+import threading
+
+CONNECT_TIMEOUT = 3
+READ_TIMEOUT = 20
+MAX_ATTEMPTS = 2
+
+
+def client_config(max_pool_connections: int = None):
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={'mode': 'standard', 'max_attempts': MAX_ATTEMPTS},
+        max_pool_connections=max_pool_connections or int(os.environ.get('MAX_CONCURRENCY', '4')) + 2)
+
+
+class LazyClient:
+    """Proxy creating the boto3 client of the service on the first attribute access"""
+
+    def __init__(self, service_name: str) -> None:
+        self.service_name = service_name
+        self._client = None
+        self._lock = threading.Lock()
+        if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'snap-start':
+            self._client = self._create()
+
+    def _create(self):
+        import boto3
+
+        return boto3.client(self.service_name, config=client_config())
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create()
+        return self._client
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
@@ -0,0 +1,119 @@
+"""
+Compact branch build artifact: one deterministic zip bundle of the files the branch teardown needs.
+
+The deploy build publishes the bundle with a manifest of the content hashes of its files, and skips the
+upload if the manifest of the previous build is identical. The teardown build uses the bundle as its S3
+source. Run from the root of the repository:
+
+    python cdk_pipelines_multi_branch/cicd/code/branch_bundle.py --bucket <artifact bucket> --prefix <branch>/bundle/
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zipfile
+
+from branch_events import error_code
+from path_filter import PathFilter
+
+BUNDLE_NAME = 'branch-bundle.zip'
+MANIFEST_NAME = 'manifest.json'
+# the teardown synthesizes the app again, so it needs the app and its configuration, not cdk.out or dependencies
+BUNDLE_INCLUDE = ['/app.py', '/cdk.json', '/cdk.context.json', '/config.ini', '/requirements*.txt',
+                  '/cdk_pipelines_multi_branch/**']
+BUNDLE_EXCLUDE = ['**/__pycache__/**', '*.pyc']
+SKIPPED_DIRECTORIES = {'.git', 'cdk.out', 'node_modules', '.venv', '__pycache__'}
+# zip entries get a fixed timestamp, so unchanged files give a byte identical bundle
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def bundle_prefix(branch: str) -> str:
+    return f'{branch}/bundle/'
+
+
+def bundle_key(branch: str) -> str:
+    return f'{bundle_prefix(branch)}{BUNDLE_NAME}'
+
+
+def collect_files(root: str, path_filter: PathFilter = None) -> list:
+    """Sorted paths relative to root of the files to bundle"""
+    path_filter = path_filter or PathFilter(BUNDLE_INCLUDE, BUNDLE_EXCLUDE)
+    files = []
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in SKIPPED_DIRECTORIES]
+        for name in names:
+            path = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+            if path_filter.matches(path):
+                files.append(path)
+    return sorted(files)
+
+
+def file_manifest(root: str, files: list) -> dict:
+    manifest = {}
+    for path in files:
+        with open(os.path.join(root, path), 'rb') as f:
+            manifest[path] = hashlib.sha256(f.read()).hexdigest()
+    digest = hashlib.sha256(''.join(f'{path} {sha}\n' for path, sha in sorted(manifest.items())).encode())
+    return {'digest': digest.hexdigest(), 'files': manifest}
+
+
+def write_bundle(root: str, files: list, bundle_file: str) -> None:
+    with zipfile.ZipFile(bundle_file, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as bundle:
+        for path in files:
+            info = zipfile.ZipInfo(path, date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            mode = 0o755 if os.access(os.path.join(root, path), os.X_OK) else 0o644
+            info.external_attr = mode << 16
+            with open(os.path.join(root, path), 'rb') as f:
+                bundle.writestr(info, f.read())
+
+
+def previous_manifest(s3, bucket: str, prefix: str):
+    try:
+        return json.load(s3.get_object(Bucket=bucket, Key=f'{prefix}{MANIFEST_NAME}')['Body'])
+    except Exception as e:
+        if error_code(e) in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def publish(s3, bucket: str, prefix: str, root: str = '.') -> dict:
+    """Uploads the bundle and its manifest unless the previous manifest is identical"""
+    start = time.perf_counter()
+    files = collect_files(root)
+    manifest = file_manifest(root, files)
+    previous = previous_manifest(s3, bucket, prefix)
+    result = {'files': len(files), 'digest': manifest['digest'], 'uploaded': False}
+
+    if previous is None or previous.get('digest') != manifest['digest']:
+        with tempfile.TemporaryDirectory() as work_dir:
+            bundle_file = os.path.join(work_dir, BUNDLE_NAME)
+            write_bundle(root, files, bundle_file)
+            result['bytes'] = os.path.getsize(bundle_file)
+            s3.upload_file(bundle_file, bucket, f'{prefix}{BUNDLE_NAME}',
+                           ExtraArgs={'Metadata': {'manifest-digest': manifest['digest']}})
+        # the manifest is written last, so it never describes a bundle which was not uploaded
+        s3.put_object(Bucket=bucket, Key=f'{prefix}{MANIFEST_NAME}', Body=json.dumps(manifest).encode(),
+                      ContentType='application/json')
+        result['uploaded'] = True
+
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    import boto3
+
+    parser = argparse.ArgumentParser(description='Publish the branch bundle to S3.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', required=True, help='e.g. <branch>/bundle/')
+    parser.add_argument('--root', default='.')
+    args = parser.parse_args()
+
+    print(json.dumps(publish(boto3.client('s3'), args.bucket, args.prefix, args.root)))
+
+
+if __name__ == '__main__':
+    main()
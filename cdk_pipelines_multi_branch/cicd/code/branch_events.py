@@ -0,0 +1,85 @@
+"""
+Batch processing of the CodeCommit reference events delivered to the branch Lambda functions through Amazon SQS.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger()
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'AccountLimitExceededException'
+}
+
+
+def error_code(error: Exception) -> str:
+    """Returns the error code of a botocore ClientError, None for any other exception"""
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+class AdaptiveBackoff:
+    """
+    Retries throttled API calls. The delay is shared by all worker threads: it doubles on every
+    throttled call and halves on every successful one, so the batch slows down as a whole.
+    """
+
+    def __init__(self, base_delay: float = 0.2, max_delay: float = 10.0, max_attempts: int = 8) -> None:
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.delay = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def call(self, operation, **kwargs):
+        for attempt in range(1, self.max_attempts + 1):
+            if self.delay:
+                time.sleep(self.delay * random.uniform(0.5, 1.0))
+            try:
+                result = operation(**kwargs)
+            except Exception as e:
+                if error_code(e) not in THROTTLING_ERROR_CODES or attempt == self.max_attempts:
+                    raise
+                with self._lock:
+                    self.throttled += 1
+                    self.delay = min(max(self.delay * 2, self.base_delay), self.max_delay)
+                continue
+            with self._lock:
+                self.delay = self.delay / 2 if self.delay > self.base_delay else 0.0
+            return result
+
+
+def reference_events(event: dict) -> list:
+    """Returns (message id, EventBridge event) pairs of an SQS batch or of a single EventBridge event"""
+    if 'Records' not in event:
+        return [(None, event)]
+    return [(record['messageId'], json.loads(record['body'])) for record in event['Records']]
+
+
+def process_batch(event: dict, process, max_workers: int) -> dict:
+    """
+    Processes the reference events with at most max_workers concurrent calls of process and returns
+    the failed messages in the partial batch response format of the SQS event source.
+    """
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(process, reference_event): message_id
+                   for message_id, reference_event in reference_events(event)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error('Failed to process message %s: %s', futures[future], e)
+                failures.append(futures[future])
+
+    if failures and failures[0] is None:
+        # direct invocation by EventBridge, let the asynchronous invocation retry
+        raise RuntimeError('Failed to process the reference event')
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
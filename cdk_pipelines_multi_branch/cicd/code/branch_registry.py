@@ -0,0 +1,329 @@
+"""
+Registry of the branch environments with conditional state transitions.
+
+Each branch has one record: its state (CREATING, READY, FAILED, DESTROYING or DESTROYED), the time of the
+branch event which caused the state and the id of the build started for it. Records are written with a
+compare-and-set on their version, so concurrent, duplicate or out-of-order event deliveries cannot
+overwrite a newer state. While a handler processes an event it holds a lease on the record, so concurrent
+deliveries of the event are skipped; a failed attempt releases it for the retry. Destroyed branches are
+kept as tombstones for TOMBSTONE_TTL seconds, so a late duplicate of the delete event is still recognized.
+The record also keeps the samples of the recent deploy and teardown builds the compute sizing uses. The
+samples of all branches are also kept in one aggregate record of the repository, which the compute sizing
+falls back to for branches without builds of their own, e.g. every new branch.
+
+The backend is DynamoDB in the deployed stack, InMemoryBackend or SQLiteBackend locally:
+
+    python branch_registry.py --table <registry table> list
+    python branch_registry.py --sqlite registry.db list --state READY
+
+The check command exits with 1 if a newer event of the branch superseded the event, so a build skips it.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from aws_clients import LazyClient
+from branch_events import error_code
+from compute_sizing import HISTORY_SIZE, BuildSample, measure_build
+
+CREATING = 'CREATING'
+READY = 'READY'
+FAILED = 'FAILED'
+DESTROYING = 'DESTROYING'
+DESTROYED = 'DESTROYED'
+STATES = (CREATING, READY, FAILED, DESTROYING, DESTROYED)
+TOMBSTONE_TTL = 7 * 86400
+# longer than the timeout of the branch Lambda functions
+LEASE_SECONDS = 180
+MAX_WRITE_ATTEMPTS = 5
+# key of the aggregate build history record, a colon is not allowed in git branch names
+AGGREGATE_BRANCH = ':builds'
+
+
+class ConditionFailed(Exception):
+    """The record was changed since it was read"""
+
+
+class InMemoryBackend:
+
+    def __init__(self) -> None:
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, branch: str):
+        with self._lock:
+            item = self._items.get(branch)
+            return dict(item) if item else None
+
+    def put(self, item: dict, expected_version) -> None:
+        with self._lock:
+            current = self._items.get(item['branch'])
+            if (current['version'] if current else None) != expected_version:
+                raise ConditionFailed(item['branch'])
+            self._items[item['branch']] = dict(item)
+
+    def scan(self):
+        with self._lock:
+            return [dict(item) for item in self._items.values()]
+
+
+class SQLiteBackend:
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS registry '
+                                 '(branch TEXT PRIMARY KEY, version INTEGER NOT NULL, item TEXT NOT NULL)')
+        self._lock = threading.Lock()
+
+    def get(self, branch: str):
+        with self._lock:
+            row = self._connection.execute('SELECT item FROM registry WHERE branch = ?', (branch,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, item: dict, expected_version) -> None:
+        with self._lock:
+            if expected_version is None:
+                try:
+                    self._connection.execute('INSERT INTO registry VALUES (?, ?, ?)',
+                                             (item['branch'], item['version'], json.dumps(item)))
+                except sqlite3.IntegrityError:
+                    raise ConditionFailed(item['branch'])
+                return
+            cursor = self._connection.execute(
+                'UPDATE registry SET version = ?, item = ? WHERE branch = ? AND version = ?',
+                (item['version'], json.dumps(item), item['branch'], expected_version))
+            if cursor.rowcount != 1:
+                raise ConditionFailed(item['branch'])
+
+    def scan(self):
+        with self._lock:
+            return [json.loads(row[0]) for row in self._connection.execute('SELECT item FROM registry')]
+
+
+class DynamoDBBackend:
+    """Records are items with the branch as partition key, expires_at is the TTL attribute of tombstones"""
+
+    NUMBER_ATTRIBUTES = ('version', 'event_time', 'updated_at', 'expires_at', 'lease_expires')
+
+    def __init__(self, table_name: str, client=None) -> None:
+        self.table_name = table_name
+        self.client = client if client is not None else LazyClient('dynamodb')
+
+    def get(self, branch: str):
+        response = self.client.get_item(TableName=self.table_name, Key={'branch': {'S': branch}}, ConsistentRead=True)
+        return self._from_item(response['Item']) if 'Item' in response else None
+
+    def put(self, item: dict, expected_version) -> None:
+        if expected_version is None:
+            condition = {'ConditionExpression': 'attribute_not_exists(branch)'}
+        else:
+            condition = {'ConditionExpression': 'version = :version',
+                         'ExpressionAttributeValues': {':version': {'N': str(expected_version)}}}
+        try:
+            self.client.put_item(TableName=self.table_name, Item=self._to_item(item), **condition)
+        except Exception as e:
+            if error_code(e) == 'ConditionalCheckFailedException':
+                raise ConditionFailed(item['branch'])
+            raise
+
+    def scan(self):
+        items = []
+        for page in self.client.get_paginator('scan').paginate(TableName=self.table_name, ConsistentRead=True):
+            items += [self._from_item(item) for item in page['Items']]
+        return items
+
+    def _to_item(self, record: dict) -> dict:
+        return {key: {'N': str(value)} if key in self.NUMBER_ATTRIBUTES else {'S': value}
+                for key, value in record.items() if value is not None}
+
+    def _from_item(self, item: dict) -> dict:
+        return {key: int(value['N']) if 'N' in value else value['S'] for key, value in item.items()}
+
+
+class BranchRegistry:
+
+    def __init__(self, backend) -> None:
+        self.backend = backend
+
+    @classmethod
+    def from_env(cls, environ: dict):
+        """Registry of the REGISTRY_TABLE DynamoDB table, None if the variable is not set"""
+        table_name = environ.get('REGISTRY_TABLE')
+        return cls(DynamoDBBackend(table_name)) if table_name else None
+
+    def get(self, branch: str):
+        return self.backend.get(branch)
+
+    def list(self, state: str = None) -> list:
+        now = time.time()
+        records = [r for r in self.backend.scan()
+                   if r['branch'] != AGGREGATE_BRANCH and r.get('expires_at', now + 1) > now]
+        return sorted((r for r in records if state is None or r['state'] == state), key=lambda r: r['branch'])
+
+    def is_current(self, branch: str, event_time: int) -> bool:
+        """Whether the event at event_time is still the latest event of the branch, i.e. not superseded"""
+        current = self.backend.get(branch)
+        return bool(current) and current['event_time'] == event_time
+
+    def begin(self, branch: str, state: str, event_time: int):
+        """
+        Moves the branch to CREATING or DESTROYING for the branch event at event_time. Returns the new record,
+        or None if the event is a duplicate or older than the event of the current record and must be skipped.
+        """
+        def transition(current):
+            if current:
+                if current['event_time'] > event_time:
+                    return None
+                if current['event_time'] == event_time:
+                    # the retry of an event which failed before its build was started proceeds
+                    retry = current['state'] == state and not current.get('build_id') and \
+                        current.get('lease_expires', 0) <= time.time()
+                    # a branch created and deleted within the same second
+                    same_second_delete = state == DESTROYING and current['state'] in (CREATING, READY, FAILED)
+                    if not retry and not same_second_delete:
+                        return None
+            return {'branch': branch, 'state': state, 'event_time': event_time,
+                    'lease_expires': int(time.time()) + LEASE_SECONDS,
+                    'history': current.get('history') if current else None}
+
+        return self._update(branch, transition)
+
+    def release(self, branch: str, event_time: int):
+        """Releases the lease of a failed attempt, so the retry of the event does not wait for it to expire"""
+        def transition(current):
+            if not current or current['event_time'] != event_time or current.get('build_id'):
+                return None
+            return dict(current, lease_expires=0)
+
+        return self._update(branch, transition)
+
+    def set_build(self, branch: str, event_time: int, build_id: str):
+        """Records the build started for the event, which makes later deliveries of the event duplicates"""
+        def transition(current):
+            if not current or current['event_time'] != event_time:
+                return None
+            return dict(current, build_id=build_id, lease_expires=0)
+
+        return self._update(branch, transition)
+
+    def finish(self, branch: str, event_time: int, succeeded: bool, sample: BuildSample = None):
+        """
+        Completes the transition of the event when its build ended, unless a newer event superseded it.
+        The sample of the build is added to the build history of the state and to the aggregate history.
+        """
+        def transition(current):
+            if not current or current['event_time'] != event_time or current['state'] not in (CREATING, DESTROYING):
+                return None
+            record = dict(current)
+            if sample:
+                record['history'] = self._add_sample(current.get('history'), current['state'], sample)
+            if current['state'] == CREATING:
+                return dict(record, state=READY if succeeded else FAILED)
+            if succeeded:
+                return dict(record, state=DESTROYED, expires_at=int(time.time()) + TOMBSTONE_TTL)
+            return record if sample else None
+
+        record = self._update(branch, transition)
+        if sample and record:
+            state = CREATING if record['state'] in (READY, FAILED) else DESTROYING
+            self._update(AGGREGATE_BRANCH, lambda current: {
+                'branch': AGGREGATE_BRANCH,
+                'state': READY,
+                'event_time': 0,
+                'history': self._add_sample(current.get('history') if current else None, state, sample)
+            })
+        return record
+
+    @staticmethod
+    def _add_sample(history: str, state: str, sample: BuildSample) -> str:
+        history = json.loads(history or '{}')
+        history[state] = (history.get(state, []) + [sample.to_dict()])[-HISTORY_SIZE:]
+        return json.dumps(history, sort_keys=True)
+
+    def sizing_history(self, record: dict, state: str) -> list:
+        """
+        Samples the compute sizing of the next build of the record for state is based on: the builds of the
+        branch, or the recent builds of all branches if the branch has none
+        """
+        samples = self.build_history(record, state)
+        return samples or self.build_history(self.backend.get(AGGREGATE_BRANCH), state)
+
+    @staticmethod
+    def build_history(record: dict, state: str) -> list:
+        """Samples of the recent builds of the record for state (CREATING or DESTROYING), oldest first"""
+        history = json.loads(record.get('history') or '{}') if record else {}
+        return [BuildSample.from_dict(sample) for sample in history.get(state, [])]
+
+    def _update(self, branch: str, transition):
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            current = self.backend.get(branch)
+            record = transition(current)
+            if record is None:
+                return None
+            record.update(version=current['version'] + 1 if current else 1, updated_at=int(time.time()))
+            try:
+                self.backend.put(record, current['version'] if current else None)
+                return record
+            except ConditionFailed:
+                continue
+        raise ConditionFailed(branch)
+
+
+def finish_command(table_name: str, branch: str, event_time: int, compute_type: str = None) -> str:
+    """post_build command of the generated buildspecs completing the registry transition of the build"""
+    script = 'cdk_pipelines_multi_branch/cicd/code/branch_registry.py'
+    sample = f' --compute-type {compute_type}' if compute_type else ''
+    # a registry write error is logged, but does not fail the deploy or teardown
+    return (f'if [ -f {script} ]; then python {script} --table {table_name} finish --branch {branch} '
+            f'--event-time {event_time} --succeeded ${{CODEBUILD_BUILD_SUCCEEDING:-0}}{sample} || true; fi')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='List and update the branch environment registry.')
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument('--table', help='DynamoDB table')
+    backend.add_argument('--sqlite', help='SQLite database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    list_parser = commands.add_parser('list')
+    list_parser.add_argument('--state', choices=STATES)
+    list_parser.add_argument('--json', action='store_true')
+    finish_parser = commands.add_parser('finish')
+    finish_parser.add_argument('--branch', required=True)
+    finish_parser.add_argument('--event-time', type=int, required=True)
+    finish_parser.add_argument('--succeeded', type=int, required=True)
+    finish_parser.add_argument('--compute-type', help='records a sample of the running CodeBuild build')
+    check_parser = commands.add_parser('check')
+    check_parser.add_argument('--branch', required=True)
+    check_parser.add_argument('--event-time', type=int, required=True)
+    args = parser.parse_args()
+
+    registry = BranchRegistry(DynamoDBBackend(args.table) if args.table else SQLiteBackend(args.sqlite))
+    if args.command == 'finish':
+        sample = None
+        if args.compute_type and os.environ.get('CODEBUILD_START_TIME'):
+            sample = measure_build(args.compute_type, bool(args.succeeded))
+        record = registry.finish(args.branch, args.event_time, bool(args.succeeded), sample)
+        print(json.dumps(record) if record else f'{args.branch}: superseded, registry not changed')
+        return
+    if args.command == 'check':
+        if not registry.is_current(args.branch, args.event_time):
+            print(f'{args.branch}: event {args.event_time} superseded by a newer event')
+            sys.exit(1)
+        return
+
+    records = registry.list(args.state)
+    if args.json:
+        print(json.dumps(records, indent=2))
+        return
+    for record in records:
+        event_time = datetime.fromtimestamp(record['event_time'], timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        print(f"{record['branch']:40} {record['state']:10} {event_time} {record.get('build_id', '')}")
+
+
+if __name__ == '__main__':
+    main()
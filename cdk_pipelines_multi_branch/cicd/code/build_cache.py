@@ -0,0 +1,117 @@
+"""
+Build dependency caching shared by the pipeline Synth step and the branch CodeBuild projects.
+
+Dependencies are installed below a cache directory keyed by a hash of the requirements files,
+so a change to requirements*.txt starts from a clean cache instead of an outdated one.
+"""
+import os
+
+STANDARD_IMAGE = 'aws/codebuild/standard:6.0'
+CACHE_ROOT = '/root/.cache/multi-branch'
+CACHE_MODES = ('none', 'local', 's3')
+S3_CACHE_PREFIX = 'build-cache'
+
+
+class BuildCacheSettings:
+
+    def __init__(self, mode: str = 'none', prebuilt_image: str = None) -> None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f'Unknown build cache mode {mode}, expected one of {", ".join(CACHE_MODES)}')
+        self.mode = mode
+        self.prebuilt_image = prebuilt_image or None
+
+    @classmethod
+    def from_config(cls, global_config):
+        """Reads the optional [build_cache] section of config.ini"""
+        return cls(
+            mode=global_config.get('build_cache', 'mode', fallback='none'),
+            prebuilt_image=global_config.get('build_cache', 'prebuilt_image', fallback=None))
+
+    @classmethod
+    def from_env(cls):
+        """Reads the settings passed to the Lambda functions by to_env()"""
+        return cls(
+            mode=os.environ.get('BUILD_CACHE_MODE', 'none'),
+            prebuilt_image=os.environ.get('BUILD_IMAGE'))
+
+    def to_env(self) -> dict:
+        env = {'BUILD_CACHE_MODE': self.mode}
+        if self.prebuilt_image:
+            env['BUILD_IMAGE'] = self.prebuilt_image
+        return env
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != 'none'
+
+    @property
+    def image(self) -> str:
+        return self.prebuilt_image or STANDARD_IMAGE
+
+
+def cache_key_commands() -> list:
+    """Points the pip, npm and gem caches to the directory of the current requirements hash"""
+    return [
+        'export DEPS_HASH=$(cat requirements*.txt | sha256sum | cut -c1-16)',
+        f'export DEPS_CACHE_DIR={CACHE_ROOT}/$DEPS_HASH',
+        f'mkdir -p $DEPS_CACHE_DIR && find {CACHE_ROOT} -mindepth 1 -maxdepth 1 ! -name $DEPS_HASH -exec rm -rf {{}} +',
+        'export PIP_CACHE_DIR=$DEPS_CACHE_DIR/pip',
+        'export npm_config_cache=$DEPS_CACHE_DIR/npm',
+        'export NPM_CONFIG_PREFIX=$DEPS_CACHE_DIR/npm-global',
+        'export GEM_HOME=$DEPS_CACHE_DIR/gems',
+        'export PATH=$NPM_CONFIG_PREFIX/bin:$GEM_HOME/bin:$PATH'
+    ]
+
+
+def install_commands(settings: BuildCacheSettings, cfn_nag: bool = False, requirements: bool = True) -> list:
+    """Commands installing the CDK CLI, the Python requirements (unless disabled) and optionally cfn-nag"""
+    if settings.prebuilt_image:
+        # the image already provides the tools, only the Python requirements can change per commit
+        commands = ['pip install -r requirements.txt'] if requirements else []
+        return commands + ['export LC_ALL="en_US.UTF-8"'] if cfn_nag else commands
+
+    commands = []
+    if settings.enabled:
+        commands += cache_key_commands()
+        if cfn_nag:
+            commands.append('command -v cfn_nag_scan || gem install cfn-nag')
+        commands.append('command -v cdk || npm install -g aws-cdk')
+    else:
+        if cfn_nag:
+            commands.append('gem install cfn-nag')
+        commands.append('npm install -g aws-cdk')
+    if requirements:
+        commands.append('pip install -r requirements.txt')
+    if cfn_nag:
+        commands += [
+            'export LC_ALL="en_US.UTF-8"',
+            'locale -a | grep -qi en_US.utf8 || (locale-gen en_US en_US.UTF-8 && dpkg-reconfigure locales)'
+        ]
+    return commands
+
+
+def cache_paths() -> list:
+    """Paths to declare in the cache section of a buildspec"""
+    return [f'{CACHE_ROOT}/**/*']
+
+
+def build_spec_list(items: list, indent: int = 6) -> str:
+    """Renders items as a YAML list for the generated buildspecs, one item per line"""
+    return ''.join(f'\n{" " * indent}- {item}' for item in items)
+
+
+def build_spec_cache_section(settings: BuildCacheSettings) -> str:
+    """Cache section appended to the generated buildspecs of the branch projects"""
+    if not settings.enabled:
+        return ''
+    paths = build_spec_list([f"'{p}'" for p in cache_paths()], indent=4)
+    return f'\ncache:\n  paths:{paths}'
+
+
+def project_cache(settings: BuildCacheSettings, bucket_name: str) -> dict:
+    """Value of the cache parameter of codebuild create_project/start_build"""
+    if settings.mode == 'local':
+        return {'type': 'LOCAL', 'modes': ['LOCAL_CUSTOM_CACHE']}
+    if settings.mode == 's3':
+        return {'type': 'S3', 'location': f'{bucket_name}/{S3_CACHE_PREFIX}'}
+    return {'type': 'NO_CACHE'}
@@ -0,0 +1,187 @@
+"""
+Compute type sizing of the branch deploy and teardown builds from the recent builds of the branch.
+
+Every build records its duration, its peak memory relative to the memory of its container and its
+compute type in the branch registry. Before the next build of the branch the policy picks the
+smallest compute type which is expected to finish within the target duration without running
+short of memory, bounded by the largest compute type allowed. The policy only depends on its
+samples, so it can be evaluated without AWS.
+"""
+import os
+import statistics
+import time
+
+# compute types in ascending size, with their vCPUs and memory in GiB
+COMPUTE_TYPES = {
+    'BUILD_GENERAL1_SMALL': (2, 3),
+    'BUILD_GENERAL1_MEDIUM': (4, 7),
+    'BUILD_GENERAL1_LARGE': (8, 15)
+}
+SIZING_MODES = ('fixed', 'adaptive')
+HISTORY_SIZE = 5
+# share of the build time which gets faster with more vCPUs, the rest (downloads, CloudFormation) does not
+PARALLEL_FRACTION = 0.5
+
+CGROUP_PEAK_FILES = ('/sys/fs/cgroup/memory.peak', '/sys/fs/cgroup/memory/memory.max_usage_in_bytes')
+CGROUP_LIMIT_FILES = ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')
+
+
+class BuildSample:
+
+    def __init__(self, compute_type: str, duration: float, memory_ratio: float, succeeded: bool) -> None:
+        self.compute_type = compute_type
+        self.duration = duration
+        self.memory_ratio = memory_ratio
+        self.succeeded = succeeded
+
+    @classmethod
+    def from_dict(cls, sample: dict):
+        return cls(sample['compute_type'], sample['duration'], sample['memory_ratio'], sample['succeeded'])
+
+    def to_dict(self) -> dict:
+        return {'compute_type': self.compute_type, 'duration': round(self.duration, 1),
+                'memory_ratio': round(self.memory_ratio, 3), 'succeeded': self.succeeded}
+
+
+class Decision:
+
+    def __init__(self, compute_type: str, reason: str) -> None:
+        self.compute_type = compute_type
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f'Decision(compute_type={self.compute_type!r}, reason={self.reason!r})'
+
+
+def estimated_duration(duration: float, compute_type: str, other: str) -> float:
+    """Duration of a build of compute_type on the other compute type"""
+    speedup = COMPUTE_TYPES[other][0] / COMPUTE_TYPES[compute_type][0]
+    return duration * (1 - PARALLEL_FRACTION + PARALLEL_FRACTION / speedup)
+
+
+def estimated_memory_ratio(memory_ratio: float, compute_type: str, other: str) -> float:
+    return memory_ratio * COMPUTE_TYPES[compute_type][1] / COMPUTE_TYPES[other][1]
+
+
+class SizingPolicy:
+
+    def __init__(self,
+                 mode: str = 'fixed',
+                 default_compute_type: str = 'BUILD_GENERAL1_SMALL',
+                 max_compute_type: str = 'BUILD_GENERAL1_LARGE',
+                 target_minutes: float = 15,
+                 max_memory_percent: float = 80) -> None:
+        if mode not in SIZING_MODES:
+            raise ValueError(f'Unknown compute sizing mode {mode}, expected one of {", ".join(SIZING_MODES)}')
+        for compute_type in (default_compute_type, max_compute_type):
+            if compute_type not in COMPUTE_TYPES:
+                raise ValueError(f'Unknown compute type {compute_type}, expected one of {", ".join(COMPUTE_TYPES)}')
+        self.mode = mode
+        self.default_compute_type = default_compute_type
+        self.max_compute_type = max_compute_type
+        self.target_minutes = target_minutes
+        self.max_memory_percent = max_memory_percent
+
+    @classmethod
+    def from_config(cls, global_config):
+        """Reads the optional [compute_sizing] section of config.ini"""
+        return cls(
+            mode=global_config.get('compute_sizing', 'mode', fallback='fixed'),
+            default_compute_type=global_config.get('compute_sizing', 'default_compute_type',
+                                                   fallback='BUILD_GENERAL1_SMALL'),
+            max_compute_type=global_config.get('compute_sizing', 'max_compute_type', fallback='BUILD_GENERAL1_LARGE'),
+            target_minutes=global_config.getfloat('compute_sizing', 'target_minutes', fallback=15),
+            max_memory_percent=global_config.getfloat('compute_sizing', 'max_memory_percent', fallback=80))
+
+    @classmethod
+    def from_env(cls):
+        """Reads the settings passed to the Lambda functions by to_env()"""
+        return cls(
+            mode=os.environ.get('COMPUTE_SIZING_MODE', 'fixed'),
+            default_compute_type=os.environ.get('DEFAULT_COMPUTE_TYPE', 'BUILD_GENERAL1_SMALL'),
+            max_compute_type=os.environ.get('MAX_COMPUTE_TYPE', 'BUILD_GENERAL1_LARGE'),
+            target_minutes=float(os.environ.get('TARGET_BUILD_MINUTES', '15')),
+            max_memory_percent=float(os.environ.get('MAX_MEMORY_PERCENT', '80')))
+
+    def to_env(self) -> dict:
+        return {
+            'COMPUTE_SIZING_MODE': self.mode,
+            'DEFAULT_COMPUTE_TYPE': self.default_compute_type,
+            'MAX_COMPUTE_TYPE': self.max_compute_type,
+            'TARGET_BUILD_MINUTES': str(self.target_minutes),
+            'MAX_MEMORY_PERCENT': str(self.max_memory_percent)
+        }
+
+    @property
+    def adaptive(self) -> bool:
+        return self.mode == 'adaptive'
+
+    @property
+    def allowed(self) -> list:
+        """Compute types from the smallest up to max_compute_type"""
+        names = list(COMPUTE_TYPES)
+        return names[:names.index(self.max_compute_type) + 1]
+
+    def fits(self, samples: list, compute_type: str) -> bool:
+        """Whether the median build of the samples is expected to meet both targets on compute_type"""
+        duration = statistics.median(estimated_duration(s.duration, s.compute_type, compute_type) for s in samples)
+        memory_ratio = max(estimated_memory_ratio(s.memory_ratio, s.compute_type, compute_type) for s in samples)
+        return duration <= self.target_minutes * 60 and memory_ratio * 100 <= self.max_memory_percent
+
+    def choose(self, samples: list) -> Decision:
+        """Compute type of the next build, samples are the recent builds, oldest first"""
+        if self.mode == 'fixed':
+            return Decision(self.default_compute_type, 'fixed compute type')
+        samples = [s for s in samples[-HISTORY_SIZE:] if s.compute_type in COMPUTE_TYPES]
+        if not samples:
+            return Decision(self.default_compute_type, 'no build history')
+
+        last = samples[-1]
+        allowed = self.allowed
+        if not last.succeeded and last.memory_ratio * 100 > self.max_memory_percent:
+            # the build likely ran out of memory, its duration says nothing about the next one
+            bigger = [t for t in allowed if COMPUTE_TYPES[t][1] > COMPUTE_TYPES[last.compute_type][1]]
+            if bigger:
+                return Decision(bigger[0], f'last build failed at {last.memory_ratio:.0%} memory')
+            return Decision(allowed[-1], f'last build failed at {last.memory_ratio:.0%} memory, at the maximum')
+
+        succeeded = [s for s in samples if s.succeeded]
+        if not succeeded:
+            return Decision(last.compute_type if last.compute_type in allowed else allowed[-1],
+                            'no successful build in the history')
+        for compute_type in allowed:
+            if self.fits(succeeded, compute_type):
+                return Decision(compute_type, f'smallest compute type expected within {self.target_minutes:g} '
+                                              f'minutes and {self.max_memory_percent:g}% memory')
+        return Decision(allowed[-1], 'no compute type meets the targets, using the largest allowed')
+
+
+def read_cgroup_value(files: tuple):
+    for name in files:
+        try:
+            with open(name) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            return int(value)
+    return None
+
+
+def memory_ratio() -> float:
+    """Peak memory of the build container relative to its memory limit, 0 if the cgroup does not tell"""
+    peak = read_cgroup_value(CGROUP_PEAK_FILES)
+    limit = read_cgroup_value(CGROUP_LIMIT_FILES)
+    if not peak:
+        return 0.0
+    if not limit or limit >= 1 << 60:
+        # no limit set on the container, the host memory is the limit
+        limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    return peak / limit
+
+
+def measure_build(compute_type: str, succeeded: bool) -> BuildSample:
+    """Sample of the running CodeBuild build, CODEBUILD_START_TIME is in milliseconds since the epoch"""
+    start = int(os.environ.get('CODEBUILD_START_TIME', '0')) / 1000
+    duration = time.time() - start if start else 0.0
+    return BuildSample(compute_type, duration, memory_ratio(), succeeded)
@@ -3,79 +3,191 @@ Lambda function code used to create a CodeBuild project which deploys the CDK pi
 """
 import logging
 import os
+import time
 
-import boto3
+from aws_clients import LazyClient
+from branch_bundle import bundle_prefix
+from branch_events import AdaptiveBackoff, error_code, process_batch
+from branch_registry import CREATING, BranchRegistry, finish_command
+from build_cache import BuildCacheSettings, build_spec_cache_section, build_spec_list, install_commands, project_cache
+from compute_sizing import SizingPolicy
+from feature_pipeline import DEPLOY, start_execution
+from metrics import MetricsRecorder, build_metrics_command, event_timestamp
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-client = boto3.client('codebuild')
+client = LazyClient('codebuild')
+codepipeline = LazyClient('codepipeline')
 region = os.environ['AWS_REGION']
 account_id = os.environ['ACCOUNT_ID']
 role_arn = os.environ['CODE_BUILD_ROLE_ARN']
 artifact_bucket_name = os.environ['ARTIFACT_BUCKET']
 codebuild_name_prefix = os.environ['CODEBUILD_NAME_PREFIX']
+default_branch = os.environ['DEFAULT_BRANCH']
+build_cache = BuildCacheSettings.from_env()
+max_concurrency = int(os.environ.get('MAX_CONCURRENCY', '4'))
+deploy_project_name = os.environ.get('DEPLOY_PROJECT_NAME')
+feature_pipeline_name = os.environ.get('FEATURE_PIPELINE_NAME')
+artifact_format = os.environ.get('ARTIFACT_FORMAT', 'bundle')
+registry_table = os.environ.get('REGISTRY_TABLE')
+registry = BranchRegistry.from_env(os.environ)
+sizing_policy = SizingPolicy.from_env()
+backoff = AdaptiveBackoff()
 
 
-def generate_build_spec(branch: str):
+def bundle_command(branch: str) -> str:
+    """Publishes the branch bundle, source versions without the bundle script upload the workspace instead"""
+    script = 'cdk_pipelines_multi_branch/cicd/code/branch_bundle.py'
+    return (f'if [ -f {script} ]; then '
+            f'python {script} --bucket {artifact_bucket_name} --prefix {bundle_prefix(branch)}; '
+            f'else aws s3 sync . s3://{artifact_bucket_name}/{branch}/{codebuild_name_prefix}-{branch}-create/ '
+            f'--only-show-errors; fi')
+
+
+def post_build_commands(branch: str, event_time: int, compute_type: str = None) -> list:
+    commands = [bundle_command(branch)] if artifact_format == 'bundle' else []
+    if registry_table:
+        commands.append(finish_command(registry_table, branch, event_time, compute_type))
+    return commands + [build_metrics_command('CreateBranch', 'ProvisioningLatency', event_time)]
+
+
+def artifacts_section() -> str:
+    """The legacy format uploads the whole workspace as build artifacts, the bundle is uploaded in post_build"""
+    if artifact_format == 'bundle':
+        return ''
+    return """
+artifacts:
+  files:
+    - '**/*'"""
+
+
+def build_artifacts(branch: str, name: str = None) -> dict:
+    if artifact_format == 'bundle':
+        return {'type': 'NO_ARTIFACTS'}
+    artifacts = {
+        'type': 'S3',
+        'location': artifact_bucket_name,
+        'path': f'{branch}',
+        'packaging': 'NONE',
+        'artifactIdentifier': 'BranchBuildArtifact'
+    }
+    return dict(artifacts, name=name) if name else artifacts
+
+
+def generate_build_spec(branch: str, event_time: int, compute_type: str = None):
     """Generates the build spec file used for the CodeBuild project"""
     return f"""version: 0.2
 env:
   variables:
     BRANCH: {branch}
+    DEFAULT_BRANCH: {default_branch}
     DEV_ACCOUNT_ID: {account_id}
     PROD_ACCOUNT_ID: {account_id}
     REGION: {region}
 phases:
   pre_build:
-    commands:
-      - npm install -g aws-cdk && pip install -r requirements.txt
+    commands:{build_spec_list(install_commands(build_cache))}
   build:
     commands:
       - cdk synth
       - cdk deploy --require-approval=never
-artifacts:
-  files:
-    - '**/*'"""
+  post_build:
+    commands:{build_spec_list(post_build_commands(branch, event_time, compute_type))}{artifacts_section()}\
+{build_spec_cache_section(build_cache)}"""
 
 
-def handler(event, context):
-    """Lambda function handler"""
-    logger.info(event)
+def start_deploy_build(branch: str, repo_name: str, build_spec: str, compute_type: str,
+                       metrics: MetricsRecorder) -> str:
+    """Starts the build deploying the pipeline of the branch, returns the build id"""
+    project_name = f'{codebuild_name_prefix}-{branch}-create'
 
-    reference_type = event['detail']['referenceType']
+    if deploy_project_name:
+        # shared deploy project: the branch specific settings are passed per build
+        with metrics.time('StartBuildLatency'):
+            response = backoff.call(
+                client.start_build,
+                projectName=deploy_project_name,
+                sourceVersion=f'refs/heads/{branch}',
+                buildspecOverride=build_spec,
+                computeTypeOverride=compute_type,
+                environmentVariablesOverride=[{'name': 'BRANCH', 'value': branch, 'type': 'PLAINTEXT'}],
+                artifactsOverride=build_artifacts(branch, name=project_name)
+            )
+        return response['build']['id']
 
     try:
-        if reference_type == 'branch':
-            branch = event['detail']['referenceName']
-            repo_name = event['detail']['repositoryName']
-
-            client.create_project(
-                name=f'{codebuild_name_prefix}-{branch}-create',
+        with metrics.time('CreateProjectLatency'):
+            backoff.call(
+                client.create_project,
+                name=project_name,
                 description="Build project to deploy branch pipeline",
                 source={
                     'type': 'CODECOMMIT',
                     'location': f'https://git-codecommit.{region}.amazonaws.com/v1/repos/{repo_name}',
-                    'buildspec': generate_build_spec(branch)
+                    'buildspec': build_spec
                 },
                 sourceVersion=f'refs/heads/{branch}',
-                artifacts={
-                    'type': 'S3',
-                    'location': artifact_bucket_name,
-                    'path': f'{branch}',
-                    'packaging': 'NONE',
-                    'artifactIdentifier': 'BranchBuildArtifact'
-                },
+                artifacts=build_artifacts(branch),
                 environment={
                     'type': 'LINUX_CONTAINER',
-                    'image': 'aws/codebuild/standard:6.0',
-                    'computeType': 'BUILD_GENERAL1_SMALL'
+                    'image': build_cache.image,
+                    'computeType': compute_type
                 },
+                cache=project_cache(build_cache, artifact_bucket_name),
                 serviceRole=role_arn
             )
-
-            client.start_build(
-                projectName=f'CodeBuild-{branch}-create'
-            )
     except Exception as e:
-        logger.error(e)
+        # a redelivered event finds the project created by the previous attempt
+        if error_code(e) != 'ResourceAlreadyExistsException':
+            raise
+
+    with metrics.time('StartBuildLatency'):
+        # the buildspec of an existing project may belong to an older event
+        response = backoff.call(client.start_build, projectName=project_name, buildspecOverride=build_spec,
+                                computeTypeOverride=compute_type)
+    return response['build']['id']
+
+
+def create_branch(event):
+    """Creates and starts the CodeBuild project which deploys the pipeline of the branch"""
+    if event['detail']['referenceType'] != 'branch':
+        return
+
+    branch = event['detail']['referenceName']
+    repo_name = event['detail']['repositoryName']
+    event_time = int(event_timestamp(event))
+
+    with MetricsRecorder('CreateBranch', branch=branch) as metrics:
+        metrics.put('EventAge', round(time.time() - event_time, 3), 'Seconds')
+        record = registry.begin(branch, CREATING, event_time) if registry else None
+        if registry and not record:
+            logger.info(f'Skipping duplicate or outdated create event of branch {branch}')
+            metrics.put('SkippedEvents', 1)
+            return
+
+        try:
+            if feature_pipeline_name:
+                # shared feature pipeline: the branch is deployed by an execution, not by a pipeline of its own
+                with metrics.time('StartBuildLatency'):
+                    build_id = backoff.call(start_execution, client=codepipeline, pipeline_name=feature_pipeline_name,
+                                            branch=branch, action=DEPLOY, event_time=event_time,
+                                            commit_id=event['detail'].get('commitId'))
+            else:
+                history = registry.sizing_history(record, CREATING) if registry and sizing_policy.adaptive else []
+                decision = sizing_policy.choose(history)
+                logger.info(f'Compute type of branch {branch}: {decision.compute_type} ({decision.reason})')
+                build_spec = generate_build_spec(branch, event_time, decision.compute_type)
+                build_id = start_deploy_build(branch, repo_name, build_spec, decision.compute_type, metrics)
+        except Exception:
+            if registry:
+                registry.release(branch, event_time)
+            raise
+        if registry:
+            registry.set_build(branch, event_time, build_id)
+
+
+def handler(event, context):
+    """Lambda function handler"""
+    logger.info(event)
+    return process_batch(event, create_branch, max_concurrency)
@@ -1,75 +1,193 @@
 import logging
 import os
+import time
 
-import boto3
+from aws_clients import LazyClient
+from branch_bundle import bundle_key
+from branch_events import AdaptiveBackoff, error_code, process_batch
+from branch_registry import DESTROYED, DESTROYING, BranchRegistry, finish_command
+from build_cache import BuildCacheSettings, build_spec_cache_section, build_spec_list, install_commands, project_cache
+from compute_sizing import SizingPolicy
+from feature_pipeline import DESTROY, start_execution
+from metrics import MetricsRecorder, build_metrics_command, event_timestamp
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-client = boto3.client('codebuild')
+client = LazyClient('codebuild')
+codepipeline = LazyClient('codepipeline')
+s3 = LazyClient('s3')
 region = os.environ['AWS_REGION']
 role_arn = os.environ['CODE_BUILD_ROLE_ARN']
 account_id = os.environ['ACCOUNT_ID']
 artifact_bucket_name = os.environ['ARTIFACT_BUCKET']
 codebuild_name_prefix = os.environ['CODEBUILD_NAME_PREFIX']
+default_branch = os.environ['DEFAULT_BRANCH']
+build_cache = BuildCacheSettings.from_env()
 dev_stage_name = os.environ['DEV_STAGE_NAME']
+max_concurrency = int(os.environ.get('MAX_CONCURRENCY', '4'))
+destroy_project_name = os.environ.get('DESTROY_PROJECT_NAME')
+feature_pipeline_name = os.environ.get('FEATURE_PIPELINE_NAME')
+per_branch_projects = not destroy_project_name and not feature_pipeline_name
+registry_table = os.environ.get('REGISTRY_TABLE')
+registry = BranchRegistry.from_env(os.environ)
+sizing_policy = SizingPolicy.from_env()
+backoff = AdaptiveBackoff()
 
 
-def generate_build_spec(branch):
+def purge_command(branch):
+    """Deletes all versions of the branch artifacts, artifacts of older builds lack the purge script"""
+    script = 'cdk_pipelines_multi_branch/cicd/code/purge_artifacts.py'
+    return (f'if [ -f {script} ]; then python {script} --bucket {artifact_bucket_name} --prefix {branch}/; '
+            f'else aws s3 rm s3://{artifact_bucket_name}/{branch}/ --recursive; fi')
+
+
+def source_location(branch):
+    """The branch bundle if the deploy build published one, otherwise the workspace uploaded as build artifacts"""
+    try:
+        s3.head_object(Bucket=artifact_bucket_name, Key=bundle_key(branch))
+        return f'{artifact_bucket_name}/{bundle_key(branch)}'
+    except Exception as e:
+        if error_code(e) not in ('404', 'NoSuchKey'):
+            raise
+    return f'{artifact_bucket_name}/{branch}/{codebuild_name_prefix}-{branch}-create/'
+
+
+def post_build_commands(branch: str, event_time: int, compute_type: str = None) -> list:
+    commands = [finish_command(registry_table, branch, event_time, compute_type)] if registry_table else []
+    return commands + [build_metrics_command('DestroyBranch', 'TeardownLatency', event_time)]
+
+
+def generate_build_spec(branch, event_time, compute_type=None):
     return f"""version: 0.2
 env:
   variables:
     BRANCH: {branch}
+    DEFAULT_BRANCH: {default_branch}
     DEV_ACCOUNT_ID: {account_id}
     PROD_ACCOUNT_ID: {account_id}
     REGION: {region}
 phases:
   pre_build:
-    commands:
-      - npm install -g aws-cdk && pip install -r requirements.txt
+    commands:{build_spec_list(install_commands(build_cache))}
   build:
     commands:
       - cdk destroy cdk-pipelines-multi-branch-{branch} --force
       - aws cloudformation delete-stack --stack-name {dev_stage_name}-{branch}
-      - aws s3 rm s3://{artifact_bucket_name}/{branch} --recursive"""
+      - {purge_command(branch)}
+  post_build:
+    commands:{build_spec_list(post_build_commands(branch, event_time, compute_type))}\
+{build_spec_cache_section(build_cache)}"""
 
 
-def handler(event, context):
-    logger.info(event)
-    reference_type = event['detail']['referenceType']
+def start_teardown_build(branch: str, build_spec: str, compute_type: str,
+                         metrics: MetricsRecorder) -> str:
+    """Starts the build destroying the resources of the branch, returns the build id"""
+    project_name = f'{codebuild_name_prefix}-{branch}-destroy'
+    with metrics.time('SourceLookupLatency'):
+        source = source_location(branch)
+
+    if destroy_project_name:
+        # shared teardown project: nothing to create or delete per branch
+        with metrics.time('StartBuildLatency'):
+            response = backoff.call(
+                client.start_build,
+                projectName=destroy_project_name,
+                sourceTypeOverride='S3',
+                sourceLocationOverride=source,
+                buildspecOverride=build_spec,
+                computeTypeOverride=compute_type,
+                environmentVariablesOverride=[{'name': 'BRANCH', 'value': branch, 'type': 'PLAINTEXT'}]
+            )
+        return response['build']['id']
 
     try:
-        if reference_type == 'branch':
-            branch = event['detail']['referenceName']
-            client.create_project(
-                name=f'{codebuild_name_prefix}-{branch}-destroy',
+        with metrics.time('CreateProjectLatency'):
+            backoff.call(
+                client.create_project,
+                name=project_name,
                 description="Build project to destroy branch resources",
                 source={
                     'type': 'S3',
-                    'location': f'{artifact_bucket_name}/{branch}/CodeBuild-{branch}-create/',
-                    'buildspec': generate_build_spec(branch)
+                    'location': source,
+                    'buildspec': build_spec
                 },
                 artifacts={
                     'type': 'NO_ARTIFACTS'
                 },
                 environment={
                     'type': 'LINUX_CONTAINER',
-                    'image': 'aws/codebuild/standard:6.0',
-                    'computeType': 'BUILD_GENERAL1_SMALL'
+                    'image': build_cache.image,
+                    'computeType': compute_type
                 },
+                cache=project_cache(build_cache, artifact_bucket_name),
                 serviceRole=role_arn
             )
+    except Exception as e:
+        if error_code(e) != 'ResourceAlreadyExistsException':
+            raise
 
-            client.start_build(
-                projectName=f'CodeBuild-{branch}-destroy'
-            )
+    with metrics.time('StartBuildLatency'):
+        response = backoff.call(client.start_build, projectName=project_name, buildspecOverride=build_spec,
+                                computeTypeOverride=compute_type)
+    return response['build']['id']
 
-            client.delete_project(
-                name=f'CodeBuild-{branch}-destroy'
-            )
 
-            client.delete_project(
-                name=f'CodeBuild-{branch}-create'
-            )
-    except Exception as e:
-        logger.error(e)
+def delete_projects(branch: str, metrics: MetricsRecorder) -> None:
+    """Deletes the deploy and teardown projects of the branch, the started teardown build keeps running"""
+    with metrics.time('DeleteProjectLatency'):
+        for name in (f'{codebuild_name_prefix}-{branch}-destroy', f'{codebuild_name_prefix}-{branch}-create'):
+            try:
+                backoff.call(client.delete_project, name=name)
+            except Exception as e:
+                if error_code(e) != 'ResourceNotFoundException':
+                    raise
+
+
+def destroy_branch(event):
+    if event['detail']['referenceType'] != 'branch':
+        return
+
+    branch = event['detail']['referenceName']
+    event_time = int(event_timestamp(event))
+
+    with MetricsRecorder('DestroyBranch', branch=branch) as metrics:
+        metrics.put('EventAge', round(time.time() - event_time, 3), 'Seconds')
+        record = registry.begin(branch, DESTROYING, event_time) if registry else None
+        if registry and not record:
+            logger.info(f'Skipping duplicate or outdated delete event of branch {branch}')
+            metrics.put('SkippedEvents', 1)
+            current = registry.get(branch)
+            if per_branch_projects and current and current['event_time'] == event_time and \
+                    current['state'] in (DESTROYING, DESTROYED) and \
+                    (current.get('build_id') or current.get('lease_expires', 0) <= time.time()):
+                # the redelivery of an event whose teardown build started, but whose projects were not deleted.
+                # While the first delivery holds the lease without a build, it still needs the projects to start it
+                delete_projects(branch, metrics)
+            return
+
+        try:
+            if feature_pipeline_name:
+                # shared feature pipeline: an execution deletes the DEV stack, the source of the branch is not needed
+                with metrics.time('StartBuildLatency'):
+                    build_id = backoff.call(start_execution, client=codepipeline, pipeline_name=feature_pipeline_name,
+                                            branch=branch, action=DESTROY, event_time=event_time)
+            else:
+                history = registry.sizing_history(record, DESTROYING) if registry and sizing_policy.adaptive else []
+                decision = sizing_policy.choose(history)
+                logger.info(f'Compute type of branch {branch}: {decision.compute_type} ({decision.reason})')
+                build_spec = generate_build_spec(branch, event_time, decision.compute_type)
+                build_id = start_teardown_build(branch, build_spec, decision.compute_type, metrics)
+        except Exception:
+            if registry:
+                registry.release(branch, event_time)
+            raise
+        if registry:
+            registry.set_build(branch, event_time, build_id)
+        if per_branch_projects:
+            delete_projects(branch, metrics)
+
+
+def handler(event, context):
+    logger.info(event)
+    return process_batch(event, destroy_branch, max_concurrency)
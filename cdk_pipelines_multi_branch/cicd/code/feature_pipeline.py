@@ -0,0 +1,29 @@
+"""
+Executions of the pipeline shared by all feature branches ([feature_pipeline] mode=shared in config.ini).
+
+Every execution deploys or destroys the DEV stage of one branch. The branch, the action and the time of
+the branch event are passed as pipeline variables, the commit of the branch as source revision of the
+Source action, so onboarding a branch starts an execution instead of deploying a pipeline.
+"""
+SOURCE_ACTION_NAME = 'Source'
+VARIABLES = ('BRANCH', 'ACTION', 'EVENT_TIME')
+DEPLOY = 'deploy'
+DESTROY = 'destroy'
+
+
+def start_execution(client, pipeline_name: str, branch: str, action: str, event_time: int,
+                    commit_id: str = None) -> str:
+    """Starts an execution of the shared pipeline for the branch, returns the execution id"""
+    kwargs = {}
+    if commit_id:
+        kwargs['sourceRevisions'] = [{
+            'actionName': SOURCE_ACTION_NAME,
+            'revisionType': 'COMMIT_ID',
+            'revisionValue': commit_id
+        }]
+    values = dict(zip(VARIABLES, (branch, action, str(event_time))))
+    response = client.start_pipeline_execution(
+        name=pipeline_name,
+        variables=[{'name': name, 'value': value} for name, value in values.items()],
+        **kwargs)
+    return response['pipelineExecutionId']
@@ -0,0 +1,77 @@
+"""
+Branch lifecycle metrics in CloudWatch embedded metric format (EMF).
+
+The Lambda functions print one EMF record per processed event to stdout, which CloudWatch Logs turns into
+metrics without any API call. The CodeBuild projects report their latency with PutMetricData in post_build.
+"""
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+NAMESPACE = 'CdkPipelinesMultiBranch'
+
+
+def event_timestamp(event: dict) -> float:
+    """Epoch seconds of an EventBridge event, now if it has no time"""
+    try:
+        return datetime.strptime(event['time'], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class MetricsRecorder:
+    """
+    Collects the metrics of one processed event and prints them as a single EMF record. Used as a context
+    manager, it also records the event and whether processing it failed, and emits on exit.
+    """
+
+    def __init__(self, operation: str, **properties) -> None:
+        self.operation = operation
+        self.properties = properties
+        self.values = {}
+        self.units = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.put('Events', 1)
+        self.put('Failures', 0 if exc_type is None else 1)
+        self.emit()
+
+    def put(self, name: str, value: float, unit: str = 'Count') -> None:
+        self.values[name] = value
+        self.units[name] = unit
+
+    @contextmanager
+    def time(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(name, round((time.perf_counter() - start) * 1000, 2), 'Milliseconds')
+
+    def emit(self) -> None:
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Operation']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, unit in self.units.items()]
+                }]
+            },
+            'Operation': self.operation,
+            **self.properties,
+            **self.values
+        }))
+
+
+def build_metrics_command(operation: str, latency_metric: str, event_time: int) -> str:
+    """post_build command of the generated buildspecs reporting the latency since the branch event and failures"""
+    dimensions = f'Dimensions=[{{Name=Operation,Value={operation}}}]'
+    return (f'aws cloudwatch put-metric-data --namespace {NAMESPACE} --metric-data '
+            f'"MetricName={latency_metric},Unit=Seconds,Value=$(( $(date +%s) - {event_time} )),{dimensions}" '
+            f'"MetricName=BuildFailures,Unit=Count,Value=$(( 1 - ${{CODEBUILD_BUILD_SUCCEEDING:-0}} )),{dimensions}" '
+            f'|| true')
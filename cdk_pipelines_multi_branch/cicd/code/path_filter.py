@@ -0,0 +1,80 @@
+"""
+Decides whether a commit starts a branch pipeline based on the files it changed.
+
+Patterns are glob-like: `*` and `?` match within one path segment, `**` matches any number of segments,
+e.g. `cdk_pipelines_multi_branch/**`, `**/*.md` or `README.md`. A pattern without a slash matches the
+file name in any directory, a leading slash anchors it to the repository root (`/README.md`).
+"""
+import re
+
+
+def parse_patterns(value: str) -> list:
+    """Splits a comma or newline separated pattern list"""
+    if not value:
+        return []
+    return [p.strip() for p in value.replace(',', '\n').splitlines() if p.strip()]
+
+
+def glob_to_regex(pattern: str):
+    if '/' not in pattern:
+        pattern = f'**/{pattern}'
+    pattern = pattern.lstrip('/')
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(f'{regex}\\Z')
+
+
+class PathFilter:
+
+    def __init__(self, include: list = None, exclude: list = None) -> None:
+        self.include = [glob_to_regex(p) for p in include or []]
+        self.exclude = [glob_to_regex(p) for p in exclude or []]
+
+    def matches(self, path: str) -> bool:
+        """True if a change of path is relevant: not excluded and included (everything is included by default)"""
+        path = path.lstrip('/')
+        if any(p.match(path) for p in self.exclude):
+            return False
+        return not self.include or any(p.match(path) for p in self.include)
+
+
+class TriggerDecision:
+
+    def __init__(self, trigger: bool, reason: str, matched_file: str = None) -> None:
+        self.trigger = trigger
+        self.reason = reason
+        self.matched_file = matched_file
+
+    def __repr__(self) -> str:
+        return f'TriggerDecision(trigger={self.trigger}, reason={self.reason!r})'
+
+
+def evaluate(changed_files, path_filter: PathFilter) -> TriggerDecision:
+    """
+    Returns the execution decision for the changed files. changed_files may be a lazy iterable, it is
+    only consumed up to the first relevant file. None means the changes are unknown, which triggers.
+    """
+    if changed_files is None:
+        return TriggerDecision(True, 'changed files unknown')
+    checked = 0
+    for path in changed_files:
+        checked += 1
+        if path_filter.matches(path):
+            return TriggerDecision(True, f'{path} changed', path)
+    return TriggerDecision(False, f'none of the {checked} changed files match the path filters')
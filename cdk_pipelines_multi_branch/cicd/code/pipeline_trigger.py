@@ -0,0 +1,97 @@
+"""
+Lambda function code used to start the pipeline of a branch when a commit changes files matching the path filters
+of its branch class (default or feature branch).
+"""
+import logging
+import os
+
+from aws_clients import LazyClient
+from branch_events import error_code
+from branch_registry import CREATING, BranchRegistry
+from feature_pipeline import DEPLOY, start_execution
+from metrics import event_timestamp
+from path_filter import PathFilter, evaluate, parse_patterns
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+codecommit = LazyClient('codecommit')
+codepipeline = LazyClient('codepipeline')
+default_branch = os.environ['DEFAULT_BRANCH']
+pipeline_name_prefix = os.environ.get('PIPELINE_NAME_PREFIX', 'CICDPipeline')
+feature_pipeline_name = os.environ.get('FEATURE_PIPELINE_NAME')
+registry = BranchRegistry.from_env(os.environ)
+# with polling pipeline triggers only the commits of feature branches on the shared pipeline are handled here
+trigger_default_branch = os.environ.get('TRIGGER_DEFAULT_BRANCH', 'true').lower() == 'true'
+path_filters = {
+    'default': PathFilter(parse_patterns(os.environ.get('DEFAULT_BRANCH_INCLUDE')),
+                          parse_patterns(os.environ.get('DEFAULT_BRANCH_EXCLUDE'))),
+    'feature': PathFilter(parse_patterns(os.environ.get('FEATURE_BRANCH_INCLUDE')),
+                          parse_patterns(os.environ.get('FEATURE_BRANCH_EXCLUDE')))
+}
+
+
+def changed_files(repository_name: str, before: str, after: str):
+    """Yields the paths changed between two commits, page by page"""
+    paginator = codecommit.get_paginator('get_differences')
+    for page in paginator.paginate(repositoryName=repository_name,
+                                   beforeCommitSpecifier=before,
+                                   afterCommitSpecifier=after):
+        for difference in page['differences']:
+            for blob in ('afterBlob', 'beforeBlob'):
+                if blob in difference:
+                    yield difference[blob]['path']
+
+
+def start_commit_deploy(branch: str, event_time: int, commit_id: str, reason: str) -> dict:
+    """
+    Starts an execution of the shared feature pipeline deploying the commit. The commit is a new CREATING event
+    of the branch in the registry, so the post_build of the execution completes it, and a failed deploy
+    leaves the branch FAILED rather than READY.
+    """
+    if registry and not registry.begin(branch, CREATING, event_time):
+        logger.info('Skipping duplicate or outdated commit event of branch %s', branch)
+        return {'triggered': False, 'reason': 'duplicate or outdated commit event'}
+    try:
+        execution_id = start_execution(codepipeline, feature_pipeline_name, branch, DEPLOY, event_time, commit_id)
+    except Exception:
+        if registry:
+            registry.release(branch, event_time)
+        raise
+    if registry:
+        registry.set_build(branch, event_time, execution_id)
+    return {'triggered': True, 'reason': reason}
+
+
+def handler(event, context):
+    """Lambda function handler"""
+    logger.info(event)
+    detail = event['detail']
+    if detail['referenceType'] != 'branch':
+        return
+
+    branch = detail['referenceName']
+    branch_class = 'default' if branch == default_branch else 'feature'
+    if branch_class == 'default' and not trigger_default_branch:
+        return {'triggered': False, 'reason': 'the default branch pipeline polls its branch'}
+    before = detail.get('oldCommitId')
+    files = changed_files(detail['repositoryName'], before, detail['commitId']) if before else None
+
+    decision = evaluate(files, path_filters[branch_class])
+    logger.info('%s branch %s: %s', branch_class, branch, decision)
+    if not decision.trigger:
+        return {'triggered': False, 'reason': decision.reason}
+
+    if branch_class == 'feature' and feature_pipeline_name:
+        return start_commit_deploy(branch, int(event_timestamp(event)), detail['commitId'], decision.reason)
+
+    pipeline_name = f'{pipeline_name_prefix}-{branch}'
+    try:
+        codepipeline.start_pipeline_execution(name=pipeline_name)
+    except Exception as e:
+        # the pipeline of a new branch is still being deployed, it runs once created
+        if error_code(e) != 'PipelineNotFoundException':
+            raise
+        logger.info('Pipeline %s does not exist (yet)', pipeline_name)
+        return {'triggered': False, 'reason': 'pipeline not found'}
+    return {'triggered': True, 'reason': decision.reason}
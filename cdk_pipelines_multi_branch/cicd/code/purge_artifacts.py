@@ -0,0 +1,108 @@
+"""
+Deletes every object version and delete marker below a prefix of a versioned S3 bucket.
+
+Used by the branch teardown to remove the branch artifacts, can also be run standalone:
+
+    python purge_artifacts.py --bucket <artifact bucket> --prefix <branch>/
+"""
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger()
+
+DELETE_BATCH_SIZE = 1000
+
+
+class PurgeResult:
+
+    def __init__(self) -> None:
+        self.listed = 0
+        self.deleted = 0
+        self.errors = []
+
+    def __repr__(self) -> str:
+        return f'PurgeResult(listed={self.listed}, deleted={self.deleted}, errors={len(self.errors)})'
+
+
+def iter_versions(s3, bucket: str, prefix: str):
+    """Yields the key and version id of every version and delete marker below prefix"""
+    paginator = s3.get_paginator('list_object_versions')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for version in page.get('Versions', []) + page.get('DeleteMarkers', []):
+            yield {'Key': version['Key'], 'VersionId': version['VersionId']}
+
+
+def iter_batches(items, size: int = DELETE_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def delete_batch(s3, bucket: str, objects: list) -> tuple:
+    response = s3.delete_objects(Bucket=bucket, Delete={'Objects': objects, 'Quiet': True})
+    errors = response.get('Errors', [])
+    return len(objects) - len(errors), errors
+
+
+def purge_prefix(s3, bucket: str, prefix: str, max_workers: int = 8, dry_run: bool = False) -> PurgeResult:
+    """
+    Pages through the versions below prefix and deletes them in batches of 1000 keys with up to
+    max_workers concurrent delete_objects calls. Listing continues while batches are deleted.
+    """
+    if not prefix:
+        raise ValueError('Refusing to purge the whole bucket, a prefix is required')
+
+    result = PurgeResult()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+
+        def collect(done):
+            for future in done:
+                deleted, errors = future.result()
+                result.deleted += deleted
+                result.errors += errors
+
+        for batch in iter_batches(iter_versions(s3, bucket, prefix)):
+            result.listed += len(batch)
+            if dry_run:
+                continue
+            # bound the listed but not yet deleted versions held in memory
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(delete_batch, s3, bucket, batch))
+        collect(wait(pending).done)
+
+    for error in result.errors:
+        logger.error('Failed to delete %s (%s): %s', error.get('Key'), error.get('VersionId'), error.get('Message'))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Delete all object versions below a prefix of an S3 bucket.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', required=True, help='e.g. <branch>/, include the trailing slash')
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true', help='only count the versions')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    import boto3
+    from botocore.config import Config
+    s3 = boto3.client('s3', config=Config(max_pool_connections=args.max_workers))
+
+    result = purge_prefix(s3, args.bucket, args.prefix, args.max_workers, args.dry_run)
+    print(f's3://{args.bucket}/{args.prefix}: {result.listed} versions listed, {result.deleted} deleted, '
+          f'{len(result.errors)} errors')
+    return 1 if result.errors else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+"""
+Lambda function code used to tear down branch environments whose branch no longer exists (orphaned) or had no
+commit for IDLE_DAYS days (idle). Runs on a schedule and reuses the teardown of destroy_branch.py.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import destroy_branch
+from aws_clients import LazyClient
+from branch_events import AdaptiveBackoff
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+codecommit = LazyClient('codecommit')
+cloudformation = LazyClient('cloudformation')
+repository_name = os.environ['REPOSITORY_NAME']
+default_branch = os.environ['DEFAULT_BRANCH']
+dev_stage_name = os.environ['DEV_STAGE_NAME']
+pipeline_stack_prefix = os.environ.get('PIPELINE_STACK_PREFIX', 'cdk-pipelines-multi-branch')
+idle_days = int(os.environ.get('IDLE_DAYS', '0'))
+max_concurrency = int(os.environ.get('MAX_CONCURRENCY', '5'))
+dry_run_default = os.environ.get('DRY_RUN', 'true').lower() == 'true'
+backoff = AdaptiveBackoff()
+
+ACTIVE_STACK_STATUSES = [
+    'CREATE_IN_PROGRESS', 'CREATE_FAILED', 'CREATE_COMPLETE', 'ROLLBACK_IN_PROGRESS', 'ROLLBACK_FAILED',
+    'ROLLBACK_COMPLETE', 'DELETE_FAILED', 'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS',
+    'UPDATE_COMPLETE', 'UPDATE_FAILED', 'UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE', 'IMPORT_IN_PROGRESS',
+    'IMPORT_COMPLETE', 'IMPORT_ROLLBACK_IN_PROGRESS', 'IMPORT_ROLLBACK_FAILED', 'IMPORT_ROLLBACK_COMPLETE'
+]
+
+
+def list_branches() -> set:
+    branches = set()
+    for page in codecommit.get_paginator('list_branches').paginate(repositoryName=repository_name):
+        branches.update(page['branches'])
+    return branches
+
+
+def list_environments() -> dict:
+    """Maps each branch with a pipeline or DEV stack to the names of its stacks"""
+    prefixes = (f'{pipeline_stack_prefix}-', f'{dev_stage_name}-')
+    environments = {}
+    paginator = cloudformation.get_paginator('list_stacks')
+    for page in paginator.paginate(StackStatusFilter=ACTIVE_STACK_STATUSES):
+        for summary in page['StackSummaries']:
+            name = summary['StackName']
+            for prefix in prefixes:
+                if name.startswith(prefix):
+                    environments.setdefault(name[len(prefix):], []).append(name)
+    return environments
+
+
+def last_commit_times(branches: list) -> dict:
+    """Epoch seconds of the last commit of each branch"""
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        tips = dict(zip(branches, pool.map(
+            lambda b: backoff.call(codecommit.get_branch, repositoryName=repository_name,
+                                   branchName=b)['branch']['commitId'],
+            branches)))
+
+    commit_times = {}
+    commit_ids = sorted(set(tips.values()))
+    for i in range(0, len(commit_ids), 100):
+        response = backoff.call(codecommit.batch_get_commits, repositoryName=repository_name,
+                                commitIds=commit_ids[i:i + 100])
+        for commit in response['commits']:
+            # dates are formatted as '<epoch seconds> <timezone offset>'
+            commit_times[commit['commitId']] = int(commit['committer']['date'].split()[0])
+    return {branch: commit_times.get(commit_id, 0) for branch, commit_id in tips.items()}
+
+
+def plan(branches: set, environments: dict, now: float) -> dict:
+    """Returns the orphaned and idle environments, the default branch environment is never reaped"""
+    candidates = sorted(b for b in environments if b != default_branch)
+    orphaned = [b for b in candidates if b not in branches]
+    idle = []
+    if idle_days > 0:
+        existing = [b for b in candidates if b in branches]
+        cutoff = now - idle_days * 86400
+        idle = [b for b, last_commit in sorted(last_commit_times(existing).items()) if last_commit < cutoff]
+    return {'orphaned': orphaned, 'idle': idle}
+
+
+def teardown(branch: str) -> None:
+    destroy_branch.destroy_branch({
+        'detail': {
+            'event': 'referenceDeleted',
+            'referenceType': 'branch',
+            'referenceName': branch,
+            'repositoryName': repository_name
+        }
+    })
+
+
+def handler(event, context):
+    """Lambda function handler, {"dry_run": false} in the event overrides DRY_RUN"""
+    dry_run = event.get('dry_run', dry_run_default) if isinstance(event, dict) else dry_run_default
+
+    environments = list_environments()
+    targets = plan(list_branches(), environments, time.time())
+    report = {
+        'dry_run': dry_run,
+        'environments': len(environments),
+        'orphaned': targets['orphaned'],
+        'idle': targets['idle'],
+        'stacks': {b: environments[b] for b in targets['orphaned'] + targets['idle']},
+        'destroyed': [],
+        'failed': {}
+    }
+
+    if not dry_run:
+        branches = targets['orphaned'] + targets['idle']
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = {branch: pool.submit(teardown, branch) for branch in branches}
+        for branch, future in futures.items():
+            try:
+                future.result()
+                report['destroyed'].append(branch)
+            except Exception as e:
+                report['failed'][branch] = str(e)
+
+    logger.info(json.dumps(report))
+    return report
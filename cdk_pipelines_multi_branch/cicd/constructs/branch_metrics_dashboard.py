@@ -0,0 +1,109 @@
+from aws_cdk import Duration
+from aws_cdk.aws_cloudwatch import (
+    ComparisonOperator, Dashboard, GraphWidget, MathExpression, Metric, SingleValueWidget, TreatMissingData
+)
+from constructs import Construct
+
+from ..code.metrics import NAMESPACE
+
+OPERATIONS = ('CreateBranch', 'DestroyBranch')
+
+
+class BranchMetricsDashboard(Construct):
+    """
+    Dashboard and alarms for the branch lifecycle metrics: provisioning and teardown latency from the branch
+    event to the end of the CodeBuild build, CodeBuild API latency of the Lambda functions and the failure rate.
+    """
+
+    def __init__(self,
+                 scope: Construct,
+                 construct_id: str,
+                 dashboard_name: str,
+                 provisioning_latency_threshold: Duration,
+                 teardown_latency_threshold: Duration,
+                 failure_rate_threshold: float,
+                 dead_letter_queues: dict = None,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        period = Duration.minutes(15)
+
+        def metric(name: str, operation: str, statistic: str) -> Metric:
+            return Metric(namespace=NAMESPACE, metric_name=name, dimensions_map={'Operation': operation},
+                          statistic=statistic, period=period)
+
+        def latency(name: str, operation: str) -> list:
+            return [metric(name, operation, statistic).with_(label=f'{name} {statistic}')
+                    for statistic in ('p50', 'p90', 'Maximum')]
+
+        def failure_rate(operation: str) -> MathExpression:
+            # failed events of the Lambda function and failed builds, per processed event
+            return MathExpression(
+                expression='100 * (FILL(lambda_failures, 0) + FILL(build_failures, 0)) / events',
+                using_metrics={
+                    'events': metric('Events', operation, 'Sum'),
+                    'lambda_failures': metric('Failures', operation, 'Sum'),
+                    'build_failures': metric('BuildFailures', operation, 'Sum')
+                },
+                label=f'{operation} failure rate (%)',
+                period=period)
+
+        provisioning_latency = latency('ProvisioningLatency', 'CreateBranch')
+        teardown_latency = latency('TeardownLatency', 'DestroyBranch')
+        failure_rates = [failure_rate(operation) for operation in OPERATIONS]
+
+        dashboard = Dashboard(self, 'Dashboard', dashboard_name=dashboard_name)
+        dashboard.add_widgets(
+            GraphWidget(title='Provisioning latency (s)', left=provisioning_latency, width=12),
+            GraphWidget(title='Teardown latency (s)', left=teardown_latency, width=12))
+        dashboard.add_widgets(
+            GraphWidget(title='CodeBuild API latency (ms)', width=12, left=[
+                metric(name, operation, 'p90').with_(label=f'{operation} {name} p90')
+                for operation in OPERATIONS
+                for name in ('CreateProjectLatency', 'StartBuildLatency')
+            ]),
+            GraphWidget(title='Failure rate (%)', left=failure_rates, width=12))
+        dashboard.add_widgets(SingleValueWidget(
+            title='Branch events',
+            metrics=[metric('Events', operation, 'Sum').with_(label=operation, period=Duration.days(1))
+                     for operation in OPERATIONS],
+            width=24))
+
+        self.provisioning_latency_alarm = provisioning_latency[1].create_alarm(
+            self,
+            'ProvisioningLatencyAlarm',
+            alarm_description='p90 time from branch creation to a deployed branch pipeline is too high.',
+            threshold=provisioning_latency_threshold.to_seconds(),
+            evaluation_periods=1,
+            comparison_operator=ComparisonOperator.GREATER_THAN_THRESHOLD,
+            treat_missing_data=TreatMissingData.NOT_BREACHING)
+        self.teardown_latency_alarm = teardown_latency[1].create_alarm(
+            self,
+            'TeardownLatencyAlarm',
+            alarm_description='p90 time from branch deletion to a torn down branch environment is too high.',
+            threshold=teardown_latency_threshold.to_seconds(),
+            evaluation_periods=1,
+            comparison_operator=ComparisonOperator.GREATER_THAN_THRESHOLD,
+            treat_missing_data=TreatMissingData.NOT_BREACHING)
+        self.failure_rate_alarms = [
+            rate.create_alarm(
+                self,
+                f'{operation}FailureRateAlarm',
+                alarm_description=f'Too many {operation} events or builds fail.',
+                threshold=failure_rate_threshold,
+                evaluation_periods=1,
+                comparison_operator=ComparisonOperator.GREATER_THAN_THRESHOLD,
+                treat_missing_data=TreatMissingData.NOT_BREACHING)
+            for operation, rate in zip(OPERATIONS, failure_rates)
+        ]
+
+        # events which exhausted their retries are not retried anymore, keyed by the name of the alarm
+        for name, queue in (dead_letter_queues or {}).items():
+            queue.metric_approximate_number_of_messages_visible(period=Duration.minutes(5)).create_alarm(
+                self,
+                f'{name}DeadLetterAlarm',
+                alarm_description='Branch events were moved to the dead-letter queue.',
+                threshold=0,
+                evaluation_periods=1,
+                comparison_operator=ComparisonOperator.GREATER_THAN_THRESHOLD,
+                treat_missing_data=TreatMissingData.NOT_BREACHING)
@@ -0,0 +1,79 @@
+from aws_cdk.aws_codebuild import (
+    Artifacts, BuildEnvironment, BuildSpec, Cache, LinuxBuildImage, LocalCacheMode, Project, Source
+)
+from aws_cdk.aws_codecommit import IRepository
+from aws_cdk.aws_iam import IRole
+from aws_cdk.aws_kms import Alias
+from aws_cdk.aws_s3 import IBucket
+from constructs import Construct
+
+from ..code.build_cache import BuildCacheSettings, S3_CACHE_PREFIX
+
+
+class BranchProjectsConstruct(Construct):
+    """Long-lived deploy and teardown CodeBuild projects shared by all branches"""
+
+    def __init__(self,
+                 scope: Construct,
+                 construct_id: str,
+                 repo: IRepository,
+                 artifact_bucket: IBucket,
+                 role: IRole,
+                 build_cache: BuildCacheSettings,
+                 deploy_project_name: str,
+                 destroy_project_name: str,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        if build_cache.prebuilt_image:
+            build_image = LinuxBuildImage.from_docker_registry(build_cache.image)
+        else:
+            build_image = LinuxBuildImage.from_code_build_image_id(build_cache.image)
+
+        if build_cache.mode == 'local':
+            cache = Cache.local(LocalCacheMode.CUSTOM)
+        elif build_cache.mode == 's3':
+            cache = Cache.bucket(artifact_bucket, prefix=S3_CACHE_PREFIX)
+        else:
+            cache = Cache.none()
+
+        # the branch Lambda functions pass the buildspec with every build
+        placeholder_build_spec = BuildSpec.from_object({
+            'version': '0.2',
+            'phases': {
+                'build': {
+                    'commands': ['echo "The buildspec is passed by the branch Lambda functions" && exit 1']
+                }
+            }
+        })
+        encryption_key = Alias.from_alias_name(self, 'S3ManagedKey', 'alias/aws/s3')
+
+        self.deploy_project = Project(
+            self,
+            'DeployProject',
+            project_name=deploy_project_name,
+            description='Build project to deploy branch pipelines',
+            source=Source.code_commit(repository=repo),
+            artifacts=Artifacts.s3(
+                bucket=artifact_bucket,
+                path='shared',
+                include_build_id=False,
+                package_zip=False,
+                identifier='BranchBuildArtifact'),
+            build_spec=placeholder_build_spec,
+            environment=BuildEnvironment(build_image=build_image),
+            cache=cache,
+            encryption_key=encryption_key,
+            role=role)
+
+        self.destroy_project = Project(
+            self,
+            'DestroyProject',
+            project_name=destroy_project_name,
+            description='Build project to destroy branch resources',
+            source=Source.s3(bucket=artifact_bucket, path='shared/'),
+            build_spec=placeholder_build_spec,
+            environment=BuildEnvironment(build_image=build_image),
+            cache=cache,
+            encryption_key=encryption_key,
+            role=role)
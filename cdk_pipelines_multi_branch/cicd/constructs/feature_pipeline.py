@@ -0,0 +1,165 @@
+from aws_cdk import aws_codepipeline_actions
+from aws_cdk.aws_codebuild import (
+    BuildEnvironment, BuildEnvironmentVariable, BuildSpec, Cache, LinuxBuildImage, LocalCacheMode, PipelineProject
+)
+from aws_cdk.aws_codecommit import IRepository
+from aws_cdk.aws_codepipeline import Artifact, Pipeline, StageProps
+from aws_cdk.aws_dynamodb import ITable
+from aws_cdk.aws_iam import PolicyStatement
+from aws_cdk.aws_kms import Alias
+from aws_cdk.aws_s3 import IBucket
+from constructs import Construct
+
+from ..code.build_cache import BuildCacheSettings, S3_CACHE_PREFIX, cache_paths, install_commands
+from ..code.feature_pipeline import DESTROY, SOURCE_ACTION_NAME, VARIABLES
+from ..code.metrics import NAMESPACE as METRICS_NAMESPACE, build_metrics_command
+
+REGISTRY_SCRIPT = 'cdk_pipelines_multi_branch/cicd/code/branch_registry.py'
+
+
+class FeaturePipelineConstruct(Construct):
+    """
+    One pipeline deploying the DEV stage of every feature branch. The branch Lambda functions start an
+    execution per branch with the BRANCH, ACTION (deploy or destroy) and EVENT_TIME pipeline variables and
+    the commit of the branch as source revision. Executions of different branches run in parallel. The build
+    of an execution waits until no other execution is updating the DEV stack of its branch, and skips the
+    deploy or destroy if a newer event of the branch was registered in the meantime.
+    """
+
+    def __init__(self,
+                 scope: Construct,
+                 construct_id: str,
+                 repo: IRepository,
+                 pipeline_name: str,
+                 default_branch: str,
+                 account: str,
+                 region: str,
+                 dev_stage_name: str,
+                 dev_stack_prefix: str,
+                 artifact_bucket: IBucket,
+                 registry_table: ITable,
+                 build_cache: BuildCacheSettings,
+                 **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        if build_cache.prebuilt_image:
+            build_image = LinuxBuildImage.from_docker_registry(build_cache.image)
+        else:
+            build_image = LinuxBuildImage.from_code_build_image_id(build_cache.image)
+
+        if build_cache.mode == 'local':
+            cache = Cache.local(LocalCacheMode.CUSTOM)
+        elif build_cache.mode == 's3':
+            cache = Cache.bucket(artifact_bucket, prefix=S3_CACHE_PREFIX)
+        else:
+            cache = Cache.none()
+
+        dev_stack_name = f'{dev_stack_prefix}-$BRANCH'
+        # true unless a newer event of the branch superseded the event of the execution, see code/branch_registry.py
+        is_current = (f'{{ [ ! -f {REGISTRY_SCRIPT} ] || python {REGISTRY_SCRIPT} --table {registry_table.table_name} '
+                      f'check --branch $BRANCH --event-time $EVENT_TIME; }}')
+        build_spec = {
+            'version': '0.2',
+            'env': {
+                'variables': {
+                    # app.py synthesizes only the DEV stage of BRANCH
+                    'FEATURE_DEPLOY': 'true',
+                    'DEFAULT_BRANCH': default_branch,
+                    'DEV_ACCOUNT_ID': account,
+                    'PROD_ACCOUNT_ID': account,
+                    'REGION': region
+                }
+            },
+            'phases': {
+                'install': {
+                    'commands': install_commands(build_cache)
+                },
+                'build': {
+                    'commands': [
+                        # synthesize before waiting, so a deploy reaches CloudFormation right after its check
+                        f'if [ "$ACTION" != "{DESTROY}" ]; then cdk synth --quiet; fi',
+                        # executions of the same branch run one after the other: wait while another execution
+                        # updates the DEV stack, unless a newer event of the branch superseded this one
+                        f'while {is_current} && aws cloudformation describe-stacks --stack-name {dev_stack_name} '
+                        f'--query "Stacks[0].StackStatus" --output text 2>/dev/null | grep -q _IN_PROGRESS; '
+                        f'do echo "Waiting for {dev_stack_name}"; sleep 20; done',
+                        # the execution of an older event must not overwrite the stack of a newer one
+                        f'if ! {is_current}; then echo "Skipping the superseded $ACTION of $BRANCH"; '
+                        f'elif [ "$ACTION" = "{DESTROY}" ]; then '
+                        f'aws cloudformation delete-stack --stack-name {dev_stack_name} && '
+                        f'aws cloudformation wait stack-delete-complete --stack-name {dev_stack_name}; '
+                        f'else cdk deploy --app cdk.out --require-approval never "{dev_stage_name}/*"; fi'
+                    ]
+                },
+                'post_build': {
+                    'commands': [
+                        # completes the registry transition, see finish_command of code/branch_registry.py
+                        f'if [ -f {REGISTRY_SCRIPT} ]; then python {REGISTRY_SCRIPT} '
+                        f'--table {registry_table.table_name} finish --branch $BRANCH --event-time $EVENT_TIME '
+                        f'--succeeded ${{CODEBUILD_BUILD_SUCCEEDING:-0}} || true; fi',
+                        f'if [ "$ACTION" = "{DESTROY}" ]; then '
+                        f'{build_metrics_command("DestroyBranch", "TeardownLatency", "$EVENT_TIME")}; '
+                        f'else {build_metrics_command("CreateBranch", "ProvisioningLatency", "$EVENT_TIME")}; fi'
+                    ]
+                }
+            }
+        }
+        if build_cache.enabled:
+            build_spec['cache'] = {'paths': cache_paths()}
+
+        project = PipelineProject(
+            self,
+            'DeployProject',
+            description='Build project to deploy and destroy the DEV stage of feature branches',
+            build_spec=BuildSpec.from_object(build_spec),
+            environment=BuildEnvironment(build_image=build_image),
+            cache=cache,
+            encryption_key=Alias.from_alias_name(self, 'S3ManagedKey', 'alias/aws/s3'))
+        project.add_to_role_policy(PolicyStatement(
+            actions=['sts:AssumeRole'],
+            resources=[f'arn:*:iam::{account}:role/*'],
+            conditions={
+                'ForAnyValue:StringEquals': {
+                    'iam:ResourceTag/aws-cdk:bootstrap-role': ['image-publishing', 'file-publishing', 'deploy']
+                }
+            }))
+        project.add_to_role_policy(PolicyStatement(
+            actions=['cloudformation:DescribeStacks', 'cloudformation:DeleteStack'],
+            resources=[f'arn:aws:cloudformation:{region}:{account}:stack/{dev_stack_prefix}-*/*']))
+        project.add_to_role_policy(PolicyStatement(
+            actions=['cloudwatch:PutMetricData'],
+            resources=['*'],
+            conditions={'StringEquals': {'cloudwatch:namespace': METRICS_NAMESPACE}}))
+        registry_table.grant(project, 'dynamodb:GetItem', 'dynamodb:PutItem')
+
+        source_output = Artifact()
+        self.pipeline = Pipeline(
+            self,
+            'Pipeline',
+            pipeline_name=pipeline_name,
+            # one pipeline in one account, no customer managed key needed for cross-account deployments
+            cross_account_keys=False,
+            stages=[
+                StageProps(stage_name='Source', actions=[aws_codepipeline_actions.CodeCommitSourceAction(
+                    action_name=SOURCE_ACTION_NAME,
+                    repository=repo,
+                    # the executions override the revision with the commit of their branch
+                    branch=default_branch,
+                    output=source_output,
+                    trigger=aws_codepipeline_actions.CodeCommitTrigger.NONE)]),
+                StageProps(stage_name='DeployBranch', actions=[aws_codepipeline_actions.CodeBuildAction(
+                    action_name='DeployBranch',
+                    project=project,
+                    input=source_output,
+                    environment_variables={
+                        name: BuildEnvironmentVariable(value=f'#{{variables.{name}}}') for name in VARIABLES
+                    })])
+            ])
+
+        # pipeline variables and the parallel execution mode need a V2 pipeline, which CDK 2.23 cannot declare yet
+        cfn_pipeline = self.pipeline.node.default_child
+        cfn_pipeline.add_property_override('PipelineType', 'V2')
+        cfn_pipeline.add_property_override('ExecutionMode', 'PARALLEL')
+        cfn_pipeline.add_property_override('Variables', [{'Name': name} for name in VARIABLES])
+
+        self.project = project
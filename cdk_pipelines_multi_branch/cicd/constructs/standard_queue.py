@@ -0,0 +1,49 @@
+from aws_cdk import App, Duration, RemovalPolicy
+from aws_cdk.aws_iam import PolicyStatement, Effect, AnyPrincipal
+from aws_cdk.aws_kms import Key
+from aws_cdk.aws_sqs import Queue, QueueEncryption, DeadLetterQueue
+from constructs import Construct
+
+
+class SQSConstruct(Construct):
+    def __init__(self, app: App, id: str, queue_args: dict, max_receive_count: int = 5, **kwargs):
+        super().__init__(app, id, **kwargs)
+
+        # kms key, a customer managed key is required for EventBridge and S3 to send messages
+        queue_key = Key(self, f"{id}Key",
+                        description=f"Key used for {id} queues",
+                        enable_key_rotation=True,
+                        removal_policy=RemovalPolicy.DESTROY)
+
+        # dead-letter queue for messages which failed max_receive_count times
+        dead_letter_queue = Queue(self, f"{id}DeadLetterQueue",
+                                  encryption=QueueEncryption.KMS,
+                                  encryption_master_key=queue_key,
+                                  retention_period=Duration.days(14))
+
+        # queue
+        queue_args["encryption"] = QueueEncryption.KMS
+        queue_args["encryption_master_key"] = queue_key
+        queue_args["dead_letter_queue"] = DeadLetterQueue(max_receive_count=max_receive_count,
+                                                          queue=dead_letter_queue)
+
+        queue = Queue(self, f"{id}Queue", **queue_args)
+
+        # queue policies
+        for q in (queue, dead_letter_queue):
+            q.add_to_resource_policy(
+                PolicyStatement(sid='AllowSSLRequestsOnly',
+                                actions=['sqs:*'],
+                                effect=Effect.DENY,
+                                resources=[q.queue_arn],
+                                conditions={
+                                    "Bool": {
+                                        "aws:SecureTransport": "false"
+                                    }
+                                },
+                                principals=[AnyPrincipal()])
+            )
+
+        self.key = queue_key
+        self.queue = queue
+        self.dead_letter_queue = dead_letter_queue
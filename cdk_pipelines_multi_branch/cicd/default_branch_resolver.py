@@ -0,0 +1,95 @@
+"""
+Resolves the default branch of the CodeCommit repository used by app.py.
+
+Lookup order: DEFAULT_BRANCH environment variable, `default_branch` in config.ini,
+a TTL'd on-disk cache and finally the CodeCommit API. The boto3 client is only created
+when the API actually has to be called.
+"""
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = 'cdk.default-branch.json'
+DEFAULT_CACHE_TTL = 3600
+
+
+def cache_key(repository_name: str, region: str) -> str:
+    """Context-style key used in the cache file"""
+    return f'codecommit-default-branch:region={region}:repository={repository_name}'
+
+
+class DefaultBranchResolver:
+
+    def __init__(self,
+                 repository_name: str,
+                 region: str,
+                 override: str = None,
+                 cache_file: str = DEFAULT_CACHE_FILE,
+                 cache_ttl: int = DEFAULT_CACHE_TTL,
+                 client=None) -> None:
+        self.repository_name = repository_name
+        self.region = region
+        self.override = override
+        self.cache_file = cache_file
+        self.cache_ttl = cache_ttl
+        self._client = client
+
+    @classmethod
+    def from_config(cls, global_config, **kwargs):
+        """Builds a resolver from the [general] section of config.ini and the environment"""
+        return cls(
+            repository_name=global_config.get('general', 'repository_name'),
+            region=global_config.get('general', 'region'),
+            override=os.environ.get('DEFAULT_BRANCH') or global_config.get('general', 'default_branch', fallback=None),
+            cache_ttl=global_config.getint('general', 'default_branch_cache_ttl', fallback=DEFAULT_CACHE_TTL),
+            **kwargs)
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('codecommit', region_name=self.region)
+        return self._client
+
+    def resolve(self) -> str:
+        if self.override:
+            return self.override
+
+        key = cache_key(self.repository_name, self.region)
+        cache = self._read_cache()
+        entry = cache.get(key)
+        if entry and entry['expires'] > time.time():
+            return entry['value']
+
+        try:
+            repository = self.client.get_repository(repositoryName=self.repository_name)
+        except Exception as e:
+            if entry:
+                # offline or throttled: an expired value is better than failing the synth
+                logger.warning('Using expired default branch for %s: %s', self.repository_name, e)
+                return entry['value']
+            raise
+
+        default_branch = repository['repositoryMetadata']['defaultBranch']
+        cache[key] = {'value': default_branch, 'expires': int(time.time()) + self.cache_ttl}
+        self._write_cache(cache)
+        return default_branch
+
+    def _read_cache(self) -> dict:
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, cache: dict) -> None:
+        tmp_file = f'{self.cache_file}.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning('Could not write default branch cache %s: %s', self.cache_file, e)
@@ -0,0 +1,158 @@
+"""
+Fast path deployment of the DEV stack of a feature branch.
+
+Compares the synthesized template of the stack with the deployed one. If only the code of Lambda
+functions changed, the stack is deployed with `cdk deploy --hotswap`, which updates the function code
+directly instead of going through CloudFormation. Any other difference falls back to a full deploy,
+an unchanged template skips the deploy. Run from the FastDeploy step with the cloud assembly of the
+Synth step:
+
+    python -m cdk_pipelines_multi_branch.cicd.fast_deploy --cdk-out cdk.out --stack-name DEV-InfraStack-feature-1
+
+The decision and the timing of the deploy are printed and written to fast-deploy-report.json.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# properties whose changes `cdk deploy --hotswap` applies without CloudFormation
+HOTSWAPPABLE_PROPERTIES = {'AWS::Lambda::Function': {'Code'}}
+IGNORED_RESOURCE_TYPES = {'AWS::CDK::Metadata'}
+ASSET_METADATA_PREFIX = 'aws:asset:'
+
+
+class Classification:
+
+    def __init__(self, mode: str, reason: str, hotswap_resources: list = None) -> None:
+        self.mode = mode
+        self.reason = reason
+        self.hotswap_resources = hotswap_resources or []
+
+    def __repr__(self) -> str:
+        return f'Classification(mode={self.mode!r}, reason={self.reason!r})'
+
+
+def _without_asset_metadata(resource: dict) -> dict:
+    resource = dict(resource)
+    metadata = {k: v for k, v in resource.get('Metadata', {}).items() if not k.startswith(ASSET_METADATA_PREFIX)}
+    resource['Metadata'] = metadata
+    resource.pop('Properties', None)
+    return resource
+
+
+def classify(deployed: dict, synthesized: dict) -> Classification:
+    """Decides between a hotswap, a full or no deploy of synthesized over deployed"""
+    if deployed is None:
+        return Classification('full', 'stack is not deployed')
+
+    for section in sorted(set(deployed) | set(synthesized)):
+        if section != 'Resources' and deployed.get(section) != synthesized.get(section):
+            return Classification('full', f'{section} changed')
+
+    deployed_resources = deployed.get('Resources', {})
+    synthesized_resources = synthesized.get('Resources', {})
+    added_or_removed = set(deployed_resources) ^ set(synthesized_resources)
+    if added_or_removed:
+        return Classification('full', f'resources added or removed: {", ".join(sorted(added_or_removed))}')
+
+    hotswap_resources = []
+    for logical_id, resource in sorted(synthesized_resources.items()):
+        previous = deployed_resources[logical_id]
+        if resource == previous or resource.get('Type') in IGNORED_RESOURCE_TYPES:
+            continue
+        resource_type = resource.get('Type')
+        if resource_type != previous.get('Type') or \
+                _without_asset_metadata(resource) != _without_asset_metadata(previous):
+            return Classification('full', f'{logical_id} ({resource_type}) changed')
+
+        properties, previous_properties = resource.get('Properties', {}), previous.get('Properties', {})
+        changed = {k for k in set(properties) | set(previous_properties)
+                   if properties.get(k) != previous_properties.get(k)}
+        if not changed:
+            continue
+        if not changed <= HOTSWAPPABLE_PROPERTIES.get(resource_type, set()):
+            return Classification('full', f'{logical_id} ({resource_type}) changed {", ".join(sorted(changed))}')
+        hotswap_resources.append(logical_id)
+
+    if hotswap_resources:
+        return Classification('hotswap', f'only the code of {", ".join(hotswap_resources)} changed', hotswap_resources)
+    return Classification('skip', 'template unchanged')
+
+
+def find_stack(cdk_out: str, stack_name: str) -> tuple:
+    """Returns (display name, template path) of the stack in the cloud assembly, including nested stage assemblies"""
+    for directory, _, files in os.walk(cdk_out):
+        if 'manifest.json' not in files:
+            continue
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            artifacts = json.load(f).get('artifacts', {})
+        for artifact_id, artifact in artifacts.items():
+            properties = artifact.get('properties', {})
+            if artifact.get('type') != 'aws:cloudformation:stack':
+                continue
+            if properties.get('stackName', artifact_id) == stack_name:
+                return artifact.get('displayName', artifact_id), os.path.join(directory, properties['templateFile'])
+    raise ValueError(f'Stack {stack_name} not found in {cdk_out}')
+
+
+def deployed_template(stack_name: str):
+    """Original template of the deployed stack, None if the stack does not exist or is not JSON"""
+    result = subprocess.run(['aws', 'cloudformation', 'get-template', '--stack-name', stack_name,
+                             '--template-stage', 'Original', '--query', 'TemplateBody', '--output', 'json'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    template = json.loads(result.stdout)
+    if isinstance(template, str):
+        try:
+            template = json.loads(template)
+        except ValueError:
+            return None
+    return template
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deploy a stack with hotswap if only Lambda code changed.')
+    parser.add_argument('--cdk-out', default='cdk.out')
+    parser.add_argument('--stack-name', required=True)
+    parser.add_argument('--report', default='fast-deploy-report.json')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    display_name, template_file = find_stack(args.cdk_out, args.stack_name)
+    with open(template_file) as f:
+        synthesized = json.load(f)
+    classification = classify(deployed_template(args.stack_name), synthesized)
+    classify_seconds = time.perf_counter() - start
+    print(f'{args.stack_name}: {classification.mode} deploy, {classification.reason}')
+
+    returncode = 0
+    deploy_start = time.perf_counter()
+    if classification.mode != 'skip':
+        command = ['cdk', 'deploy', '--app', args.cdk_out, '--require-approval', 'never', display_name]
+        if classification.mode == 'hotswap':
+            command.insert(2, '--hotswap')
+        returncode = subprocess.run(command).returncode
+    deploy_seconds = time.perf_counter() - deploy_start
+
+    report = {
+        'stack': args.stack_name,
+        'mode': classification.mode,
+        'reason': classification.reason,
+        'hotswap_resources': classification.hotswap_resources,
+        'succeeded': returncode == 0,
+        'classify_seconds': round(classify_seconds, 3),
+        'deploy_seconds': round(deploy_seconds, 3),
+        'total_seconds': round(time.perf_counter() - start, 3)
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report))
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
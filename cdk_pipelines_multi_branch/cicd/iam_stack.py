@@ -1,6 +1,8 @@
 from aws_cdk.aws_iam import Role, PolicyStatement, ManagedPolicy, ServicePrincipal
 from constructs import Construct
 
+from .code.metrics import NAMESPACE as METRICS_NAMESPACE
+
 
 class IAMPipelineStack(Construct):
     def __init__(self,
@@ -11,9 +13,19 @@ class IAMPipelineStack(Construct):
                  repo_name: str,
                  artifact_bucket_arn: str,
                  codebuild_prefix: str,
+                 registry_table_arn: str,
+                 deploy_project_name: str = None,
+                 destroy_project_name: str = None,
+                 pipeline_name_prefix: str = None,
+                 feature_pipeline_name: str = None,
+                 reaper: bool = False,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        # With shared deploy and teardown projects the Lambda functions only start builds of these two projects
+        shared_projects = deploy_project_name is not None and destroy_project_name is not None
+        project_arn = f'arn:aws:codebuild:{region}:{account}:project'
+
         # IAM Role for the AWS Lambda function which creates the branch resources
         create_branch_role = Role(
             self,
@@ -21,13 +33,19 @@ class IAMPipelineStack(Construct):
             assumed_by=ServicePrincipal('lambda.amazonaws.com'))
         create_branch_role.add_managed_policy(
             ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"))
-        create_branch_role.add_to_policy(PolicyStatement(
-            actions=[
-                'codebuild:CreateProject',
-                'codebuild:StartBuild'
-            ],
-            resources=[f'arn:aws:codebuild:{region}:{account}:project/{codebuild_prefix}*']
-        ))
+        if shared_projects:
+            create_branch_role.add_to_policy(PolicyStatement(
+                actions=['codebuild:StartBuild'],
+                resources=[f'{project_arn}/{deploy_project_name}']
+            ))
+        else:
+            create_branch_role.add_to_policy(PolicyStatement(
+                actions=[
+                    'codebuild:CreateProject',
+                    'codebuild:StartBuild'
+                ],
+                resources=[f'{project_arn}/{codebuild_prefix}*']
+            ))
 
         # IAM Role for the AWS Lambda function which deletes the branch resources
         delete_branch_role = Role(
@@ -36,14 +54,43 @@ class IAMPipelineStack(Construct):
             assumed_by=ServicePrincipal('lambda.amazonaws.com'))
         delete_branch_role.add_managed_policy(
             ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"))
-        delete_branch_role.add_to_policy(PolicyStatement(
-            actions=[
-                'codebuild:StartBuild',
-                'codebuild:DeleteProject',
-                'codebuild:CreateProject'
-            ],
-            resources=[f'arn:aws:codebuild:{region}:{account}:project/{codebuild_prefix}*']
-        ))
+        if shared_projects:
+            destroy_builds_statement = PolicyStatement(
+                actions=['codebuild:StartBuild'],
+                resources=[f'{project_arn}/{destroy_project_name}']
+            )
+        else:
+            destroy_builds_statement = PolicyStatement(
+                actions=[
+                    'codebuild:StartBuild',
+                    'codebuild:DeleteProject',
+                    'codebuild:CreateProject'
+                ],
+                resources=[f'{project_arn}/{codebuild_prefix}*']
+            )
+        delete_branch_role.add_to_policy(destroy_builds_statement)
+        # looks up the branch bundle, ListBucket turns a missing bundle into a 404 instead of a 403
+        artifact_read_statement = PolicyStatement(
+            actions=['s3:GetObject', 's3:ListBucket'],
+            resources=[f'{artifact_bucket_arn}/*', f'{artifact_bucket_arn}']
+        )
+        delete_branch_role.add_to_policy(artifact_read_statement)
+        # conditional state transitions of the branch environment registry
+        registry_statement = PolicyStatement(
+            actions=['dynamodb:GetItem', 'dynamodb:PutItem'],
+            resources=[registry_table_arn]
+        )
+        create_branch_role.add_to_policy(registry_statement)
+        delete_branch_role.add_to_policy(registry_statement)
+
+        # executions of the shared feature pipeline replace the branch builds
+        if feature_pipeline_name:
+            feature_pipeline_statement = PolicyStatement(
+                actions=['codepipeline:StartPipelineExecution'],
+                resources=[f'arn:aws:codepipeline:{region}:{account}:{feature_pipeline_name}']
+            )
+            create_branch_role.add_to_policy(feature_pipeline_statement)
+            delete_branch_role.add_to_policy(feature_pipeline_statement)
 
         # IAM Role for the feature branch AWS CodeBuild project.
         code_build_role = Role(
@@ -65,9 +112,18 @@ class IAMPipelineStack(Construct):
             resources=[f'arn:aws:codecommit:{region}:{account}:{repo_name}']
         ))
         code_build_role.add_to_policy(PolicyStatement(
-            actions=['s3:DeleteObject', 's3:PutObject', 's3:GetObject', 's3:ListBucket'],
+            actions=['s3:DeleteObject', 's3:DeleteObjectVersion', 's3:PutObject', 's3:GetObject', 's3:ListBucket',
+                     's3:ListBucketVersions'],
             resources=[f'{artifact_bucket_arn}/*', f'{artifact_bucket_arn}']
         ))
+        # branch lifecycle latency reported by the generated buildspecs
+        code_build_role.add_to_policy(PolicyStatement(
+            actions=['cloudwatch:PutMetricData'],
+            resources=['*'],
+            conditions={'StringEquals': {'cloudwatch:namespace': METRICS_NAMESPACE}}
+        ))
+        # the generated buildspecs complete the registry transition of their build
+        code_build_role.add_to_policy(registry_statement)
         code_build_role.add_to_policy(PolicyStatement(
             actions=['sts:AssumeRole'],
             resources=[f'arn:*:iam::{account}:role/*'],
@@ -84,6 +140,54 @@ class IAMPipelineStack(Construct):
         code_build_role.grant_pass_role(create_branch_role)
         code_build_role.grant_pass_role(delete_branch_role)
 
+        # IAM Role for the AWS Lambda function which starts the branch pipelines on commits (event triggers only)
+        pipeline_trigger_role = None
+        if pipeline_name_prefix:
+            pipeline_trigger_role = Role(
+                self,
+                'LambdaPipelineTriggerRole',
+                assumed_by=ServicePrincipal('lambda.amazonaws.com'))
+            pipeline_trigger_role.add_managed_policy(
+                ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"))
+            pipeline_trigger_role.add_to_policy(PolicyStatement(
+                actions=['codecommit:GetDifferences'],
+                resources=[f'arn:aws:codecommit:{region}:{account}:{repo_name}']
+            ))
+            pipeline_trigger_role.add_to_policy(PolicyStatement(
+                actions=['codepipeline:StartPipelineExecution'],
+                resources=[f'arn:aws:codepipeline:{region}:{account}:{pipeline_name_prefix}-*']
+            ))
+            if feature_pipeline_name:
+                pipeline_trigger_role.add_to_policy(feature_pipeline_statement)
+                # commit deploys of the shared feature pipeline are recorded in the registry
+                pipeline_trigger_role.add_to_policy(registry_statement)
+
+        # IAM Role for the scheduled AWS Lambda function which tears down orphaned and idle branch environments
+        reaper_role = None
+        if reaper:
+            reaper_role = Role(
+                self,
+                'LambdaReapBranchesRole',
+                assumed_by=ServicePrincipal('lambda.amazonaws.com'))
+            reaper_role.add_managed_policy(
+                ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"))
+            reaper_role.add_to_policy(PolicyStatement(
+                actions=['codecommit:ListBranches', 'codecommit:GetBranch', 'codecommit:BatchGetCommits'],
+                resources=[f'arn:aws:codecommit:{region}:{account}:{repo_name}']
+            ))
+            reaper_role.add_to_policy(PolicyStatement(
+                actions=['cloudformation:ListStacks'],
+                resources=['*']
+            ))
+            reaper_role.add_to_policy(destroy_builds_statement)
+            reaper_role.add_to_policy(artifact_read_statement)
+            reaper_role.add_to_policy(registry_statement)
+            if feature_pipeline_name:
+                reaper_role.add_to_policy(feature_pipeline_statement)
+            code_build_role.grant_pass_role(reaper_role)
+
         self.create_branch_role = create_branch_role
         self.delete_branch_role = delete_branch_role
+        self.reaper_role = reaper_role
         self.code_build_role = code_build_role
+        self.pipeline_trigger_role = pipeline_trigger_role
@@ -0,0 +1,183 @@
+"""
+Bootstraps the development, production and deployment wave targets concurrently and deploys the pipeline of the
+default branch. initial-deploy.sh passes its arguments on:
+
+    python -m cdk_pipelines_multi_branch.cicd.initial_deploy --dev_account_id 111111111111 --dev_profile_name dev \\
+        --prod_account_id 222222222222 --prod_profile_name prod [--profile_<account id> <profile>] [--dry-run]
+
+The target matrix is the development and production account in the region of config.ini, the targets of the
+deployment waves and the optional `targets` of the [bootstrap] section. A target whose CDKToolkit stack already
+has the bootstrap version of the CDK CLI, the trusted accounts and the execution policies is skipped.
+"""
+import argparse
+import configparser
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cdk_pipelines_multi_branch.cicd.code.branch_events import error_code
+from cdk_pipelines_multi_branch.cicd.default_branch_resolver import DefaultBranchResolver
+from cdk_pipelines_multi_branch.cicd.waves import DeploymentTarget, bootstrap_targets, load_waves
+
+EXECUTION_POLICY = 'arn:aws:iam::aws:policy/AdministratorAccess'
+TOOLKIT_STACK_NAME = 'CDKToolkit'
+REQUIRED_ARGUMENTS = ('dev_account_id', 'dev_profile_name', 'prod_account_id', 'prod_profile_name')
+
+
+class BootstrapTarget:
+
+    def __init__(self, target: DeploymentTarget, profile: str, trust: str = None) -> None:
+        self.target = target
+        self.profile = profile
+        self.trust = trust
+
+    def command(self) -> list:
+        command = ['npx', 'cdk', 'bootstrap', '--profile', self.profile]
+        if self.trust:
+            command += ['--trust', self.trust]
+        return command + ['--cloudformation-execution-policies', EXECUTION_POLICY,
+                          f'aws://{self.target.account}/{self.target.region}']
+
+    def __repr__(self) -> str:
+        return repr(self.target)
+
+
+def target_matrix(global_config, dev_account_id: str, prod_account_id: str, profiles: dict) -> list:
+    """Bootstrap targets in order, the production and wave targets trust the development account"""
+    region = global_config.get('general', 'region')
+    variables = dict(os.environ, DEV_ACCOUNT_ID=dev_account_id, PROD_ACCOUNT_ID=prod_account_id)
+    targets = [DeploymentTarget(dev_account_id, region), DeploymentTarget(prod_account_id, region)]
+    extra = [DeploymentTarget.parse(t, variables)
+             for t in global_config.get('bootstrap', 'targets', fallback='').split(',') if t.strip()]
+    for target in bootstrap_targets(load_waves(global_config, variables), dev_account_id) + extra:
+        if target not in targets:
+            targets.append(target)
+    # the development account in the pipeline region is the only target without a trust
+    return [BootstrapTarget(target, profiles.get(target.account, profiles[prod_account_id]),
+                            None if target == targets[0] else dev_account_id)
+            for target in targets]
+
+
+def required_version(show_template: str) -> int:
+    """Bootstrap version of the template of `cdk bootstrap --show-template`"""
+    match = re.search(r'CdkBootstrapVersion:.*?Value:\s*["\']?(\d+)', show_template, re.DOTALL)
+    if not match:
+        raise ValueError('No CdkBootstrapVersion in the bootstrap template')
+    return int(match.group(1))
+
+
+def toolkit_stack(bootstrap_target: BootstrapTarget):
+    """Outputs and parameters of the CDKToolkit stack of the target, None if it is not deployed"""
+    import boto3
+
+    session = boto3.Session(profile_name=bootstrap_target.profile)
+    cloudformation = session.client('cloudformation', region_name=bootstrap_target.target.region)
+    try:
+        stack = cloudformation.describe_stacks(StackName=TOOLKIT_STACK_NAME)['Stacks'][0]
+    except Exception as e:
+        # CloudFormation reports a missing stack as a ValidationError, which is also raised for other causes
+        if error_code(e) == 'ValidationError' and 'does not exist' in str(e):
+            return None
+        raise
+    if stack['StackStatus'].endswith('_FAILED') or stack['StackStatus'].startswith('ROLLBACK'):
+        return None
+    return {
+        'outputs': {o['OutputKey']: o['OutputValue'] for o in stack.get('Outputs', [])},
+        'parameters': {p['ParameterKey']: p.get('ParameterValue', '') for p in stack.get('Parameters', [])}
+    }
+
+
+def is_current(stack, bootstrap_target: BootstrapTarget, version: int) -> bool:
+    if not stack:
+        return False
+    deployed_version = int(stack['outputs'].get('BootstrapVersion', 0))
+    trusted = set(filter(None, stack['parameters'].get('TrustedAccounts', '').split(',')))
+    policies = set(filter(None, stack['parameters'].get('CloudFormationExecutionPolicies', '').split(',')))
+    return deployed_version >= version and (not bootstrap_target.trust or bootstrap_target.trust in trusted) \
+        and EXECUTION_POLICY in policies
+
+
+def bootstrap(bootstrap_target: BootstrapTarget, version: int, dry_run: bool) -> dict:
+    start = time.perf_counter()
+    result = {'target': repr(bootstrap_target), 'profile': bootstrap_target.profile}
+    try:
+        if is_current(toolkit_stack(bootstrap_target), bootstrap_target, version):
+            result['action'] = 'current'
+        elif dry_run:
+            result['action'] = 'would bootstrap'
+        else:
+            process = subprocess.run(bootstrap_target.command(), capture_output=True, text=True)
+            result['action'] = 'bootstrapped' if process.returncode == 0 else 'failed'
+            if process.returncode != 0:
+                result['error'] = (process.stderr or process.stdout).strip()[-2000:]
+    except Exception as e:
+        result['action'] = 'failed'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start, 1)
+    return result
+
+
+def parse_arguments(argv: list):
+    parser = argparse.ArgumentParser(description='Bootstrap the target accounts and deploy the default pipeline.')
+    for name in REQUIRED_ARGUMENTS:
+        parser.add_argument(f'--{name}')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--max_workers', '--max-workers', type=int)
+    parser.add_argument('--dry-run', '--dry_run', action='store_true', help='only print the bootstrap plan')
+    args, unknown = parser.parse_known_args(argv)
+
+    # --profile_<account id> <profile> for the targets in other accounts
+    profiles = {}
+    while unknown:
+        option = unknown.pop(0)
+        if not option.startswith('--profile_') or not unknown:
+            parser.error(f'unrecognized argument: {option}')
+        profiles[option[len('--profile_'):]] = unknown.pop(0)
+
+    missing = [name for name in REQUIRED_ARGUMENTS if not getattr(args, name)]
+    if missing:
+        parser.error(f'The following parameters are required: {", ".join("--" + name for name in missing)}')
+    profiles.setdefault(args.dev_account_id, args.dev_profile_name)
+    profiles.setdefault(args.prod_account_id, args.prod_profile_name)
+    return args, profiles
+
+
+def main(argv: list = None):
+    args, profiles = parse_arguments(sys.argv[1:] if argv is None else argv)
+    global_config = configparser.ConfigParser()
+    global_config.read(args.config)
+    max_workers = args.max_workers or global_config.getint('bootstrap', 'max_workers', fallback=8)
+
+    targets = target_matrix(global_config, args.dev_account_id, args.prod_account_id, profiles)
+    template = subprocess.run(['npx', 'cdk', 'bootstrap', '--show-template'], capture_output=True, text=True,
+                              check=True).stdout
+    version = required_version(template)
+    print(f'Bootstrap version {version}, {len(targets)} targets, {max_workers} workers')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(lambda t: bootstrap(t, version, args.dry_run), targets))
+    print(f'{"target":32} {"profile":20} {"action":16} {"seconds":>8}')
+    for result in results:
+        print(f'{result["target"]:32} {result["profile"]:20} {result["action"]:16} {result["seconds"]:>8.1f}')
+    print(f'Bootstrap finished in {time.perf_counter() - start:.1f}s')
+
+    failed = [r for r in results if r['action'] == 'failed']
+    for result in failed:
+        print(f'\n{result["target"]} failed:\n{result["error"]}')
+    if failed or args.dry_run:
+        return 1 if failed else 0
+
+    branch = DefaultBranchResolver.from_config(global_config).resolve()
+    env = dict(os.environ, DEV_ACCOUNT_ID=args.dev_account_id, PROD_ACCOUNT_ID=args.prod_account_id, BRANCH=branch)
+    start = time.perf_counter()
+    returncode = subprocess.run(['cdk', 'deploy', f'cdk-pipelines-multi-branch-{branch}'], env=env).returncode
+    print(f'Deploy of cdk-pipelines-multi-branch-{branch} finished in {time.perf_counter() - start:.1f}s')
+    return returncode
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Runtime settings of the branch Lambda functions.
+
+The memory size, architecture, runtime and SnapStart of the branch create and destroy functions are read from
+the optional [lambda] section of config.ini, the defaults are those of the functions before the section existed.
+"""
+from aws_cdk.aws_lambda import Alias, Architecture, Runtime, RuntimeFamily
+
+ARCHITECTURES = {'x86_64': Architecture.X86_64, 'arm64': Architecture.ARM_64}
+# Lambda supports SnapStart for Python from python3.12 on
+SNAP_START_MIN_PYTHON = (3, 12)
+
+
+class LambdaSettings:
+
+    def __init__(self, memory_size: int = 128, architecture: str = 'x86_64', runtime: str = 'python3.9',
+                 snap_start: bool = False) -> None:
+        if architecture not in ARCHITECTURES:
+            raise ValueError(f'Unknown architecture {architecture}, expected one of {", ".join(ARCHITECTURES)}')
+        if not runtime.startswith('python3.'):
+            raise ValueError(f'Unknown runtime {runtime}, expected python3.<minor>')
+        if snap_start and python_version(runtime) < SNAP_START_MIN_PYTHON:
+            raise ValueError(f'SnapStart needs python{".".join(map(str, SNAP_START_MIN_PYTHON))} or later, '
+                             f'the runtime is {runtime}')
+        self.memory_size = memory_size
+        self.architecture = architecture
+        self.runtime = runtime
+        self.snap_start = snap_start
+
+    @classmethod
+    def from_config(cls, global_config):
+        """Reads the optional [lambda] section of config.ini"""
+        return cls(
+            memory_size=global_config.getint('lambda', 'memory_size', fallback=128),
+            architecture=global_config.get('lambda', 'architecture', fallback='x86_64'),
+            runtime=global_config.get('lambda', 'runtime', fallback='python3.9'),
+            snap_start=global_config.getboolean('lambda', 'snap_start', fallback=False))
+
+    def function_args(self) -> dict:
+        """Function properties, the runtime is declared by name as CDK 2.23 does not know the newer ones"""
+        return {
+            'memory_size': self.memory_size,
+            'architecture': ARCHITECTURES[self.architecture],
+            'runtime': Runtime(self.runtime, RuntimeFamily.PYTHON)
+        }
+
+    def invocation_target(self, function):
+        """The function, or an alias of its current version if SnapStart is enabled"""
+        if not self.snap_start:
+            return function
+        # CDK 2.23 cannot declare SnapStart yet, snapshots are only taken of published versions
+        function.node.default_child.add_property_override('SnapStart', {'ApplyOn': 'PublishedVersions'})
+        return Alias(function, 'Live', alias_name='live', version=function.current_version)
+
+
+def python_version(runtime: str) -> tuple:
+    return tuple(int(part) for part in runtime[len('python'):].split('.'))
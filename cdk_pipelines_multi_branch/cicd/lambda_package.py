@@ -0,0 +1,39 @@
+"""
+Assets of the Lambda functions whose handlers live in cicd/code.
+
+Each function is packaged with the modules its handler imports, directly or through other modules of the
+directory. The handlers share most modules, so this hardly changes the size of a package, but a change of a
+module a handler does not import, e.g. a script run by the builds, does not change its asset and redeploy it.
+"""
+import ast
+import os
+
+
+def local_imports(code_dir: str, module: str) -> set:
+    """Modules of code_dir imported by module, including module and the imports of the imported modules"""
+    modules = set()
+    pending = [module]
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        modules.add(name)
+        with open(os.path.join(code_dir, f'{name}.py')) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                names = [node.module]
+            else:
+                continue
+            pending += [n for n in names if os.path.isfile(os.path.join(code_dir, f'{n}.py'))]
+    return modules
+
+
+def package_excludes(code_dir: str, handler_module: str) -> list:
+    """Asset exclude patterns of the files of code_dir the handler does not import"""
+    modules = local_imports(code_dir, handler_module)
+    return ['__pycache__', '*.pyc'] + sorted(
+        name for name in os.listdir(code_dir)
+        if name != '__pycache__' and not (name.endswith('.py') and name[:-3] in modules))
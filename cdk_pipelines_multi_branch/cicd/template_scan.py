@@ -0,0 +1,128 @@
+"""
+Scans every CloudFormation template of a cloud assembly with cfn_nag in parallel.
+
+Results are cached by template content hash and cfn_nag version, so unchanged templates are not
+scanned again, and consolidated into one JSON report. Run from the Synth step after `cdk synth`:
+
+    python -m cdk_pipelines_multi_branch.cicd.template_scan --cdk-out cdk.out --enforce '*InfraStack*'
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def find_templates(cdk_out: str) -> list:
+    """Templates of all stacks, including the stacks of nested stage assemblies"""
+    templates = []
+    for directory, _, files in os.walk(cdk_out):
+        templates += [os.path.join(directory, f) for f in files if f.endswith('.template.json')]
+    return sorted(templates)
+
+
+def cfn_nag_version() -> str:
+    try:
+        result = subprocess.run(['cfn_nag_scan', '--version'], capture_output=True, text=True, check=True)
+        return result.stdout.strip() or 'unknown'
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def default_cache_dir() -> str:
+    # inside the dependency cache of the build if there is one, see build_cache.py
+    return os.path.join(os.environ.get('DEPS_CACHE_DIR', '.'), '.cfn-nag-cache')
+
+
+class TemplateScanner:
+
+    def __init__(self, cache_dir: str, version: str) -> None:
+        self.cache_dir = os.path.join(cache_dir, hashlib.sha256(version.encode()).hexdigest()[:16])
+        self.version = version
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def scan(self, template: str) -> dict:
+        with open(template, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cache_file = os.path.join(self.cache_dir, f'{digest}.json')
+
+        cached = os.path.exists(cache_file)
+        if cached:
+            with open(cache_file) as f:
+                file_results = json.load(f)
+        else:
+            file_results = self._run_cfn_nag(template)
+            with open(f'{cache_file}.tmp', 'w') as f:
+                json.dump(file_results, f)
+            os.replace(f'{cache_file}.tmp', cache_file)
+
+        violations = file_results.get('violations', [])
+        return {
+            'template': template,
+            'sha256': digest,
+            'cached': cached,
+            'failure_count': file_results.get('failure_count', 0),
+            'warning_count': sum(1 for v in violations if v.get('type') == 'WARN'),
+            'violations': violations
+        }
+
+    @staticmethod
+    def _run_cfn_nag(template: str) -> dict:
+        # cfn_nag_scan exits non-zero when there are failures, the JSON output is still complete
+        result = subprocess.run(['cfn_nag_scan', '--input-path', template, '--output-format', 'json'],
+                                capture_output=True, text=True)
+        try:
+            return json.loads(result.stdout)[0]['file_results']
+        except (ValueError, IndexError, KeyError):
+            raise RuntimeError(f'cfn_nag_scan failed for {template}: {result.stderr.strip()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scan all templates of a cloud assembly with cfn_nag.')
+    parser.add_argument('--cdk-out', default='cdk.out')
+    parser.add_argument('--report', default=None, help='report file, defaults to <cdk-out>/cfn_nag_report.json')
+    parser.add_argument('--cache-dir', default=default_cache_dir())
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    parser.add_argument('--enforce', action='append', default=[],
+                        help='glob of the templates whose failures fail the scan (default: all), repeatable')
+    args = parser.parse_args()
+
+    templates = find_templates(args.cdk_out)
+    scanner = TemplateScanner(args.cache_dir, cfn_nag_version())
+    with ThreadPoolExecutor(max_workers=args.max_workers) as pool:
+        results = list(pool.map(scanner.scan, templates))
+
+    enforced = args.enforce or ['*']
+    for result in results:
+        result['enforced'] = any(fnmatch.fnmatch(result['template'], pattern) for pattern in enforced)
+    failed = [r for r in results if r['enforced'] and r['failure_count']]
+
+    report = {
+        'tool': 'cfn_nag',
+        'version': scanner.version,
+        'summary': {
+            'templates': len(results),
+            'cached': sum(1 for r in results if r['cached']),
+            'failures': sum(r['failure_count'] for r in results),
+            'warnings': sum(r['warning_count'] for r in results),
+            'failed_templates': [r['template'] for r in failed]
+        },
+        'templates': results
+    }
+    report_file = args.report or os.path.join(args.cdk_out, 'cfn_nag_report.json')
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        status = 'FAIL' if result in failed else 'info' if result['failure_count'] else 'ok'
+        print(f"{status:4} {result['failure_count']:3} failures "
+              f"{result['warning_count']:3} warnings {'(cached) ' if result['cached'] else ''}{result['template']}")
+    print(f'Report written to {report_file}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
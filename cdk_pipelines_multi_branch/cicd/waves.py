@@ -0,0 +1,110 @@
+"""
+Deployment waves of the default branch pipeline, read from config.ini.
+
+The `names` option of the [waves] section lists the waves in deployment order, each wave has a
+[wave.<name>] section. The stages of the targets of a wave deploy concurrently, the next wave starts
+when all of them (and the validate command) succeeded. Run as a module to print the accounts and
+regions to bootstrap:
+
+    python -m cdk_pipelines_multi_branch.cicd.waves --dev-account-id 111111111111
+"""
+import argparse
+import configparser
+import os
+import re
+from string import Template
+
+ACCOUNT_PATTERN = re.compile(r'\d{12}\Z')
+
+
+class DeploymentTarget:
+
+    def __init__(self, account: str, region: str) -> None:
+        if not ACCOUNT_PATTERN.match(account):
+            raise ValueError(f'Invalid account id {account!r} in deployment target {account}/{region}')
+        self.account = account
+        self.region = region
+
+    @classmethod
+    def parse(cls, value: str, variables: dict):
+        """Parses <account>/<region>, ${VAR} references are replaced from variables"""
+        try:
+            value = Template(value.strip()).substitute(variables)
+        except KeyError as e:
+            raise ValueError(f'Deployment target {value!r} references {e.args[0]}, which is not set')
+        account, _, region = value.partition('/')
+        if not region:
+            raise ValueError(f'Deployment target {value!r} is not in the format <account>/<region>')
+        return cls(account, region)
+
+    def stage_id(self, wave_name: str) -> str:
+        return f'{wave_name}-{self.account}-{self.region}'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DeploymentTarget) and (self.account, self.region) == (other.account, other.region)
+
+    def __hash__(self) -> int:
+        return hash((self.account, self.region))
+
+    def __repr__(self) -> str:
+        return f'{self.account}/{self.region}'
+
+
+class Wave:
+
+    def __init__(self, name: str, targets: list, approval: bool = False, validate: str = None) -> None:
+        if not targets:
+            raise ValueError(f'Wave {name} has no targets')
+        if len(set(targets)) != len(targets):
+            raise ValueError(f'Wave {name} lists a target more than once')
+        self.name = name
+        self.targets = targets
+        self.approval = approval
+        self.validate = validate or None
+
+
+def load_waves(global_config, variables: dict = None) -> list:
+    """Waves of the [waves] section in order, an empty list if no wave is configured"""
+    variables = dict(os.environ) if variables is None else variables
+    names = [n.strip() for n in global_config.get('waves', 'names', fallback='').split(',') if n.strip()]
+    waves = []
+    for name in names:
+        section = f'wave.{name}'
+        if not global_config.has_section(section):
+            raise ValueError(f'Wave {name} is listed in [waves] but has no [{section}] section')
+        targets = [DeploymentTarget.parse(t, variables)
+                   for t in global_config.get(section, 'targets', fallback='').split(',') if t.strip()]
+        waves.append(Wave(
+            name,
+            targets,
+            approval=global_config.getboolean(section, 'approval', fallback=False),
+            validate=global_config.get(section, 'validate', fallback=None)))
+    return waves
+
+
+def bootstrap_targets(waves: list, dev_account_id: str) -> list:
+    """Every wave target, plus the development account in every wave region for the pipeline's replication buckets"""
+    targets = []
+    for wave in waves:
+        for target in wave.targets:
+            for candidate in (DeploymentTarget(dev_account_id, target.region), target):
+                if candidate not in targets:
+                    targets.append(candidate)
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the accounts and regions of the deployment waves.')
+    parser.add_argument('--config', default='config.ini')
+    parser.add_argument('--dev-account-id', required=True)
+    args = parser.parse_args()
+
+    global_config = configparser.ConfigParser()
+    global_config.read(args.config)
+    variables = dict(os.environ, DEV_ACCOUNT_ID=args.dev_account_id)
+    for target in bootstrap_targets(load_waves(global_config, variables), args.dev_account_id):
+        print(target.account, target.region)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,19 +5,21 @@ from .s3trigger.s3trigger_stack import S3TriggerConstruct
 
 
 class InfraStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, branch: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, branch: str, s3_trigger_batch_size: int = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         # - combines single constructs in src/ to one stack
-        S3TriggerConstruct(self, f'S3Trigger-${branch}')
+        S3TriggerConstruct(self, f'S3Trigger-${branch}', batch_size=s3_trigger_batch_size)
 
 
 class MainStage(Stage):
 
-    def __init__(self, scope: Construct, construct_id: str, branch: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, branch: str, s3_trigger_batch_size: int = None,
+                 **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
         main_stack_name = 'InfraStack'
-        InfraStack(self, f'{main_stack_name}-{branch}', branch)
+        InfraStack(self, f'{main_stack_name}-{branch}', branch, s3_trigger_batch_size)
 
         self.main_stack_name = main_stack_name
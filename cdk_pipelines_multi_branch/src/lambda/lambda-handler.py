@@ -1,3 +1,23 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', str(1024 * 1024)))
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '8'))
+
+_s3 = None
+
+
+def s3_client():
+    global _s3
+    if _s3 is None:
+        import boto3
+        _s3 = boto3.client('s3')
+    return _s3
+
+
 def main(event, context):
     # save event to logs
     print(event)
@@ -5,4 +25,38 @@ def main(event, context):
     return {
         'statusCode': 200,
         'body': event
-    }
\ No newline at end of file
+    }
+
+
+def process_object(bucket, key):
+    # stream the object instead of loading it into memory
+    body = s3_client().get_object(Bucket=bucket, Key=key)['Body']
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in body.iter_chunks(chunk_size=CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    return {'bucket': bucket, 'key': key, 'size': size, 'sha256': digest.hexdigest()}
+
+
+def process_message(record):
+    notification = json.loads(record['body'])
+    # s3:TestEvent notifications have no records
+    return [process_object(r['s3']['bucket']['name'], unquote_plus(r['s3']['object']['key']))
+            for r in notification.get('Records', [])]
+
+
+def batch_main(event, context):
+    # process the SQS batch concurrently, failed messages are returned to the queue
+    failures = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {record['messageId']: pool.submit(process_message, record) for record in event['Records']}
+    for message_id, future in futures.items():
+        try:
+            for result in future.result():
+                print(json.dumps(result))
+        except Exception as e:
+            print(json.dumps({'messageId': message_id, 'error': str(e)}))
+            failures.append({'itemIdentifier': message_id})
+
+    return {'batchItemFailures': failures}
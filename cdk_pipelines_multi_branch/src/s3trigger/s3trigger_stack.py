@@ -1,25 +1,78 @@
+from os import path
+
 from aws_cdk import (
+    Duration,
+    RemovalPolicy,
+    aws_iam as _iam,
+    aws_kms as _kms,
     aws_lambda as _lambda,
+    aws_lambda_event_sources as _event_sources,
     aws_s3 as _s3,
-    aws_s3_notifications
+    aws_s3_notifications,
+    aws_sqs as _sqs
 )
 from constructs import Construct
 
+# absolute, so the app can be synthesized from any working directory
+LAMBDA_CODE_DIR = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'lambda')
+
+
 class S3TriggerConstruct(Construct):
 
-    def __init__(self, scope: Construct, id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, id: str, batch_size: int = None, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
-        # create lambda function
-        function = _lambda.Function(self, "lambda_function",
-                                    runtime=_lambda.Runtime.PYTHON_3_9,
-                                    handler="lambda-handler.main",
-                                    code=_lambda.Code.from_asset("./cdk_pipelines_multi_branch/src/lambda"))
         # create s3 bucket
         s3 = _s3.Bucket(self, "s3bucket")
 
-        # create s3 notification for lambda function
-        notification = aws_s3_notifications.LambdaDestination(function)
+        if not batch_size:
+            # create lambda function
+            function = _lambda.Function(self, "lambda_function",
+                                        runtime=_lambda.Runtime.PYTHON_3_9,
+                                        handler="lambda-handler.main",
+                                        code=_lambda.Code.from_asset(LAMBDA_CODE_DIR))
+
+            # create s3 notification for lambda function
+            notification = aws_s3_notifications.LambdaDestination(function)
+
+            # assign notification for the s3 event type (ex: OBJECT_CREATED)
+            s3.add_event_notification(_s3.EventType.OBJECT_CREATED, notification)
+            return
+
+        # batched mode: notifications are buffered in a queue and processed batch_size at a time.
+        # The key is destroyed with the stack, so torn down feature branch stacks leave no key behind.
+        key = _kms.Key(self, "queue_key", enable_key_rotation=True, removal_policy=RemovalPolicy.DESTROY)
+        key.grant_encrypt_decrypt(_iam.ServicePrincipal("s3.amazonaws.com"))
+        dead_letter_queue = _sqs.Queue(self, "dead_letter_queue",
+                                       encryption=_sqs.QueueEncryption.KMS,
+                                       encryption_master_key=key,
+                                       retention_period=Duration.days(14))
+        queue = _sqs.Queue(self, "queue",
+                           encryption=_sqs.QueueEncryption.KMS,
+                           encryption_master_key=key,
+                           visibility_timeout=Duration.minutes(6),
+                           dead_letter_queue=_sqs.DeadLetterQueue(max_receive_count=5, queue=dead_letter_queue))
+        for q in (queue, dead_letter_queue):
+            q.add_to_resource_policy(_iam.PolicyStatement(
+                sid='AllowSSLRequestsOnly',
+                actions=['sqs:*'],
+                effect=_iam.Effect.DENY,
+                resources=[q.queue_arn],
+                conditions={"Bool": {"aws:SecureTransport": "false"}},
+                principals=[_iam.AnyPrincipal()]))
+
+        # create lambda function processing the notifications in batches
+        function = _lambda.Function(self, "lambda_function",
+                                    runtime=_lambda.Runtime.PYTHON_3_9,
+                                    handler="lambda-handler.batch_main",
+                                    timeout=Duration.minutes(1),
+                                    memory_size=512,
+                                    code=_lambda.Code.from_asset(LAMBDA_CODE_DIR))
+        s3.grant_read(function)
+        function.add_event_source(_event_sources.SqsEventSource(queue,
+                                                                batch_size=batch_size,
+                                                                max_batching_window=Duration.seconds(5),
+                                                                report_batch_item_failures=True))
 
-        # assign notification for the s3 event type (ex: OBJECT_CREATED)
-        s3.add_event_notification(_s3.EventType.OBJECT_CREATED, notification)
\ No newline at end of file
+        # assign the queue notification for the s3 event type (ex: OBJECT_CREATED)
+        s3.add_event_notification(_s3.EventType.OBJECT_CREATED, aws_s3_notifications.SqsDestination(queue))
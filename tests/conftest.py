@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules of the app which do not need the CDK are imported from the package
+sys.path.insert(0, ROOT)
+# the Lambda function code imports its sibling modules as top-level modules
+sys.path.insert(0, os.path.join(ROOT, 'cdk_pipelines_multi_branch', 'cicd', 'code'))
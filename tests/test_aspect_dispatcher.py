@@ -0,0 +1,85 @@
+from cdk_pipelines_multi_branch.cicd.aspects.handler_index import HandlerIndex
+
+
+class Resource:
+    pass
+
+
+class Bucket(Resource):
+    pass
+
+
+class Queue(Resource):
+    pass
+
+
+class TagAspect:
+
+    def __init__(self, tag: str, visited: list) -> None:
+        self.tag = tag
+        self.visited = visited
+
+    def visit(self, node) -> None:
+        self.visited.append((self.tag, type(node).__name__))
+
+
+def test_handlers_match_subclasses_of_their_types():
+    visited = []
+    resource_aspect = TagAspect('resource', visited)
+    queue_aspect = TagAspect('queue', visited)
+    index = HandlerIndex()
+    index.add(resource_aspect, Resource)
+    index.add(queue_aspect, Queue)
+
+    assert index.handlers(Bucket) == (resource_aspect.visit,)
+    assert index.handlers(Queue) == (resource_aspect.visit, queue_aspect.visit)
+    assert index.handlers(str) == ()
+
+
+def test_catch_all_handlers_follow_the_typed_ones():
+    calls = []
+    index = HandlerIndex()
+    index.add(lambda node: calls.append('all'))
+    index.add(lambda node: calls.append('bucket'), Bucket)
+
+    for handler in index.handlers(Bucket):
+        handler(Bucket())
+    for handler in index.handlers(Queue):
+        handler(Queue())
+
+    assert calls == ['bucket', 'all', 'all']
+
+
+def test_handlers_added_after_a_lookup_are_routed():
+    index = HandlerIndex()
+    first = TagAspect('first', [])
+    index.add(first, Bucket)
+    assert len(index.handlers(Bucket)) == 1
+
+    index.add(TagAspect('second', []), Bucket)
+
+    assert len(index.handlers(Bucket)) == 2
+    assert index.handlers(Queue) == ()
+
+
+def test_the_same_handler_is_registered_once():
+    index = HandlerIndex()
+    aspect = TagAspect('first', [])
+
+    assert index.add(aspect, Bucket)
+    assert not index.add(aspect, Bucket)
+    # for other types it is a separate registration
+    assert index.add(aspect, Queue)
+    assert len(index.handlers(Bucket)) == 1
+
+
+def test_differently_configured_instances_of_an_aspect_class_both_apply():
+    visited = []
+    index = HandlerIndex()
+    index.add(TagAspect('team-a', visited), Bucket)
+    index.add(TagAspect('team-b', visited), Bucket)
+
+    for handler in index.handlers(Bucket):
+        handler(Bucket())
+
+    assert visited == [('team-a', 'Bucket'), ('team-b', 'Bucket')]
@@ -0,0 +1,181 @@
+import pytest
+
+import branch_registry
+from branch_registry import (
+    CREATING, DESTROYED, DESTROYING, FAILED, MAX_WRITE_ATTEMPTS, READY, BranchRegistry, ConditionFailed,
+    InMemoryBackend, SQLiteBackend
+)
+from compute_sizing import BuildSample
+
+EVENT_TIME = 1_700_000_000
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def registry(request, tmp_path):
+    if request.param == 'memory':
+        return BranchRegistry(InMemoryBackend())
+    return BranchRegistry(SQLiteBackend(str(tmp_path / 'registry.db')))
+
+
+def test_begin_creates_the_record(registry):
+    record = registry.begin('feature-1', CREATING, EVENT_TIME)
+
+    assert record['state'] == CREATING
+    assert record['version'] == 1
+    assert registry.get('feature-1')['event_time'] == EVENT_TIME
+
+
+def test_duplicate_event_is_skipped(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+
+    # a concurrent delivery while the first one holds the lease
+    assert registry.begin('feature-1', CREATING, EVENT_TIME) is None
+
+    registry.set_build('feature-1', EVENT_TIME, 'build:1')
+    # a redelivery after the build was started
+    assert registry.begin('feature-1', CREATING, EVENT_TIME) is None
+    assert registry.get('feature-1')['build_id'] == 'build:1'
+
+
+def test_older_event_is_skipped(registry):
+    registry.begin('feature-1', DESTROYING, EVENT_TIME)
+
+    assert registry.begin('feature-1', CREATING, EVENT_TIME - 10) is None
+    assert registry.get('feature-1')['state'] == DESTROYING
+
+
+def test_release_lets_the_retry_of_the_event_proceed(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.release('feature-1', EVENT_TIME)
+
+    record = registry.begin('feature-1', CREATING, EVENT_TIME)
+
+    assert record is not None
+    assert record['version'] == 3
+
+
+def test_release_does_not_unlock_a_started_build(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.set_build('feature-1', EVENT_TIME, 'build:1')
+
+    assert registry.release('feature-1', EVENT_TIME) is None
+    assert registry.begin('feature-1', CREATING, EVENT_TIME) is None
+
+
+def test_branch_deleted_within_the_same_second(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.set_build('feature-1', EVENT_TIME, 'build:1')
+
+    record = registry.begin('feature-1', DESTROYING, EVENT_TIME)
+
+    assert record['state'] == DESTROYING
+    # the create event cannot overwrite the delete of the same second
+    assert registry.begin('feature-1', CREATING, EVENT_TIME) is None
+
+
+def test_finish_completes_the_transition(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    assert registry.finish('feature-1', EVENT_TIME, succeeded=True)['state'] == READY
+
+    registry.begin('feature-2', CREATING, EVENT_TIME)
+    assert registry.finish('feature-2', EVENT_TIME, succeeded=False)['state'] == FAILED
+
+    registry.begin('feature-1', DESTROYING, EVENT_TIME + 60)
+    record = registry.finish('feature-1', EVENT_TIME + 60, succeeded=True)
+    assert record['state'] == DESTROYED
+    assert record['expires_at'] > EVENT_TIME
+
+
+def test_finish_superseded_by_a_newer_event(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.begin('feature-1', DESTROYING, EVENT_TIME + 60)
+
+    assert registry.finish('feature-1', EVENT_TIME, succeeded=True) is None
+    assert registry.get('feature-1')['state'] == DESTROYING
+
+
+def test_list_hides_expired_tombstones(registry, monkeypatch):
+    registry.begin('feature-1', DESTROYING, EVENT_TIME)
+    registry.finish('feature-1', EVENT_TIME, succeeded=True)
+    registry.begin('feature-2', CREATING, EVENT_TIME)
+
+    assert [r['branch'] for r in registry.list()] == ['feature-1', 'feature-2']
+    now = branch_registry.time.time()
+    monkeypatch.setattr(branch_registry.time, 'time', lambda: now + branch_registry.TOMBSTONE_TTL + 1)
+    assert [r['branch'] for r in registry.list()] == ['feature-2']
+
+
+class ConflictingBackend(InMemoryBackend):
+    """Every write loses the race against a concurrent writer"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.puts = 0
+
+    def put(self, item: dict, expected_version) -> None:
+        self.puts += 1
+        raise ConditionFailed(item['branch'])
+
+
+def test_condition_failed_after_max_write_attempts():
+    backend = ConflictingBackend()
+
+    with pytest.raises(ConditionFailed):
+        BranchRegistry(backend).begin('feature-1', CREATING, EVENT_TIME)
+    assert backend.puts == MAX_WRITE_ATTEMPTS
+
+
+def test_sizing_falls_back_to_the_builds_of_all_branches(registry):
+    sample = BuildSample('BUILD_GENERAL1_MEDIUM', 600, 0.5, True)
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.finish('feature-1', EVENT_TIME, succeeded=True, sample=sample)
+
+    record = registry.begin('feature-2', CREATING, EVENT_TIME + 60)
+
+    assert registry.build_history(record, CREATING) == []
+    assert [s.compute_type for s in registry.sizing_history(record, CREATING)] == ['BUILD_GENERAL1_MEDIUM']
+    assert registry.sizing_history(record, DESTROYING) == []
+    # the aggregate record is no branch environment
+    assert [r['branch'] for r in registry.list()] == ['feature-1', 'feature-2']
+
+
+def test_sizing_prefers_the_builds_of_the_branch(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.finish('feature-1', EVENT_TIME, True, BuildSample('BUILD_GENERAL1_LARGE', 600, 0.5, True))
+    registry.begin('feature-2', DESTROYING, EVENT_TIME)
+    registry.finish('feature-2', EVENT_TIME, True, BuildSample('BUILD_GENERAL1_SMALL', 300, 0.2, True))
+
+    record = registry.begin('feature-2', CREATING, EVENT_TIME + 60)
+    registry.finish('feature-2', EVENT_TIME + 60, True, BuildSample('BUILD_GENERAL1_SMALL', 300, 0.2, True))
+    record = registry.begin('feature-2', DESTROYING, EVENT_TIME + 120)
+
+    assert [s.compute_type for s in registry.sizing_history(record, DESTROYING)] == ['BUILD_GENERAL1_SMALL']
+    aggregate = registry.get(branch_registry.AGGREGATE_BRANCH)
+    assert [s.compute_type for s in registry.build_history(aggregate, CREATING)] == \
+        ['BUILD_GENERAL1_LARGE', 'BUILD_GENERAL1_SMALL']
+
+
+def test_superseded_finish_records_no_sample(registry):
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.begin('feature-1', DESTROYING, EVENT_TIME + 60)
+
+    registry.finish('feature-1', EVENT_TIME, True, BuildSample('BUILD_GENERAL1_SMALL', 300, 0.2, True))
+
+    assert registry.get(branch_registry.AGGREGATE_BRANCH) is None
+
+
+def test_check_command_fails_for_a_superseded_event(tmp_path, monkeypatch):
+    path = str(tmp_path / 'registry.db')
+    registry = BranchRegistry(SQLiteBackend(path))
+    registry.begin('feature-1', CREATING, EVENT_TIME)
+    registry.begin('feature-1', CREATING, EVENT_TIME + 5)
+
+    def check(event_time):
+        monkeypatch.setattr('sys.argv', ['branch_registry.py', '--sqlite', path, 'check', '--branch', 'feature-1',
+                                         '--event-time', str(event_time)])
+        branch_registry.main()
+
+    check(EVENT_TIME + 5)
+    with pytest.raises(SystemExit) as exit_info:
+        check(EVENT_TIME)
+    assert exit_info.value.code == 1
@@ -0,0 +1,99 @@
+import configparser
+
+import pytest
+
+from compute_sizing import BuildSample, SizingPolicy, estimated_duration, estimated_memory_ratio
+
+SMALL = 'BUILD_GENERAL1_SMALL'
+MEDIUM = 'BUILD_GENERAL1_MEDIUM'
+LARGE = 'BUILD_GENERAL1_LARGE'
+
+
+def sample(compute_type=SMALL, minutes=5.0, memory_ratio=0.3, succeeded=True):
+    return BuildSample(compute_type, minutes * 60, memory_ratio, succeeded)
+
+
+def adaptive(**kwargs):
+    return SizingPolicy(mode='adaptive', **kwargs)
+
+
+def test_estimates_scale_with_the_compute_type():
+    # half of the build time gets faster with twice the vCPUs
+    assert estimated_duration(600, SMALL, MEDIUM) == pytest.approx(450)
+    # and the scaled part takes twice as long with half of them
+    assert estimated_duration(450, MEDIUM, SMALL) == pytest.approx(675)
+    assert estimated_memory_ratio(0.7, SMALL, MEDIUM) == pytest.approx(0.3)
+
+
+def test_fixed_mode_ignores_the_history():
+    decision = SizingPolicy(default_compute_type=MEDIUM).choose([sample(minutes=60)])
+
+    assert decision.compute_type == MEDIUM
+
+
+def test_no_history_uses_the_default():
+    assert adaptive().choose([]).compute_type == SMALL
+
+
+def test_fits_compares_the_median_duration_and_the_peak_memory():
+    policy = adaptive(target_minutes=15, max_memory_percent=80)
+    samples = [sample(minutes=10), sample(minutes=12), sample(minutes=40)]
+
+    assert policy.fits(samples, SMALL)
+    assert not policy.fits(samples + [sample(memory_ratio=0.9)], SMALL)
+    assert policy.fits(samples + [sample(memory_ratio=0.9)], MEDIUM)
+
+
+def test_smallest_compute_type_meeting_the_targets():
+    policy = adaptive(target_minutes=15)
+
+    assert policy.choose([sample(minutes=10)] * 3).compute_type == SMALL
+    # 20 minutes on SMALL are expected to take 15 on MEDIUM
+    assert policy.choose([sample(minutes=20)] * 3).compute_type == MEDIUM
+    assert policy.choose([sample(minutes=25)] * 3).compute_type == LARGE
+
+
+def test_largest_allowed_compute_type_if_none_meets_the_targets():
+    decision = adaptive(target_minutes=15, max_compute_type=MEDIUM).choose([sample(minutes=60)])
+
+    assert decision.compute_type == MEDIUM
+    assert 'largest allowed' in decision.reason
+
+
+def test_build_failed_at_high_memory_steps_up():
+    history = [sample(minutes=5), sample(minutes=2, memory_ratio=0.95, succeeded=False)]
+
+    assert adaptive().choose(history).compute_type == MEDIUM
+    assert adaptive(max_compute_type=SMALL).choose(history).compute_type == SMALL
+
+
+def test_failed_builds_without_memory_pressure_keep_the_compute_type():
+    history = [sample(compute_type=MEDIUM, succeeded=False)] * 2
+
+    assert adaptive().choose(history).compute_type == MEDIUM
+
+
+def test_only_the_recent_samples_count():
+    history = [sample(minutes=60)] * 10 + [sample(minutes=5)] * 5
+
+    assert adaptive().choose(history).compute_type == SMALL
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(ValueError):
+        SizingPolicy(mode='guess')
+    with pytest.raises(ValueError):
+        SizingPolicy(max_compute_type='BUILD_GENERAL1_2XLARGE')
+
+
+def test_settings_round_trip_through_the_environment(monkeypatch):
+    global_config = configparser.ConfigParser()
+    global_config.read_string('[compute_sizing]\nmode=adaptive\nmax_compute_type=BUILD_GENERAL1_MEDIUM\n'
+                              'target_minutes=10\n')
+    policy = SizingPolicy.from_config(global_config)
+    for name, value in policy.to_env().items():
+        monkeypatch.setenv(name, value)
+
+    restored = SizingPolicy.from_env()
+
+    assert (restored.mode, restored.max_compute_type, restored.target_minutes) == ('adaptive', MEDIUM, 10)
@@ -0,0 +1,54 @@
+import importlib
+import sys
+
+import pytest
+
+from branch_registry import DESTROYING, BranchRegistry, InMemoryBackend
+
+EVENT_TIME = 1_700_000_000
+LAMBDA_ENV = {
+    'AWS_REGION': 'eu-west-1',
+    'CODE_BUILD_ROLE_ARN': 'arn:aws:iam::111111111111:role/CodeBuild',
+    'ACCOUNT_ID': '111111111111',
+    'ARTIFACT_BUCKET': 'artifacts',
+    'CODEBUILD_NAME_PREFIX': 'codebuild',
+    'DEFAULT_BRANCH': 'main',
+    'DEV_STAGE_NAME': 'DEV',
+}
+
+
+@pytest.fixture
+def destroy_branch(monkeypatch):
+    for name, value in LAMBDA_ENV.items():
+        monkeypatch.setenv(name, value)
+    for name in ('DESTROY_PROJECT_NAME', 'FEATURE_PIPELINE_NAME', 'REGISTRY_TABLE'):
+        monkeypatch.delenv(name, raising=False)
+    sys.modules.pop('destroy_branch', None)
+    module = importlib.import_module('destroy_branch')
+    monkeypatch.setattr(module, 'registry', BranchRegistry(InMemoryBackend()))
+    deleted = []
+    monkeypatch.setattr(module, 'delete_projects', lambda branch, metrics: deleted.append(branch))
+    module.deleted = deleted
+    yield module
+    sys.modules.pop('destroy_branch', None)
+
+
+def delete_event(branch: str) -> dict:
+    return {'time': '2023-11-14T22:13:20Z', 'detail': {'referenceType': 'branch', 'referenceName': branch}}
+
+
+def test_redelivery_keeps_the_projects_while_the_first_delivery_holds_the_lease(destroy_branch):
+    destroy_branch.registry.begin('feature-1', DESTROYING, EVENT_TIME)
+
+    destroy_branch.destroy_branch(delete_event('feature-1'))
+
+    assert destroy_branch.deleted == []
+
+
+def test_redelivery_deletes_the_projects_once_the_teardown_build_started(destroy_branch):
+    destroy_branch.registry.begin('feature-1', DESTROYING, EVENT_TIME)
+    destroy_branch.registry.set_build('feature-1', EVENT_TIME, 'codebuild-feature-1-destroy:1')
+
+    destroy_branch.destroy_branch(delete_event('feature-1'))
+
+    assert destroy_branch.deleted == ['feature-1']
@@ -0,0 +1,37 @@
+from feature_pipeline import DEPLOY, DESTROY, SOURCE_ACTION_NAME, start_execution
+
+
+class StubCodePipeline:
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def start_pipeline_execution(self, **kwargs):
+        self.calls.append(kwargs)
+        return {'pipelineExecutionId': f'execution-{len(self.calls)}'}
+
+
+def test_execution_variables():
+    client = StubCodePipeline()
+
+    execution_id = start_execution(client, 'FeaturePipeline', 'feature-1', DESTROY, 1_700_000_000)
+
+    assert execution_id == 'execution-1'
+    assert client.calls == [{
+        'name': 'FeaturePipeline',
+        'variables': [
+            {'name': 'BRANCH', 'value': 'feature-1'},
+            {'name': 'ACTION', 'value': DESTROY},
+            {'name': 'EVENT_TIME', 'value': '1700000000'}
+        ]
+    }]
+
+
+def test_commit_is_the_source_revision():
+    client = StubCodePipeline()
+
+    start_execution(client, 'FeaturePipeline', 'feature-1', DEPLOY, 1_700_000_000, commit_id='abc123')
+
+    assert client.calls[0]['sourceRevisions'] == [
+        {'actionName': SOURCE_ACTION_NAME, 'revisionType': 'COMMIT_ID', 'revisionValue': 'abc123'}
+    ]
@@ -0,0 +1,157 @@
+import configparser
+import sys
+import types
+
+import pytest
+
+from cdk_pipelines_multi_branch.cicd import initial_deploy
+from cdk_pipelines_multi_branch.cicd.initial_deploy import parse_arguments, required_version, target_matrix
+
+DEV = '111111111111'
+PROD = '222222222222'
+WAVE = '333333333333'
+
+# excerpt of `cdk bootstrap --show-template`
+SHOW_TEMPLATE = """\
+Description: This stack includes resources needed to deploy AWS CDK apps into this environment
+Parameters:
+  TrustedAccounts:
+    Description: List of AWS accounts that are trusted to publish assets and deploy stacks to this environment
+    Default: ""
+    Type: CommaDelimitedList
+Resources:
+  StagingBucket:
+    Type: AWS::S3::Bucket
+    Properties:
+      VersioningConfiguration:
+        Status: Enabled
+      Tags:
+        - Key: aws-cdk:bootstrap-role
+          Value: "12"
+  CdkBootstrapVersion:
+    Type: AWS::SSM::Parameter
+    Properties:
+      Type: String
+      Name:
+        Fn::Sub: /cdk-bootstrap/${Qualifier}/version
+      Value: "21"
+Outputs:
+  BootstrapVersion:
+    Description: The version of the bootstrap resources that are currently mastered in this stack
+    Value:
+      Fn::GetAtt:
+        - CdkBootstrapVersion
+        - Value
+"""
+
+
+def config(**sections) -> configparser.ConfigParser:
+    global_config = configparser.ConfigParser()
+    global_config.read_dict({'general': {'region': 'eu-west-1'}, **sections})
+    return global_config
+
+
+def test_required_version_of_the_bootstrap_template():
+    assert required_version(SHOW_TEMPLATE) == 21
+
+
+def test_template_without_bootstrap_version():
+    with pytest.raises(ValueError):
+        required_version('Resources: {}\n')
+
+
+def test_dev_and_prod_targets():
+    targets = target_matrix(config(), DEV, PROD, {DEV: 'dev', PROD: 'prod'})
+
+    assert [(repr(t), t.profile, t.trust) for t in targets] == [
+        (f'{DEV}/eu-west-1', 'dev', None),
+        (f'{PROD}/eu-west-1', 'prod', DEV),
+    ]
+    assert '--trust' not in targets[0].command()
+    assert targets[1].command()[-1] == f'aws://{PROD}/eu-west-1'
+
+
+def test_wave_and_extra_targets_are_deduplicated_and_trust_the_dev_account():
+    global_config = config(
+        waves={'names': 'eu,us'},
+        **{'wave.eu': {'targets': '${PROD_ACCOUNT_ID}/eu-west-1'},
+           'wave.us': {'targets': f'{WAVE}/us-east-1'},
+           'bootstrap': {'targets': f'{WAVE}/us-east-1, {DEV}/eu-west-1'}})
+
+    targets = target_matrix(global_config, DEV, PROD, {DEV: 'dev', PROD: 'prod'})
+
+    assert [repr(t) for t in targets] == [
+        f'{DEV}/eu-west-1', f'{PROD}/eu-west-1', f'{DEV}/us-east-1', f'{WAVE}/us-east-1'
+    ]
+    assert [t.trust for t in targets] == [None, DEV, DEV, DEV]
+    # accounts without a --profile_<account id> use the production profile
+    assert [t.profile for t in targets] == ['dev', 'prod', 'dev', 'prod']
+
+
+def test_profile_of_another_account():
+    global_config = config(bootstrap={'targets': f'{WAVE}/us-east-1'})
+
+    targets = target_matrix(global_config, DEV, PROD, {DEV: 'dev', PROD: 'prod', WAVE: 'wave'})
+
+    assert targets[-1].profile == 'wave'
+
+
+def test_arguments_and_account_profiles():
+    args, profiles = parse_arguments([
+        '--dev_account_id', DEV, '--dev_profile_name', 'dev', '--prod_account_id', PROD,
+        '--prod_profile_name', 'prod', f'--profile_{WAVE}', 'wave', '--dry-run'])
+
+    assert args.dry_run
+    assert profiles == {WAVE: 'wave', DEV: 'dev', PROD: 'prod'}
+
+
+def test_missing_arguments_are_reported(capsys):
+    with pytest.raises(SystemExit):
+        parse_arguments(['--dev_account_id', DEV, '--dev_profile_name', 'dev'])
+
+    assert '--prod_account_id, --prod_profile_name' in capsys.readouterr().err
+
+
+def test_profile_option_needs_a_value(capsys):
+    with pytest.raises(SystemExit):
+        parse_arguments(['--dev_account_id', DEV, '--dev_profile_name', 'dev', '--prod_account_id', PROD,
+                         '--prod_profile_name', 'prod', f'--profile_{WAVE}'])
+
+    assert f'unrecognized argument: --profile_{WAVE}' in capsys.readouterr().err
+
+
+class ClientError(Exception):
+
+    def __init__(self, code: str, message: str) -> None:
+        super().__init__(message)
+        self.response = {'Error': {'Code': code, 'Message': message}}
+
+
+def describe_stacks_raising(monkeypatch, error: Exception) -> None:
+    class CloudFormation:
+        def describe_stacks(self, StackName):
+            raise error
+
+    class Session:
+        def __init__(self, profile_name):
+            pass
+
+        def client(self, service_name, region_name):
+            return CloudFormation()
+
+    monkeypatch.setitem(sys.modules, 'boto3', types.SimpleNamespace(Session=Session))
+
+
+def test_missing_toolkit_stack(monkeypatch):
+    describe_stacks_raising(monkeypatch, ClientError('ValidationError', 'Stack with id CDKToolkit does not exist'))
+    target = target_matrix(config(), DEV, PROD, {DEV: 'dev', PROD: 'prod'})[0]
+
+    assert initial_deploy.toolkit_stack(target) is None
+
+
+def test_other_errors_of_the_toolkit_stack_are_raised(monkeypatch):
+    describe_stacks_raising(monkeypatch, ClientError('AccessDenied', 'Role dev does not exist'))
+    target = target_matrix(config(), DEV, PROD, {DEV: 'dev', PROD: 'prod'})[0]
+
+    with pytest.raises(ClientError):
+        initial_deploy.toolkit_stack(target)
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from cdk_pipelines_multi_branch.cicd.lambda_package import local_imports, package_excludes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def code_dir(tmp_path):
+    modules = {
+        'handler': 'import json\nimport shared\nfrom helpers import helper\n',
+        'shared': 'import os\nfrom helpers import helper\n',
+        # cycles end the traversal
+        'helpers': 'import shared\n\n\ndef helper():\n    pass\n',
+        'other': 'import json\n',
+        'script': 'from . import other\n',
+    }
+    for name, source in modules.items():
+        (tmp_path / f'{name}.py').write_text(source)
+    (tmp_path / '__pycache__').mkdir()
+    (tmp_path / 'README.txt').write_text('not a module')
+    return str(tmp_path)
+
+
+def test_local_imports_are_followed_transitively(code_dir):
+    assert local_imports(code_dir, 'handler') == {'handler', 'shared', 'helpers'}
+    assert local_imports(code_dir, 'other') == {'other'}
+
+
+def test_relative_imports_are_not_followed(code_dir):
+    assert local_imports(code_dir, 'script') == {'script'}
+
+
+def test_package_excludes_the_modules_not_imported(code_dir):
+    assert package_excludes(code_dir, 'handler') == ['__pycache__', '*.pyc', 'README.txt', 'other.py', 'script.py']
+
+
+def test_handlers_of_the_branch_functions():
+    code_dir = os.path.join(ROOT, 'cdk_pipelines_multi_branch', 'cicd', 'code')
+
+    assert 'purge_artifacts' not in local_imports(code_dir, 'create_branch')
+    assert 'pipeline_trigger' not in local_imports(code_dir, 'destroy_branch')
+    assert 'purge_artifacts.py' in package_excludes(code_dir, 'pipeline_trigger')
@@ -0,0 +1,72 @@
+import pytest
+
+from path_filter import PathFilter, evaluate, parse_patterns
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    ('cdk_pipelines_multi_branch/**', 'cdk_pipelines_multi_branch/src/lambda/handler.py', True),
+    ('cdk_pipelines_multi_branch/**', 'docs/cdk_pipelines_multi_branch/index.md', False),
+    ('**/*.md', 'README.md', True),
+    ('**/*.md', 'docs/guide/setup.md', True),
+    ('src/**/*.py', 'src/app.py', True),
+    ('src/**/*.py', 'src/a/b/app.py', True),
+    ('src/*.py', 'src/a/app.py', False),
+    ('README.md', 'docs/README.md', True),
+    ('/README.md', 'README.md', True),
+    ('/README.md', 'docs/README.md', False),
+    ('file?.txt', 'file1.txt', True),
+    ('file?.txt', 'file10.txt', False),
+])
+def test_include_patterns(pattern, path, expected):
+    assert PathFilter(include=[pattern]).matches(path) is expected
+
+
+def test_everything_is_included_without_include_patterns():
+    assert PathFilter().matches('any/file.txt')
+    assert not PathFilter(exclude=['**/*.md']).matches('docs/guide.md')
+
+
+def test_exclude_takes_priority_over_include():
+    path_filter = PathFilter(include=['cdk_pipelines_multi_branch/**'], exclude=['**/*.md'])
+
+    assert path_filter.matches('cdk_pipelines_multi_branch/app.py')
+    assert not path_filter.matches('cdk_pipelines_multi_branch/README.md')
+
+
+def test_leading_slash_of_the_path_is_ignored():
+    assert PathFilter(include=['/src/**']).matches('/src/app.py')
+
+
+def test_parse_patterns():
+    assert parse_patterns('a/**, *.md\n/README.md,,') == ['a/**', '*.md', '/README.md']
+    assert parse_patterns('') == []
+    assert parse_patterns(None) == []
+
+
+def test_unknown_changes_trigger():
+    decision = evaluate(None, PathFilter(include=['src/**']))
+
+    assert decision.trigger
+    assert decision.reason == 'changed files unknown'
+
+
+def test_no_changed_files_do_not_trigger():
+    decision = evaluate([], PathFilter(include=['src/**']))
+
+    assert not decision.trigger
+    assert decision.matched_file is None
+
+
+def test_evaluation_stops_at_the_first_relevant_file():
+    consumed = []
+
+    def changed_files():
+        for path in ('README.md', 'src/app.py', 'src/other.py'):
+            consumed.append(path)
+            yield path
+
+    decision = evaluate(changed_files(), PathFilter(include=['src/**']))
+
+    assert decision.trigger
+    assert decision.matched_file == 'src/app.py'
+    assert consumed == ['README.md', 'src/app.py']
@@ -0,0 +1,79 @@
+import importlib
+import sys
+
+import pytest
+
+from branch_registry import CREATING, READY, BranchRegistry, InMemoryBackend
+
+EVENT_TIME = 1_700_000_000
+
+
+class StubCodePipeline:
+
+    def __init__(self, error: Exception = None) -> None:
+        self.error = error
+        self.calls = []
+
+    def start_pipeline_execution(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return {'pipelineExecutionId': 'execution-1'}
+
+
+@pytest.fixture
+def pipeline_trigger(monkeypatch):
+    monkeypatch.setenv('DEFAULT_BRANCH', 'main')
+    monkeypatch.setenv('FEATURE_PIPELINE_NAME', 'FeaturePipeline')
+    monkeypatch.delenv('REGISTRY_TABLE', raising=False)
+    sys.modules.pop('pipeline_trigger', None)
+    module = importlib.import_module('pipeline_trigger')
+    monkeypatch.setattr(module, 'registry', BranchRegistry(InMemoryBackend()))
+    monkeypatch.setattr(module, 'codepipeline', StubCodePipeline())
+    yield module
+    sys.modules.pop('pipeline_trigger', None)
+
+
+def test_commit_deploy_is_registered(pipeline_trigger):
+    result = pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')
+
+    assert result == {'triggered': True, 'reason': 'files changed'}
+    assert pipeline_trigger.codepipeline.calls[0]['sourceRevisions'][0]['revisionValue'] == 'abc123'
+    record = pipeline_trigger.registry.get('feature-1')
+    assert record['state'] == CREATING
+    assert record['event_time'] == EVENT_TIME
+    assert record['build_id'] == 'execution-1'
+
+
+def test_duplicate_and_outdated_commits_are_skipped(pipeline_trigger):
+    pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')
+
+    duplicate = pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')
+    outdated = pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME - 10, 'abc000', 'files changed')
+
+    assert duplicate == outdated == {'triggered': False, 'reason': 'duplicate or outdated commit event'}
+    assert len(pipeline_trigger.codepipeline.calls) == 1
+
+
+def test_failed_start_releases_the_lease(pipeline_trigger, monkeypatch):
+    monkeypatch.setattr(pipeline_trigger, 'codepipeline', StubCodePipeline(RuntimeError('throttled')))
+
+    with pytest.raises(RuntimeError):
+        pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')
+
+    assert pipeline_trigger.registry.get('feature-1')['lease_expires'] == 0
+    # the retry of the event starts the execution
+    monkeypatch.setattr(pipeline_trigger, 'codepipeline', StubCodePipeline())
+    assert pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')['triggered']
+
+
+def test_older_execution_is_superseded_by_a_newer_commit(pipeline_trigger):
+    registry = pipeline_trigger.registry
+    pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME, 'abc123', 'files changed')
+    pipeline_trigger.start_commit_deploy('feature-1', EVENT_TIME + 5, 'def456', 'files changed')
+
+    # the build of the older execution skips its deploy, its finish does not change the record
+    assert not registry.is_current('feature-1', EVENT_TIME)
+    assert registry.finish('feature-1', EVENT_TIME, True) is None
+    assert registry.is_current('feature-1', EVENT_TIME + 5)
+    assert registry.finish('feature-1', EVENT_TIME + 5, True)['state'] == READY
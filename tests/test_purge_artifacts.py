@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+from purge_artifacts import DELETE_BATCH_SIZE, purge_prefix
+
+
+class StubPaginator:
+
+    def __init__(self, pages: list) -> None:
+        self.pages = pages
+        self.calls = []
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        yield from self.pages
+
+
+class StubS3:
+    """Versioned bucket listing in pages of page_size entries, the keys in failing are not deleted"""
+
+    def __init__(self, versions: int, delete_markers: int = 0, page_size: int = 1000, failing=()) -> None:
+        entries = [('Versions', f'main/file-{i}', f'v{i}') for i in range(versions)]
+        entries += [('DeleteMarkers', f'main/deleted-{i}', f'm{i}') for i in range(delete_markers)]
+        self.objects = {(key, version_id) for _, key, version_id in entries}
+        self.pages = []
+        for start in range(0, len(entries), page_size):
+            page = {}
+            for kind, key, version_id in entries[start:start + page_size]:
+                page.setdefault(kind, []).append({'Key': key, 'VersionId': version_id})
+            self.pages.append(page)
+        self.failing = set(failing)
+        self.paginator = StubPaginator(self.pages)
+        self.delete_calls = []
+        self._lock = threading.Lock()
+
+    def get_paginator(self, operation: str):
+        assert operation == 'list_object_versions'
+        return self.paginator
+
+    def delete_objects(self, Bucket: str, Delete: dict):
+        errors = []
+        with self._lock:
+            self.delete_calls.append(Delete['Objects'])
+            for item in Delete['Objects']:
+                if item['Key'] in self.failing:
+                    errors.append(dict(item, Code='AccessDenied', Message='Access Denied'))
+                else:
+                    self.objects.discard((item['Key'], item['VersionId']))
+        return {'Errors': errors} if errors else {}
+
+
+def test_purges_versions_and_delete_markers_of_all_pages():
+    s3 = StubS3(versions=1500, delete_markers=700, page_size=1000)
+
+    result = purge_prefix(s3, 'bucket', 'main/', max_workers=2)
+
+    assert len(s3.pages) == 3
+    assert s3.paginator.calls == [{'Bucket': 'bucket', 'Prefix': 'main/'}]
+    assert (result.listed, result.deleted, result.errors) == (2200, 2200, [])
+    assert not s3.objects
+
+
+def test_deletes_in_batches_of_at_most_1000_keys():
+    s3 = StubS3(versions=2500, page_size=300)
+
+    purge_prefix(s3, 'bucket', 'main/')
+
+    sizes = sorted((len(objects) for objects in s3.delete_calls), reverse=True)
+    assert sizes == [DELETE_BATCH_SIZE, DELETE_BATCH_SIZE, 500]
+
+
+def test_collects_the_partial_errors_of_delete_objects():
+    s3 = StubS3(versions=1200, failing={'main/file-3', 'main/file-1100'})
+
+    result = purge_prefix(s3, 'bucket', 'main/')
+
+    assert result.listed == 1200
+    assert result.deleted == 1198
+    assert sorted(error['Key'] for error in result.errors) == ['main/file-1100', 'main/file-3']
+    assert s3.objects == {('main/file-3', 'v3'), ('main/file-1100', 'v1100')}
+
+
+def test_dry_run_only_counts():
+    s3 = StubS3(versions=1500, delete_markers=10)
+
+    result = purge_prefix(s3, 'bucket', 'main/', dry_run=True)
+
+    assert (result.listed, result.deleted) == (1510, 0)
+    assert s3.delete_calls == []
+    assert len(s3.objects) == 1510
+
+
+def test_empty_prefix_is_refused():
+    with pytest.raises(ValueError):
+        purge_prefix(StubS3(versions=1), 'bucket', '')